@@ -0,0 +1,128 @@
+import asyncio
+import json
+from ..llm.router import client
+from ..llm.usage import agent_scope
+from ..llm.errors import RateLimitError, LLMError
+from .bloom_tagger import LEVELS as BLOOM_LEVELS
+from .solo_tagger import LEVELS as SOLO_LEVELS
+
+# Fused Assessor: Judge + SOLO-Tagger (Bloom уже есть в схеме Judge) одним вызовом
+
+SCHEMA_HINT = (
+    'Отвечай ТОЛЬКО строгим JSON со следующими ключами: '
+    '{"bloom_level": "<remember|understand|apply|analyze|evaluate|create>", '
+    '"solo_level": "<prestructural|unistructural|multistructural|relational|extended-abstract>", '
+    '"score": <0..1>, "confidence": <0..1>, "errors": ["..."], "skills": ["algebra","logic",...]}'
+)
+
+SYSTEM = (
+    "Вы — Assessor (Judge/Scorer + SOLO-Tagger). По вопросу и ответу студента оцените ответ: "
+    "уровень таксономии Блума, уровень таксономии SOLO, корректность, глубину рассуждений и обобщение. "
+    "Возвращайте только структурированный JSON."
+)
+
+
+def _level(levels: list[str]):
+    def check(v):
+        if not isinstance(v, str):
+            return None
+        v = v.strip().lower()
+        return v if v in levels else None
+
+    return check
+
+
+def _unit(v):
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        return None
+    try:
+        x = float(v)
+    except ValueError:
+        return None
+    return min(1.0, max(0.0, x))
+
+
+def _str_list(v):
+    if not isinstance(v, list):
+        return None
+    return [str(x) for x in v if isinstance(x, (str, int, float))]
+
+
+# поле -> (валидатор, значение по умолчанию)
+FIELDS = {
+    "bloom_level": (_level(BLOOM_LEVELS), "understand"),
+    "solo_level": (_level(SOLO_LEVELS), "unistructural"),
+    "score": (_unit, 0.0),
+    "confidence": (_unit, 0.0),
+    "errors": (_str_list, []),
+    "skills": (_str_list, []),
+}
+
+
+def _validate(raw: dict) -> dict:
+    """Валидирует каждое поле отдельно; отсутствующие/битые поля заменяются дефолтом."""
+    out: dict = {}
+    missing: list[str] = []
+    for name, (check, default) in FIELDS.items():
+        value = check(raw.get(name)) if name in raw else None
+        if value is None:
+            value = list(default) if isinstance(default, list) else default
+            missing.append(name)
+        out[name] = value
+    if missing:
+        out["fallback_fields"] = missing
+    return out
+
+
+def _fallback(errors: list[str]) -> dict:
+    out = _validate({})
+    out["errors"] = errors
+    return out
+
+
+def _messages(question: str, answer: str) -> list[dict]:
+    prompt = f"{SCHEMA_HINT}\nВопрос: {question}\nОтвет: {answer}\nВерни только JSON."
+    return [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}]
+
+
+def _parse(resp: str) -> dict:
+    try:
+        raw = json.loads(resp)
+    except Exception:
+        return _fallback(["parse_error"])
+    if not isinstance(raw, dict):
+        return _fallback(["parse_error"])
+    return _validate(raw)
+
+
+def assess_answer(question: str, answer: str) -> dict:
+    with agent_scope("assessor"):
+        try:
+            resp = client.chat(
+                _messages(question, answer), temperature=0.0, response_format={"type": "json_object"}
+            )
+            return _parse(resp)
+        except RateLimitError:
+            return _fallback(["llm_rate_limited"])
+        except LLMError as e:
+            return _fallback([f"llm_error:{type(e).__name__}"])
+        except Exception:
+            return _fallback(["unknown_error"])
+
+
+async def aassess_answer(question: str, answer: str, timeout: float | None = None) -> dict:
+    with agent_scope("assessor"):
+        try:
+            resp = await asyncio.wait_for(
+                client.achat(_messages(question, answer), temperature=0.0, response_format={"type": "json_object"}),
+                timeout,
+            )
+            return _parse(resp)
+        except asyncio.TimeoutError:
+            return _fallback(["llm_timeout"])
+        except RateLimitError:
+            return _fallback(["llm_rate_limited"])
+        except LLMError as e:
+            return _fallback([f"llm_error:{type(e).__name__}"])
+        except Exception:
+            return _fallback(["unknown_error"])
@@ -1,4 +1,7 @@
+import asyncio
 from ..llm.router import client
+from ..llm.cache import cache_only_if
+from ..llm.usage import agent_scope
 from ..llm.errors import RateLimitError, LLMError
 
 SYSTEM = (
@@ -9,23 +12,42 @@ SYSTEM = (
 LEVELS = ["remember", "understand", "apply", "analyze", "evaluate", "create"]
 
 
+def _messages(text: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": f"Высказывание:\n{text}\nУровень? One token (один токен)."},
+    ]
+
+
+def _level(resp: str) -> str | None:
+    resp = resp.strip().lower()
+    for k in LEVELS:
+        if k in resp:
+            return k
+    return None
+
+
+def _parse(resp: str) -> str:
+    return _level(resp) or "understand"
+
+
+def _valid(resp: str) -> bool:
+    # ответ без уровня не кэшируем: дефолт подставит _parse, а провайдер при повторе может ответить нормально
+    return _level(resp) is not None
+
+
 def tag_bloom(text: str) -> str:
-    try:
-        resp = (
-            client.chat(
-                [
-                    {"role": "system", "content": SYSTEM},
-                    {"role": "user", "content": f"Высказывание:\n{text}\nУровень? One token (один токен)."},
-                ],
-                temperature=0.0,
-            )
-            .strip()
-            .lower()
-        )
-        for k in LEVELS:
-            if k in resp:
-                return k
-        return "understand"
-    except (RateLimitError, LLMError, Exception):
-        # На rate limit или ошибках — безопасный дефолт
-        return "understand"
+    with agent_scope("bloom_tagger"), cache_only_if(_valid):
+        try:
+            return _parse(client.chat(_messages(text), temperature=0.0))
+        except (RateLimitError, LLMError, Exception):
+            # На rate limit или ошибках — безопасный дефолт
+            return "understand"
+
+
+async def atag_bloom(text: str, timeout: float | None = None) -> str:
+    with agent_scope("bloom_tagger"), cache_only_if(_valid):
+        try:
+            return _parse(await asyncio.wait_for(client.achat(_messages(text), temperature=0.0), timeout))
+        except (RateLimitError, LLMError, Exception):
+            return "understand"
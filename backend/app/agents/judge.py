@@ -1,5 +1,7 @@
+import asyncio
 import json
 from ..llm.router import client
+from ..llm.usage import agent_scope
 from ..llm.errors import RateLimitError, LLMError
 
 SCHEMA_HINT = (
@@ -24,20 +26,45 @@ def _fallback(errors: list[str]) -> dict:
     }
 
 
-def score_answer(question: str, answer: str) -> dict:
+def _messages(question: str, answer: str) -> list[dict]:
     prompt = f"{SCHEMA_HINT}\nВопрос: {question}\nОтвет: {answer}\nВерни только JSON."
+    return [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}]
+
+
+def _parse(resp: str) -> dict:
     try:
-        resp = client.chat(
-            [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}],
-            temperature=0.0,
-        )
+        raw = json.loads(resp)
+    except Exception:
+        return _fallback(["parse_error"])
+    return raw if isinstance(raw, dict) else _fallback(["parse_error"])
+
+
+def score_answer(question: str, answer: str) -> dict:
+    with agent_scope("judge"):
         try:
-            return json.loads(resp)
+            resp = client.chat(_messages(question, answer), temperature=0.0, response_format={"type": "json_object"})
+            return _parse(resp)
+        except RateLimitError:
+            return _fallback(["llm_rate_limited"])
+        except LLMError as e:
+            return _fallback([f"llm_error:{type(e).__name__}"])
         except Exception:
-            return _fallback(["parse_error"])
-    except RateLimitError:
-        return _fallback(["llm_rate_limited"])
-    except LLMError as e:
-        return _fallback([f"llm_error:{type(e).__name__}"])
-    except Exception:
-        return _fallback(["unknown_error"])
+            return _fallback(["unknown_error"])
+
+
+async def ascore_answer(question: str, answer: str, timeout: float | None = None) -> dict:
+    with agent_scope("judge"):
+        try:
+            resp = await asyncio.wait_for(
+                client.achat(_messages(question, answer), temperature=0.0, response_format={"type": "json_object"}),
+                timeout,
+            )
+            return _parse(resp)
+        except asyncio.TimeoutError:
+            return _fallback(["llm_timeout"])
+        except RateLimitError:
+            return _fallback(["llm_rate_limited"])
+        except LLMError as e:
+            return _fallback([f"llm_error:{type(e).__name__}"])
+        except Exception:
+            return _fallback(["unknown_error"])
@@ -1,4 +1,7 @@
+import asyncio
 from ..llm.router import client
+from ..llm.cache import cache_only_if
+from ..llm.usage import agent_scope
 from ..llm.errors import RateLimitError, LLMError
 
 SYSTEM = (
@@ -9,22 +12,40 @@ SYSTEM = (
 LEVELS = ["prestructural", "unistructural", "multistructural", "relational", "extended-abstract"]
 
 
+def _messages(text: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": f"Ответ:\n{text}\nУровень? ONE TOKEN (один токен)."},
+    ]
+
+
+def _level(resp: str) -> str | None:
+    resp = resp.strip().lower()
+    for k in LEVELS:
+        if k in resp:
+            return k
+    return None
+
+
+def _parse(resp: str) -> str:
+    return _level(resp) or "unistructural"
+
+
+def _valid(resp: str) -> bool:
+    return _level(resp) is not None
+
+
 def tag_solo(text: str) -> str:
-    try:
-        resp = (
-            client.chat(
-                [
-                    {"role": "system", "content": SYSTEM},
-                    {"role": "user", "content": f"Ответ:\n{text}\nУровень? ONE TOKEN (один токен)."},
-                ],
-                temperature=0.0,
-            )
-            .strip()
-            .lower()
-        )
-        for k in LEVELS:
-            if k in resp:
-                return k
-        return "unistructural"
-    except (RateLimitError, LLMError, Exception):
-        return "unistructural"
+    with agent_scope("solo_tagger"), cache_only_if(_valid):
+        try:
+            return _parse(client.chat(_messages(text), temperature=0.0))
+        except (RateLimitError, LLMError, Exception):
+            return "unistructural"
+
+
+async def atag_solo(text: str, timeout: float | None = None) -> str:
+    with agent_scope("solo_tagger"), cache_only_if(_valid):
+        try:
+            return _parse(await asyncio.wait_for(client.achat(_messages(text), temperature=0.0), timeout))
+        except (RateLimitError, LLMError, Exception):
+            return "unistructural"
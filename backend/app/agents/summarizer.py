@@ -1,16 +1,35 @@
 from ..llm.router import client
+from ..llm.usage import agent_scope
+
+# Сколько последних сообщений истории попадает в промпт
+HISTORY_WINDOW = 12
 
 SYSTEM = "Вы — лаконичный Summarizer/Advisor. Сформируйте короткие, прикладные рекомендации по навыкам с привязкой к уровням Блума."
 
 
-def recommendations(topic: str, history: list[dict], skills: dict[str, float]) -> str:
-    hist_str = "\n".join([f"{m['role']}: {m['content']}" for m in history[-12:]])
+def _messages(topic: str, history: list[dict], skills: dict[str, float]) -> list[dict]:
+    hist_str = "\n".join([f"{m['role']}: {m['content']}" for m in history[-HISTORY_WINDOW:]])
     skills_str = "\n".join([f"- {k}: {v:.2f}" for k, v in skills.items()])
     prompt = (
         f"Тема: {topic}\nНедавние ходы:\n{hist_str}\n"
         f"EMA навыков:\n{skills_str}\nДайте 5 кратких, практичных рекомендаций списком."
     )
-    return client.chat(
-        [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}],
-        temperature=0.3,
-    )
+    return [{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}]
+
+
+def fallback_recommendations(skills: dict[str, float]) -> str:
+    """Шаблонные рекомендации на случай недоступности провайдера: сначала самые слабые навыки."""
+    weak = sorted(skills.items(), key=lambda kv: kv[1])[:3]
+    lines = [f"{i}. Повторите навык «{k}» (текущий EMA {v:.2f}) и решите 2–3 задачи на него." for i, (k, v) in enumerate(weak, 1)]
+    lines.append(f"{len(lines) + 1}. Разберите ошибки в ответах этого экзамена и сформулируйте, где было неточно.")
+    return "\n".join(lines)
+
+
+def recommendations(topic: str, history: list[dict], skills: dict[str, float]) -> str:
+    with agent_scope("summarizer"):
+        return client.chat(_messages(topic, history, skills), temperature=0.3)
+
+
+async def arecommendations(topic: str, history: list[dict], skills: dict[str, float]) -> str:
+    with agent_scope("summarizer"):
+        return await client.achat(_messages(topic, history, skills), temperature=0.3)
@@ -1,6 +1,7 @@
+from typing import AsyncIterator
 from ..llm.router import client
-from ..llm.errors import RateLimitError, LLMError
-from ..rag.vectorstore import query
+from ..llm.usage import agent_scope
+from ..rag.vectorstore import query, aquery
 
 SYSTEM = (
     "Вы — Tutor-LLM. Сгенерируйте один следующий вопрос или задание. "
@@ -27,29 +28,85 @@ def _fallback_question(topic: str, target_bloom: str, difficulty: str) -> str:
     tail = topic_prompts.get(topic, "по текущей теме.")
     return f"{stem}{tail} Сложность: {difficulty}."
 
-def generate_question(
-    topic: str, target_bloom: str, difficulty: str, last_answer: str, n_docs: int = 4
-) -> str:
-    # Подготовим контекст через RAG (безопасно к падениям)
-    try:
-        hits = query(last_answer or topic, n=n_docs, topic=topic)
-        context = "\n\n".join([f"[DOC {i+1}] {h['text']}" for i, h in enumerate(hits)])
-    except Exception:
-        hits = []
-        context = ""
-
-    messages = [
+def _messages(
+    topic: str, target_bloom: str, difficulty: str, last_answer: str, context: str, previous_question: str = ""
+) -> list[dict]:
+    prev = f"Предыдущий вопрос (не повторяй его):\n{previous_question}\n" if previous_question else ""
+    return [
         {"role": "system", "content": SYSTEM},
         {
             "role": "user",
             "content": (
                 f"Тема: {topic}\nЦелевой уровень Блума: {target_bloom}\nСложность: {difficulty}\n"
-                f"Контекст:\n{context}\nПоследний ответ студента:\n{last_answer}\nСформулируй следующий вопрос."
+                f"Контекст:\n{context}\n{prev}Последний ответ студента:\n{last_answer}\nСформулируй следующий вопрос."
             ),
         },
     ]
-    try:
-        return client.chat(messages, temperature=0.4)
-    except (RateLimitError, LLMError, Exception):
-        # На ошибках — синтетический безопасный вопрос
-        return _fallback_question(topic, target_bloom, difficulty)
+
+
+def _context(hits: list[dict]) -> str:
+    return "\n\n".join([f"[DOC {i+1}] {h['text']}" for i, h in enumerate(hits)])
+
+
+def generate_question(
+    topic: str, target_bloom: str, difficulty: str, last_answer: str, n_docs: int = 4
+) -> str:
+    # Подготовим контекст через RAG (безопасно к падениям)
+    with agent_scope("tutor"):
+        try:
+            context = _context(query(last_answer or topic, n=n_docs, topic=topic))
+        except Exception:
+            context = ""
+
+        messages = _messages(topic, target_bloom, difficulty, last_answer, context)
+        try:
+            return client.chat(messages, temperature=0.4)
+        except Exception:
+            # На ошибках — синтетический безопасный вопрос
+            return _fallback_question(topic, target_bloom, difficulty)
+
+
+async def agenerate_question(
+    topic: str,
+    target_bloom: str,
+    difficulty: str,
+    last_answer: str,
+    n_docs: int = 4,
+    previous_question: str = "",
+) -> str:
+    with agent_scope("tutor"):
+        try:
+            context = _context(await aquery(last_answer or previous_question or topic, n=n_docs, topic=topic))
+        except Exception:
+            context = ""
+
+        messages = _messages(topic, target_bloom, difficulty, last_answer, context, previous_question)
+        try:
+            return await client.achat(messages, temperature=0.4)
+        except Exception:
+            return _fallback_question(topic, target_bloom, difficulty)
+
+
+async def astream_question(
+    topic: str, target_bloom: str, difficulty: str, last_answer: str, n_docs: int = 4
+) -> AsyncIterator[str]:
+    """
+    Стриминг вопроса по токенам. Если провайдер упал до первого токена — отдаём fallback-вопрос целиком;
+    после — пробрасываем ошибку: обрезанный вопрос не должен сохраниться как заданный.
+    """
+    with agent_scope("tutor"):
+        try:
+            context = _context(await aquery(last_answer or topic, n=n_docs, topic=topic))
+        except Exception:
+            context = ""
+
+        messages = _messages(topic, target_bloom, difficulty, last_answer, context)
+        started = False
+        try:
+            async for chunk in client.astream_chat(messages, temperature=0.4):
+                started = True
+                yield chunk
+        except Exception:
+            if started:
+                raise
+            yield _fallback_question(topic, target_bloom, difficulty)
@@ -0,0 +1,90 @@
+"""
+Агрегаты сессии по ответам студента: сумма/число score, гистограммы Bloom и SOLO, число ответов.
+Ведутся инкрементально на SessionDB в транзакции хода — метрики и экспорт читают одну строку.
+
+    python -m backend.app.aggregates  # backfill для сессий, созданных до появления агрегатов
+"""
+from collections import Counter
+from typing import Dict, List
+from sqlmodel import Session, select
+from .models import MessageDB, SessionDB
+
+
+def _inc(hist: Dict[str, int] | None, key: str) -> Dict[str, int]:
+    # новый dict: in-place изменение JSON-колонки SQLAlchemy не замечает
+    out = dict(hist or {})
+    out[key] = out.get(key, 0) + 1
+    return out
+
+
+def apply_answer(se: SessionDB, msg: MessageDB) -> None:
+    """Учитывает сообщение студента в агрегатах (коммит — вместе с ходом)."""
+    if msg.role != "user":
+        return
+    se.answers_count = (se.answers_count or 0) + 1
+    if msg.score is not None:
+        se.score_sum = (se.score_sum or 0.0) + msg.score
+        se.score_count = (se.score_count or 0) + 1
+    if msg.bloom_level:
+        se.bloom_counts = _inc(se.bloom_counts, msg.bloom_level)
+    if msg.solo_level:
+        se.solo_counts = _inc(se.solo_counts, msg.solo_level)
+
+
+def avg_score(se: SessionDB) -> float | None:
+    return (se.score_sum / se.score_count) if se.score_count else None
+
+
+def metrics(se: SessionDB) -> Dict:
+    return {
+        "avg_score": avg_score(se),
+        "bloom_counts": dict(se.bloom_counts or {}),
+        "solo_counts": dict(se.solo_counts or {}),
+        "turns": se.answers_count or 0,
+    }
+
+
+def needs_backfill(se: SessionDB) -> bool:
+    return se.score_count is None
+
+
+def backfill_session(s: Session, se: SessionDB) -> None:
+    """Пересчёт агрегатов по всем сообщениям сессии (без коммита)."""
+    answers: List[MessageDB] = s.exec(
+        select(MessageDB).where(MessageDB.session_id == se.id, MessageDB.role == "user")
+    ).all()
+    scores = [m.score for m in answers if m.score is not None]
+    se.score_sum = float(sum(scores))
+    se.score_count = len(scores)
+    se.answers_count = len(answers)
+    se.bloom_counts = dict(Counter(m.bloom_level for m in answers if m.bloom_level))
+    se.solo_counts = dict(Counter(m.solo_level for m in answers if m.solo_level))
+    s.add(se)
+
+
+def ensure_aggregates(s: Session, se: SessionDB) -> None:
+    """Старую сессию, до которой не дошёл backfill, досчитываем при первом чтении."""
+    if needs_backfill(se):
+        backfill_session(s, se)
+        s.commit()
+
+
+def backfill(batch_size: int = 200) -> int:
+    """Досчитывает агрегаты всем сессиям с score_count IS NULL; коммит — пачками."""
+    from .db import engine, init_db
+
+    init_db()
+    done = 0
+    with Session(engine) as s:
+        while True:
+            batch = s.exec(select(SessionDB).where(SessionDB.score_count.is_(None)).limit(batch_size)).all()
+            if not batch:
+                return done
+            for se in batch:
+                backfill_session(s, se)
+            s.commit()
+            done += len(batch)
+
+
+if __name__ == "__main__":
+    print(f"backfilled sessions: {backfill()}")
@@ -1,29 +1,350 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+from sqlalchemy import bindparam, func, update
 from sqlmodel import Session, select
-from .models import SkillScoreDB
-from math import exp
-
-def _get_skill(s: Session, session_id: str, skill: str) -> SkillScoreDB:
-    row = s.exec(select(SkillScoreDB).where(SkillScoreDB.session_id==session_id, SkillScoreDB.skill==skill)).first()
-    if row: return row
-    row = SkillScoreDB(session_id=session_id, skill=skill, ema_score=0.5, ema_alpha=0.3, irt_theta=0.0)
-    s.add(row); s.commit(); s.refresh(row)
-    return row
-
-def update_ema(s: Session, session_id: str, skill: str, score: float, alpha: float = 0.3):
-    row = _get_skill(s, session_id, skill)
-    row.ema_alpha = alpha
-    row.ema_score = alpha*score + (1-alpha)*row.ema_score
-    s.add(row); s.commit()
-
-def irt_update_2pl(s: Session, session_id: str, skill: str, score: float, a: float = 1.0, b: float = 0.0, lr: float = 0.1):
-    """One-step gradient ascent on theta for 2PL: P=1/(1+exp(-a(theta-b)))."""
-    row = _get_skill(s, session_id, skill)
-    theta = row.irt_theta
-    p = 1/(1+exp(-a*(theta-b)))
+from .db import insert_for
+from .models import MessageDB, SessionDB, SkillScoreDB, uuid_str
+from .calibration import item_params
+
+SKILL_DEFAULT = {"ema": 0.5, "theta": 0.0, "info": 0.0}
+# prior theta ~ N(0, 1): его точность — слагаемое информации в SE
+THETA_PRIOR_PRECISION = 1.0
+
+# skill -> {"ema", "theta", "info"}; info — накопленная информация Фишера ответов по навыку
+Vector = Dict[str, Dict[str, float]]
+# (session_id, skills, score, item_key) — один оценённый ответ; item_key — пункт калибровки (или None)
+Answer = Tuple[str, Sequence[str], float, str | None]
+
+# SQLite ограничивает число параметров запроса — IN режем на пачки
+CHUNK = 500
+
+
+def ema_step(prev, score, alpha: float = 0.3):
+    return alpha*score + (1-alpha)*prev
+
+def irt_step_2pl(theta, score, a=1.0, b=0.0, lr: float = 0.1):
+    """One-step gradient ascent on theta for 2PL: P=1/(1+exp(-a(theta-b))). Скаляры или массивы NumPy."""
+    p = 1/(1+np.exp(-a*(theta-b)))
     grad = a*(score - p)  # approximate
-    row.irt_theta = theta + lr*grad
-    s.add(row); s.commit()
+    return theta + lr*grad
+
+def fisher_info_2pl(theta, a=1.0, b=0.0):
+    """Информация Фишера пункта 2PL в theta: a^2 P (1 - P)."""
+    p = 1/(1+np.exp(-a*(theta-b)))
+    return a*a*p*(1-p)
+
+def answer_info(prev: Vector, new: Vector) -> float:
+    """
+    Информация ответа о theta сессии: среднее приращение info по его навыкам — ответ с несколькими
+    навыками учитывается один раз, а не по разу на навык.
+    """
+    if not new:
+        return 0.0
+    return sum(v["info"] - (prev.get(k) or SKILL_DEFAULT).get("info", 0.0) for k, v in new.items()) / len(new)
+
+
+def theta_se(info) -> float:
+    """Стандартная ошибка theta по накопленной информации (с учётом prior N(0, 1))."""
+    return float(1/np.sqrt(THETA_PRIOR_PRECISION + info))
+
+
+class AssessmentEngine:
+    """
+    Навыки сессии — вектор: EMA и 2PL по всем затронутым навыкам считаются операциями NumPy,
+    запись — одним bulk upsert по уникальному (session_id, skill). replay() — то же для тысяч сессий сразу.
+    """
+
+    def __init__(self, alpha: float = 0.3, a: float = 1.0, b: float = 0.0, lr: float = 0.1):
+        self.alpha, self.a, self.b, self.lr = alpha, a, b, lr
+
+    def step(
+        self, ema: np.ndarray, theta: np.ndarray, info: np.ndarray, score, a=None, b=None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        a, b — параметры пунктов из калибровки (массивы по навыкам); без них — общие self.a, self.b.
+        Информация ответа добавляется в обновлённой theta (приближение: пункты прошлых ходов не пересчитываем).
+        """
+        a = self.a if a is None else a
+        b = self.b if b is None else b
+        theta = irt_step_2pl(theta, score, a, b, self.lr)
+        return ema_step(ema, score, self.alpha), theta, info + fisher_info_2pl(theta, a, b)
+
+    def update(self, current: Vector, skills: Iterable[str], score: float, item: str | None = None) -> Vector:
+        """Новые значения навыков ответа (без БД); повтор навыка в ответе учитывается один раз."""
+        keys = list(dict.fromkeys(skills))
+        if not keys:
+            return {}
+        prev = [current.get(k) or SKILL_DEFAULT for k in keys]
+        ab = np.array([item_params.get(item, k) for k in keys], dtype=float)
+        ema, theta, info = self.step(
+            np.fromiter((p["ema"] for p in prev), float, len(keys)),
+            np.fromiter((p["theta"] for p in prev), float, len(keys)),
+            np.fromiter((p.get("info", 0.0) for p in prev), float, len(keys)),
+            score,
+            ab[:, 0],
+            ab[:, 1],
+        )
+        return {
+            k: {"ema": float(e), "theta": float(t), "info": float(i)} for k, e, t, i in zip(keys, ema, theta, info)
+        }
+
+    def load(self, s: Session, session_ids: Iterable[str]) -> Dict[str, Vector]:
+        ids = list(session_ids)
+        out: Dict[str, Vector] = {sid: {} for sid in ids}
+        for i in range(0, len(ids), CHUNK):
+            rows = s.exec(select(SkillScoreDB).where(SkillScoreDB.session_id.in_(ids[i : i + CHUNK]))).all()
+            for r in rows:
+                out[r.session_id][r.skill] = {"ema": r.ema_score, "theta": r.irt_theta, "info": r.irt_info or 0.0}
+        return out
+
+    def upsert(self, s: Session, vectors: Dict[str, Vector]) -> int:
+        """INSERT ... ON CONFLICT (session_id, skill) DO UPDATE — в транзакции s, коммит за вызывающим."""
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": uuid_str(),
+                "session_id": sid,
+                "skill": skill,
+                "ema_score": v["ema"],
+                "ema_alpha": self.alpha,
+                "irt_theta": v["theta"],
+                "irt_info": v.get("info", 0.0),
+                "last_update": now,
+            }
+            for sid, vec in vectors.items()
+            for skill, v in vec.items()
+        ]
+        if not rows:
+            return 0
+        # один скомпилированный statement + executemany: многострочный VALUES компилируется заметно дольше
+        stmt = insert_for(s)(SkillScoreDB)
+        s.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["session_id", "skill"],
+                set_={
+                    "ema_score": stmt.excluded.ema_score,
+                    "ema_alpha": stmt.excluded.ema_alpha,
+                    "irt_theta": stmt.excluded.irt_theta,
+                    "irt_info": stmt.excluded.irt_info,
+                    "last_update": stmt.excluded.last_update,
+                },
+            ),
+            rows,
+        )
+        return len(rows)
+
+    def replay(
+        self,
+        s: Session,
+        answers: Iterable[Answer],
+        from_scratch: bool = False,
+        seed: Dict[str, Vector] | None = None,
+        trail: List[Tuple[str, int, str, float, float, float]] | None = None,
+    ) -> Dict[str, Vector]:
+        """
+        Переигровка ответов по многим сессиям (порядок внутри сессии сохраняется). Ответы раскладываются
+        «волнами»: k-я волна — k-й ответ каждой сессии; волна — одна векторная операция по всем парам
+        (session, skill). from_scratch — стартовать не с сохранённых значений, а с seed[session_id]
+        (warm start из профиля пользователя) или SKILL_DEFAULT. trail — если передан, в него добавляются
+        значения после каждого ответа: (session_id, k, skill, ema, theta, info).
+        """
+        per_session: Dict[str, List[Tuple[List[str], float, str | None]]] = {}
+        for sid, skills, score, *item in answers:
+            per_session.setdefault(sid, []).append((list(dict.fromkeys(skills)), score, item[0] if item else None))
+        if not per_session:
+            return {}
+        if from_scratch:
+            start = {sid: (seed or {}).get(sid, {}) for sid in per_session}
+        else:
+            start = self.load(s, per_session)
+
+        pos: Dict[Tuple[str, str], int] = {}
+        pairs: List[Tuple[str, str]] = []
+        ema0: List[float] = []
+        theta0: List[float] = []
+        info0: List[float] = []
+        # волна: индексы пар, score, a, b
+        waves: List[Tuple[List[int], List[float], List[float], List[float]]] = []
+        for sid, events in per_session.items():
+            vec = start[sid]
+            for k, (skills, score, item) in enumerate(events):
+                if k == len(waves):
+                    waves.append(([], [], [], []))
+                for sk in skills:
+                    i = pos.get((sid, sk))
+                    if i is None:
+                        i = pos[(sid, sk)] = len(ema0)
+                        pairs.append((sid, sk))
+                        prev = vec.get(sk) or SKILL_DEFAULT
+                        ema0.append(prev["ema"])
+                        theta0.append(prev["theta"])
+                        info0.append(prev.get("info", 0.0))
+                    a, b = item_params.get(item, sk)
+                    waves[k][0].append(i)
+                    waves[k][1].append(score)
+                    waves[k][2].append(a)
+                    waves[k][3].append(b)
+
+        ema = np.array(ema0, dtype=float)
+        theta = np.array(theta0, dtype=float)
+        info = np.array(info0, dtype=float)
+        for k, (idx, scores, a, b) in enumerate(waves):
+            ix = np.array(idx, dtype=np.intp)
+            ema[ix], theta[ix], info[ix] = self.step(
+                ema[ix],
+                theta[ix],
+                info[ix],
+                np.array(scores, dtype=float),
+                np.array(a, dtype=float),
+                np.array(b, dtype=float),
+            )
+            if trail is not None:
+                trail.extend((pairs[i][0], k, pairs[i][1], float(ema[i]), float(theta[i]), float(info[i])) for i in idx)
+
+        out: Dict[str, Vector] = {}
+        for (sid, sk), i in pos.items():
+            out.setdefault(sid, {})[sk] = {"ema": float(ema[i]), "theta": float(theta[i]), "info": float(info[i])}
+        self.upsert(s, out)
+        return out
+
+
+assessment_engine = AssessmentEngine(alpha=0.35)
+
+
+def _answer_rows(s: Session, session_ids: Sequence[str]) -> List[MessageDB]:
+    out: List[MessageDB] = []
+    for i in range(0, len(session_ids), CHUNK):
+        out.extend(
+            s.exec(
+                select(MessageDB)
+                .where(
+                    MessageDB.session_id.in_(session_ids[i : i + CHUNK]),
+                    MessageDB.role == "user",
+                    MessageDB.score.is_not(None),
+                )
+                .order_by(MessageDB.ts.asc())
+            ).all()
+        )
+    return out
+
+
+def answer_score(judge: Dict) -> float | None:
+    """
+    Score ответа из JSON судьи. Без числового score ответ не оценён — навыки не обновляются, в MessageDB пишется
+    NULL; replay такие ответы пропускает (_answer_rows), так что онлайн и офлайн считают одинаково.
+    Fused Assessor подставляет на место отсутствующего score дефолт и помечает поле в fallback_fields.
+    """
+    if "score" in (judge.get("fallback_fields") or []):
+        return None
+    score = judge.get("score")
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None
+    return float(score)
+
+
+def _answer(m: MessageDB) -> Answer:
+    return m.session_id, (m.meta or {}).get("skills") or ["general"], m.score, m.item_key
+
+
+def session_answers(s: Session, session_ids: Sequence[str]) -> List[Answer]:
+    """Оценённые ответы сессий из MessageDB в порядке времени (навыки — из meta судьи)."""
+    return [_answer(m) for m in _answer_rows(s, session_ids)]
+
+
+def replay_sessions(session_ids: Sequence[str] | None = None, batch_size: int = 1000) -> int:
+    """
+    Офлайн: пересобирает навыки сессий по истории ответов пачками по batch_size цепочек.
+    Сессия пользователя, как и вживую, стартует с его профиля на момент начала, поэтому его сессии — цепочка
+    по started_at, а UserSkillDB / UserSkillHistoryDB пересобираются из переигранных ответов. Для переданных
+    session_ids переигрываются и остальные сессии их пользователей — иначе профиль разошёлся бы с историей.
+    """
+    from .db import engine, init_db
+
+    init_db()
+    done = 0
+    with Session(engine) as s:
+        item_params.refresh(s)
+        rows = s.exec(select(SessionDB.id, SessionDB.user_id).order_by(SessionDB.started_at, SessionDB.id)).all()
+        if session_ids is not None:
+            wanted = set(session_ids)
+            users = {u for sid, u in rows if sid in wanted and u}
+            rows = [(sid, u) for sid, u in rows if sid in wanted or u in users]
+        # (user_id, сессии по порядку); сессия без пользователя — цепочка из одной
+        chains: List[Tuple[str | None, List[str]]] = []
+        by_user: Dict[str, List[str]] = {}
+        for sid, u in rows:
+            if u is None:
+                chains.append((None, [sid]))
+            elif u in by_user:
+                by_user[u].append(sid)
+            else:
+                by_user[u] = [sid]
+                chains.append((u, by_user[u]))
+        for i in range(0, len(chains), batch_size):
+            batch = chains[i : i + batch_size]
+            _replay_chains(s, batch)
+            s.commit()
+            done += sum(len(c) for _, c in batch)
+    return done
+
+
+def _replay_chains(s: Session, chains: List[Tuple[str | None, List[str]]]) -> None:
+    """
+    g-й шаг — g-е сессии всех цепочек одним replay; seed — профиль пользователя после его прошлых сессий
+    (info=0, как в user_profile.warm_start). Заодно пересчитывается SessionDB.theta_info.
+    """
+    from . import user_profile
+
+    profiles: Dict[str, Vector] = {u: {} for u, _ in chains if u}
+    points: List[Dict] = []  # обновления навыков пользователей в порядке времени — как их писал бы record()
+    theta_info: Dict[str, float] = {sid: 0.0 for _, c in chains for sid in c}
+    for g in range(max(len(c) for _, c in chains)):
+        owner = {c[g]: u for u, c in chains if len(c) > g}
+        msgs = _answer_rows(s, list(owner))
+        by_session: Dict[str, List[MessageDB]] = {}
+        for m in msgs:
+            by_session.setdefault(m.session_id, []).append(m)
+        seed = {
+            sid: {k: {"ema": v["ema"], "theta": v["theta"], "info": 0.0} for k, v in profiles[u].items()}
+            for sid, u in owner.items()
+            if u
+        }
+        trail: List[Tuple[str, int, str, float, float, float]] = []
+        out = assessment_engine.replay(s, [_answer(m) for m in msgs], from_scratch=True, seed=seed, trail=trail)
+
+        # info ответа о theta сессии — как answer_info: среднее приращение по навыкам ответа
+        last_info: Dict[Tuple[str, str], float] = {}
+        gains: Dict[Tuple[str, int], List[float]] = {}
+        for sid, k, skill, ema, theta, info in trail:
+            gains.setdefault((sid, k), []).append(info - last_info.get((sid, skill), 0.0))
+            last_info[(sid, skill)] = info
+            if owner[sid]:
+                m = by_session[sid][k]
+                points.append(
+                    {"user_id": owner[sid], "skill": skill, "session_id": sid, "ema": ema, "theta": theta,
+                     "score": m.score, "ts": m.ts}
+                )
+        for (sid, _), gain in gains.items():
+            theta_info[sid] += sum(gain) / len(gain)
+        for sid, vec in out.items():
+            if owner[sid]:
+                profiles[owner[sid]].update(vec)
+
+    user_profile.rebuild(s, list(profiles), points)
+    # кэш SessionState в работающих воркерах перечитает навыки по версии
+    s.execute(
+        update(SessionDB.__table__)
+        .where(SessionDB.__table__.c.id == bindparam("b_id"))
+        .values(theta_info=bindparam("b_info"), state_version=func.coalesce(SessionDB.state_version, 0) + 1),
+        [{"b_id": sid, "b_info": v} for sid, v in theta_info.items()],
+    )
+
 
 def aggregate_profile(s: Session, session_id: str) -> dict:
     rows = s.exec(select(SkillScoreDB).where(SkillScoreDB.session_id==session_id)).all()
-    return {r.skill: {"ema": r.ema_score, "theta": r.irt_theta} for r in rows}
+    return {r.skill: {"ema": r.ema_score, "theta": r.irt_theta, "info": r.irt_info or 0.0} for r in rows}
+
+
+if __name__ == "__main__":
+    print(f"replayed sessions: {replay_sessions()}")
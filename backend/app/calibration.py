@@ -0,0 +1,319 @@
+"""
+Офлайн-калибровка 2PL по оценённым ответам: параметры пунктов (вопрос × навык: discrimination a,
+difficulty b) — маргинальной MAP-оценкой (EM), способности (сессия × навык) — EAP. Всё векторно в NumPy.
+
+    python -m backend.app.calibration          # инкрементально: только ответы после прошлого прогона
+    python -m backend.app.calibration --full   # с нуля по всем ответам
+
+Инкрементальный прогон берёт прошлые оценки пунктов как prior (среднее + апостериорная точность из ItemParamDB).
+Способности сессий, чьи ответы попали в разные прогоны, оцениваются по новой части заново — в ItemParamDB их нет.
+"""
+import argparse
+import hashlib
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy import delete
+from sqlmodel import Session, select
+from .config import settings
+from .db import insert_for
+from .models import CalibrationRunDB, ItemParamDB, MessageDB, uuid_str
+
+# Priors: theta ~ N(0, 1) (узлы квадратуры), log a ~ N(0, 0.5^2), b ~ N(0, 1.5^2)
+QUAD_NODES = 15
+LOG_A_PRECISION = 1 / 0.5**2
+B_PRECISION = 1 / 1.5**2
+A_RANGE = (0.2, 4.0)
+B_RANGE = (-4.0, 4.0)
+MAX_STEP = 1.0  # ограничение шага Ньютона — устойчивость на редких пунктах
+M_STEPS = 3  # шагов Ньютона на одну E-итерацию
+TOL = 1e-2  # суммарный max-шаг параметров за M-шаг
+
+Key = Tuple[str, str]  # (item_key | session_id, skill)
+
+
+def item_key(question: str) -> str:
+    """Ключ пункта — хэш нормализованного текста вопроса (одинаковый вопрос в разных сессиях — один пункт)."""
+    return hashlib.sha1(" ".join(question.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-z))
+
+
+class ResponseMatrix:
+    """Ответы в разреженном виде: (person, item, y) — индексы в persons/items, y = score в [0, 1]."""
+
+    def __init__(self):
+        self.persons: Dict[Key, int] = {}
+        self.items: Dict[Key, int] = {}
+        self._p: List[int] = []
+        self._i: List[int] = []
+        self._y: List[float] = []
+
+    def add(self, session_id: str, key: str, skills: List[str], score: float) -> None:
+        y = min(1.0, max(0.0, float(score)))
+        for sk in dict.fromkeys(skills or ["general"]):
+            self._p.append(self.persons.setdefault((session_id, sk), len(self.persons)))
+            self._i.append(self.items.setdefault((key, sk), len(self.items)))
+            self._y.append(y)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return np.array(self._p, dtype=np.intp), np.array(self._i, dtype=np.intp), np.array(self._y, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self._y)
+
+
+def fit(
+    person: np.ndarray,
+    item: np.ndarray,
+    y: np.ndarray,
+    n_persons: int,
+    prior_log_a: np.ndarray,
+    prior_log_a_prec: np.ndarray,
+    prior_b: np.ndarray,
+    prior_b_prec: np.ndarray,
+    max_iter: int,
+) -> Dict[str, np.ndarray | int]:
+    """
+    Маргинальная MAP-оценка параметров пунктов EM-алгоритмом Бока–Эиткина: theta интегрируется по сетке
+    квадратуры с prior N(0, 1) (совместная оценка theta/a/b точками смещает шкалу — a раздувается, b сжимается).
+
+    Всё, что зависит от пункта и узла, считается на матрице items × QUAD_NODES; по ответам — только gather
+    и bincount. E-шаг: log-правдоподобие персоны в узле q = sum_r [y_r z_jq + log(1 - P_jq)], z = a(X_q - b).
+    M-шаг: по ожидаемым числам ответов n_jq и сумме score s_jq в узлах — несколько шагов Ньютона по b и log a
+    для всех пунктов сразу. Способности — EAP. Точности пунктов — prior для следующего прогона.
+    """
+    n_items = len(prior_b)
+    nodes = np.linspace(-4, 4, QUAD_NODES)
+    log_prior = -0.5 * nodes**2
+    log_a = prior_log_a.copy()
+    b = prior_b.copy()
+    lo_a, hi_a = np.log(A_RANGE[0]), np.log(A_RANGE[1])
+    h_a, h_b = prior_log_a_prec.copy(), prior_b_prec.copy()
+    q = np.arange(QUAD_NODES)
+    # плоские индексы (ответ, узел) -> ячейка person × node / item × node
+    cell_p = (person[:, None] * QUAD_NODES + q).ravel()
+    cell_i = (item[:, None] * QUAD_NODES + q).ravel()
+    y_col = y[:, None]
+    post = np.full((n_persons, QUAD_NODES), 1 / QUAD_NODES)
+    it = 0
+    for it in range(1, max_iter + 1):
+        a = np.exp(log_a)
+        log_1mp = -np.logaddexp(0, a[:, None] * (nodes[None, :] - b[:, None]))
+
+        # E: апостериорные веса узлов для каждой персоны; sum_r y_r z_jq линейна по X_q — две суммы на персону
+        ya = y * a[item]
+        ll_y = np.outer(np.bincount(person, ya, n_persons), nodes) - np.bincount(person, ya * b[item], n_persons)[:, None]
+        ll_1mp = np.bincount(cell_p, log_1mp[item].ravel(), n_persons * QUAD_NODES).reshape(n_persons, QUAD_NODES)
+        logp = ll_y + ll_1mp + log_prior
+        logp -= logp.max(axis=1, keepdims=True)
+        post = np.exp(logp)
+        post /= post.sum(axis=1, keepdims=True)
+
+        # ожидаемые число ответов и сумма score каждого пункта в каждом узле
+        wq = post[person]
+        n_jq = np.bincount(cell_i, wq.ravel(), n_items * QUAD_NODES).reshape(n_items, QUAD_NODES)
+        s_jq = np.bincount(cell_i, (wq * y_col).ravel(), n_items * QUAD_NODES).reshape(n_items, QUAD_NODES)
+
+        # M: шаги Ньютона на матрице items × nodes (дёшево — от числа ответов не зависит)
+        step = 0.0
+        for _ in range(M_STEPS):
+            a = np.exp(log_a)[:, None]
+            d = nodes[None, :] - b[:, None]
+            p = _sigmoid(a * d)
+            r = s_jq - n_jq * p
+            info = n_jq * p * (1 - p)
+            u = a * d
+            g_b = -(a * r).sum(axis=1) - (b - prior_b) * prior_b_prec
+            h_b = (a * a * info).sum(axis=1) + prior_b_prec
+            g_a = (u * r).sum(axis=1) - (log_a - prior_log_a) * prior_log_a_prec
+            h_a = (u * u * info).sum(axis=1) + prior_log_a_prec
+            b_new = np.clip(b + np.clip(g_b / h_b, -MAX_STEP, MAX_STEP), *B_RANGE)
+            log_a_new = np.clip(log_a + np.clip(g_a / h_a, -MAX_STEP, MAX_STEP), lo_a, hi_a)
+            step += max(np.abs(b_new - b).max(initial=0), np.abs(log_a_new - log_a).max(initial=0))
+            b, log_a = b_new, log_a_new
+
+        if step < TOL:
+            break
+    return {"theta": post @ nodes, "log_a": log_a, "b": b, "log_a_prec": h_a, "b_prec": h_b, "iterations": it}
+
+
+def _backfill_item_keys(s: Session, since: datetime) -> int:
+    """Ответы до появления item_key: ключ — по предшествующему вопросу ассистента в сессии."""
+    sessions = s.exec(
+        select(MessageDB.session_id)
+        .where(
+            MessageDB.role == "user",
+            MessageDB.score.is_not(None),
+            MessageDB.item_key.is_(None),
+            MessageDB.ts > since,
+        )
+        .distinct()
+    ).all()
+    done = 0
+    for sid in sessions:
+        question = None
+        for m in s.exec(select(MessageDB).where(MessageDB.session_id == sid).order_by(MessageDB.ts.asc())).all():
+            if m.role == "assistant":
+                question = m.content
+            elif m.role == "user" and m.score is not None and m.item_key is None and question:
+                m.item_key = item_key(question)
+                s.add(m)
+                done += 1
+    s.commit()
+    return done
+
+
+def _last_run(s: Session) -> CalibrationRunDB | None:
+    return s.exec(
+        select(CalibrationRunDB).where(CalibrationRunDB.finished_at.is_not(None)).order_by(CalibrationRunDB.watermark.desc())
+    ).first()
+
+
+def calibrate(full: bool = False) -> Dict:
+    """Прогон калибровки: новые ответы (ts в (watermark, now - IRT_CALIBRATION_LAG_S]) -> ItemParamDB."""
+    from .db import engine, init_db
+
+    init_db()
+    t0 = time.perf_counter()
+    with Session(engine) as s:
+        last = None if full else _last_run(s)
+        since = last.watermark if last else datetime.min
+        until = datetime.utcnow() - timedelta(seconds=settings.irt_calibration_lag_s)
+        run = CalibrationRunDB(watermark=until, full=full)
+        _backfill_item_keys(s, since)
+
+        rows = s.exec(
+            select(MessageDB.session_id, MessageDB.item_key, MessageDB.meta, MessageDB.score)
+            .where(
+                MessageDB.role == "user",
+                MessageDB.score.is_not(None),
+                MessageDB.item_key.is_not(None),
+                MessageDB.ts > since,
+                MessageDB.ts <= until,
+            )
+        ).all()
+        rm = ResponseMatrix()
+        # meta — JSON-колонка: навыки достаём в Python, без диалектных json-функций БД
+        for session_id, key, meta, score in rows:
+            rm.add(session_id, key, (meta or {}).get("skills") or [], score)
+
+        if len(rm):
+            items = list(rm.items)
+            stored: Dict[Key, ItemParamDB] = {}
+            if not full:
+                stored = {(r.item_key, r.skill): r for r in s.exec(select(ItemParamDB)).all()}
+            prior_log_a = np.zeros(len(items))
+            prior_log_a_prec = np.full(len(items), LOG_A_PRECISION)
+            prior_b = np.zeros(len(items))
+            prior_b_prec = np.full(len(items), B_PRECISION)
+            for j, k in enumerate(items):
+                r = stored.get(k)
+                if r is not None:
+                    prior_log_a[j], prior_log_a_prec[j] = np.log(r.a), max(r.log_a_precision, LOG_A_PRECISION)
+                    prior_b[j], prior_b_prec[j] = r.b, max(r.b_precision, B_PRECISION)
+
+            person, item, y = rm.arrays()
+            est = fit(
+                person, item, y, len(rm.persons),
+                prior_log_a, prior_log_a_prec, prior_b, prior_b_prec,
+                max_iter=settings.irt_calibration_max_iter,
+            )
+            counts = np.bincount(item, minlength=len(items))
+            now = datetime.utcnow()
+            params = [
+                {
+                    "id": uuid_str(),
+                    "item_key": k,
+                    "skill": sk,
+                    "a": float(np.exp(est["log_a"][j])),
+                    "b": float(est["b"][j]),
+                    "log_a_precision": float(est["log_a_prec"][j]),
+                    "b_precision": float(est["b_prec"][j]),
+                    "responses": int(counts[j]) + (stored[(k, sk)].responses if (k, sk) in stored else 0),
+                    "updated_at": now,
+                }
+                for j, (k, sk) in enumerate(items)
+            ]
+            if full:
+                s.execute(delete(ItemParamDB))
+            stmt = insert_for(s)(ItemParamDB)
+            s.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["item_key", "skill"],
+                    set_={c: getattr(stmt.excluded, c) for c in
+                          ("a", "b", "log_a_precision", "b_precision", "responses", "updated_at")},
+                ),
+                params,
+            )
+            run.responses, run.items, run.persons, run.iterations = len(rm), len(items), len(rm.persons), est["iterations"]
+
+        run.finished_at = datetime.utcnow()
+        s.add(run)
+        s.commit()
+        return {
+            "responses": run.responses,
+            "items": run.items,
+            "persons": run.persons,
+            "iterations": run.iterations,
+            "watermark": until.isoformat(),
+            "seconds": round(time.perf_counter() - t0, 2),
+        }
+
+
+class ItemParams:
+    """
+    Параметры пунктов для онлайн-обновления theta: вся таблица в памяти, перечитывается после нового прогона
+    калибровки (проверка — не чаще IRT_PARAMS_REFRESH_S). Без калибровки — a=1, b=0.
+    """
+
+    def __init__(self):
+        self._params: Dict[Key, Tuple[float, float]] = {}
+        self._items: Dict[str, Tuple[float, float]] = {}
+        self._run_id: str | None = None
+        self._checked = 0.0
+
+    @property
+    def version(self) -> str | None:
+        """id прогона калибровки, чьи параметры загружены (для инвалидации производных индексов)."""
+        return self._run_id
+
+    def refresh(self, s: Session) -> None:
+        now = time.monotonic()
+        if now - self._checked < settings.irt_params_refresh_s:
+            return
+        self._checked = now
+        last = _last_run(s)
+        run_id = last.id if last else None
+        if run_id == self._run_id:
+            return
+        rows = s.exec(select(ItemParamDB.item_key, ItemParamDB.skill, ItemParamDB.a, ItemParamDB.b)).all()
+        self._params = {(k, sk): (a, b) for k, sk, a, b in rows}
+        by_item: Dict[str, List[Tuple[float, float]]] = {}
+        for (k, _), ab in self._params.items():
+            by_item.setdefault(k, []).append(ab)
+        self._items = {k: tuple(np.mean(v, axis=0).tolist()) for k, v in by_item.items()}
+        self._run_id = run_id
+
+    def get(self, key: str | None, skill: str) -> Tuple[float, float]:
+        return self._params.get((key, skill), (1.0, 0.0)) if key else (1.0, 0.0)
+
+    def item(self, key: str) -> Tuple[float, float] | None:
+        """(a, b) вопроса без привязки к навыку — среднее по откалиброванным навыкам; None — не калибровался."""
+        return self._items.get(key)
+
+
+item_params = ItemParams()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline 2PL calibration of item parameters")
+    ap.add_argument("--full", action="store_true", help="recalibrate from scratch over all responses")
+    print(calibrate(full=ap.parse_args().full))
+
+
+if __name__ == "__main__":
+    main()
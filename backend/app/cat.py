@@ -0,0 +1,90 @@
+"""
+Адаптивный выбор curated-вопроса (CAT): из ещё не заданных вопросов темы — с максимальной информацией
+Фишера 2PL в текущей theta сессии. Параметры вопроса — из офлайн-калибровки (ItemParams), без неё —
+оценка по difficulty / bloom_hint с a=1.
+"""
+import bisect
+import math
+from dataclasses import dataclass
+from typing import Collection, Dict, List, Sequence
+from .calibration import item_params
+
+# Шкала theta ~ N(0, 1): сложность из админской разметки вопроса, пока нет калибровки
+DIFFICULTY_B = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+BLOOM_B = {"remember": -0.75, "understand": -0.45, "apply": -0.15, "analyze": 0.15, "evaluate": 0.45, "create": 0.75}
+# max_x x^2 p(x) (1 - p(x)), p — логистическая: достигается при x ≈ 2.4
+_G_ARGMAX, _G_MAX = 2.39936, 0.43923
+
+
+def prior_b(difficulty: str | None, bloom: str | None) -> float:
+    return DIFFICULTY_B.get(difficulty or "", 0.0) + BLOOM_B.get(bloom or "", 0.0)
+
+
+def info_2pl(theta: float, a: float, b: float) -> float:
+    p = 1 / (1 + math.exp(-a * (theta - b)))
+    return a * a * p * (1 - p)
+
+
+def info_bound(a_max: float, dist: float) -> float:
+    """Верхняя граница информации любого пункта с a <= a_max и |theta - b| >= dist (убывает по dist)."""
+    if a_max * dist <= _G_ARGMAX:
+        return info_2pl(dist, a_max, 0.0)
+    return _G_MAX / (dist * dist)
+
+
+def session_theta(profile: Dict[str, Dict[str, float]]) -> float:
+    """Одна theta для выбора вопроса темы — среднее по навыкам сессии (0 — ответов ещё нет)."""
+    thetas = [v["theta"] for v in profile.values()]
+    return sum(thetas) / len(thetas) if thetas else 0.0
+
+
+@dataclass
+class ItemIndex:
+    """
+    Вопросы темы, отсортированные по b. select(): bisect к theta и расширение в обе стороны по возрастанию
+    |theta - b|, пока info_bound на текущем расстоянии может побить лучший найденный — обычно несколько шагов.
+    """
+
+    b: List[float]
+    a: List[float]
+    keys: List[str]
+    pos: List[int]  # индекс вопроса в банке темы
+    a_max: float
+    version: str | None  # ItemParams.version, по которым построен
+
+    @classmethod
+    def build(
+        cls, keys: Sequence[str], difficulties: Sequence[str | None], blooms: Sequence[str | None]
+    ) -> "ItemIndex":
+        rows = []
+        for i, (k, d, bl) in enumerate(zip(keys, difficulties, blooms)):
+            a, b = item_params.item(k) or (1.0, prior_b(d, bl))
+            rows.append((b, i, a, k))
+        rows.sort()  # при равной b — раньше добавленный вопрос
+        return cls(
+            b=[r[0] for r in rows],
+            a=[r[2] for r in rows],
+            keys=[r[3] for r in rows],
+            pos=[r[1] for r in rows],
+            a_max=max((r[2] for r in rows), default=1.0),
+            version=item_params.version,
+        )
+
+    def select(self, theta: float, seen: Collection[str]) -> int | None:
+        n = len(self.b)
+        hi = bisect.bisect_left(self.b, theta)
+        lo = hi - 1
+        best, best_info = None, -1.0
+        while lo >= 0 or hi < n:
+            if hi >= n or (lo >= 0 and theta - self.b[lo] <= self.b[hi] - theta):
+                j, lo = lo, lo - 1
+            else:
+                j, hi = hi, hi + 1
+            if best is not None and info_bound(self.a_max, abs(theta - self.b[j])) <= best_info:
+                break
+            if self.keys[j] in seen:
+                continue
+            info = info_2pl(theta, self.a[j], self.b[j])
+            if info > best_info:
+                best, best_info = j, info
+        return None if best is None else self.pos[best]
@@ -10,8 +10,114 @@ class Settings(BaseSettings):
 
     # LLM routing
     llm_provider: str = Field(default="mistral", alias="LLM_PROVIDER")
+    # Дополнительные провайдеры для роутера (через запятую): "yandex" -> mistral + yandex
+    llm_providers: str = Field(default="", alias="LLM_PROVIDERS")
+    llm_router_window: int = Field(default=200, alias="LLM_ROUTER_WINDOW")
+    # Пока у провайдера меньше замеров, его не ранжируем по здоровью — действует порядок из конфига
+    llm_router_min_samples: int = Field(default=20, alias="LLM_ROUTER_MIN_SAMPLES")
+    llm_router_error_penalty_s: float = Field(default=10.0, alias="LLM_ROUTER_ERROR_PENALTY_S")
+    llm_hedge_after_ms: float = Field(default=0.0, alias="LLM_HEDGE_AFTER_MS")  # 0 — без хеджирования
+    llm_embed_failover: bool = Field(default=False, alias="LLM_EMBED_FAILOVER")
+    llm_timeout_s: float = Field(default=60.0, alias="LLM_TIMEOUT_S")
+    llm_http2: bool = Field(default=True, alias="LLM_HTTP2")
+    llm_max_connections: int = Field(default=200, alias="LLM_MAX_CONNECTIONS")
+    llm_max_keepalive: int = Field(default=50, alias="LLM_MAX_KEEPALIVE")
+    llm_keepalive_expiry_s: float = Field(default=30.0, alias="LLM_KEEPALIVE_EXPIRY_S")
+
+    # Клиентский rate limit (token bucket per provider/model) + ретраи + AIMD-параллелизм
+    llm_rate_limit_rps: float = Field(default=5.0, alias="LLM_RATE_LIMIT_RPS")
+    llm_rate_limit_burst: float = Field(default=10.0, alias="LLM_RATE_LIMIT_BURST")
+    # Переопределения RPS: {"mistral": 10, "yandex:yandexgpt": 3} (JSON в env)
+    llm_rate_limits: dict[str, float] = Field(default_factory=dict, alias="LLM_RATE_LIMITS")
+    llm_max_retries: int = Field(default=3, alias="LLM_MAX_RETRIES")
+    llm_backoff_base_s: float = Field(default=0.5, alias="LLM_BACKOFF_BASE_S")
+    llm_backoff_max_s: float = Field(default=20.0, alias="LLM_BACKOFF_MAX_S")
+    llm_aimd_initial_concurrency: int = Field(default=8, alias="LLM_AIMD_INITIAL_CONCURRENCY")
+    llm_aimd_min_concurrency: int = Field(default=1, alias="LLM_AIMD_MIN_CONCURRENCY")
+    llm_aimd_max_concurrency: int = Field(default=64, alias="LLM_AIMD_MAX_CONCURRENCY")
+
+    # Circuit breaker per provider/endpoint: при open агенты сразу уходят в fallback
+    llm_breaker_enabled: bool = Field(default=True, alias="LLM_BREAKER_ENABLED")
+    llm_breaker_failure_threshold: int = Field(default=5, alias="LLM_BREAKER_FAILURE_THRESHOLD")
+    llm_breaker_error_rate: float = Field(default=0.5, alias="LLM_BREAKER_ERROR_RATE")
+    llm_breaker_window: int = Field(default=20, alias="LLM_BREAKER_WINDOW")
+    llm_breaker_min_calls: int = Field(default=10, alias="LLM_BREAKER_MIN_CALLS")
+    llm_breaker_slow_call_s: float = Field(default=20.0, alias="LLM_BREAKER_SLOW_CALL_S")
+    llm_breaker_open_s: float = Field(default=30.0, alias="LLM_BREAKER_OPEN_S")
+    llm_breaker_half_open_calls: int = Field(default=1, alias="LLM_BREAKER_HALF_OPEN_CALLS")
+
+    # Кэш детерминированных ответов LLM (temperature=0: Judge / Bloom-Tagger / SOLO-Tagger)
+    llm_cache_enabled: bool = Field(default=True, alias="LLM_CACHE_ENABLED")
+    llm_cache_path: str = Field(default="./llm_cache.sqlite3", alias="LLM_CACHE_PATH")
+    llm_cache_ttl_s: float = Field(default=7 * 24 * 3600, alias="LLM_CACHE_TTL_S")
+    llm_cache_max_entries: int = Field(default=100_000, alias="LLM_CACHE_MAX_ENTRIES")
+    llm_cache_mem_entries: int = Field(default=2048, alias="LLM_CACHE_MEM_ENTRIES")
+    llm_cache_max_temperature: float = Field(default=0.0, alias="LLM_CACHE_MAX_TEMPERATURE")
+
+    # Кэш эмбеддингов (RAG query + add_docs)
+    embed_cache_enabled: bool = Field(default=True, alias="EMBED_CACHE_ENABLED")
+    embed_cache_path: str = Field(default="./embed_cache.sqlite3", alias="EMBED_CACHE_PATH")
+    embed_cache_max_entries: int = Field(default=200_000, alias="EMBED_CACHE_MAX_ENTRIES")
+    embed_cache_mem_entries: int = Field(default=4096, alias="EMBED_CACHE_MEM_ENTRIES")
+
+    # Single-flight: одновременные одинаковые chat/embed-запросы делят один вызов провайдера
+    llm_coalesce_enabled: bool = Field(default=True, alias="LLM_COALESCE_ENABLED")
+
+    # Учёт токенов/стоимости: цены за 1M токенов [prompt, completion] по модели (JSON в env)
+    llm_prices: dict[str, list[float]] = Field(
+        default_factory=lambda: {"mistral-large-latest": [2.0, 6.0], "mistral-embed": [0.1, 0.0]},
+        alias="LLM_PRICES",
+    )
+
+    # Оценка ответа: параллельный запуск Judge / Bloom-Tagger / SOLO-Tagger
+    assess_concurrency: int = Field(default=3, alias="ASSESS_CONCURRENCY")
+    judge_timeout_s: float = Field(default=20.0, alias="JUDGE_TIMEOUT_S")
+    bloom_tagger_timeout_s: float = Field(default=10.0, alias="BLOOM_TAGGER_TIMEOUT_S")
+    solo_tagger_timeout_s: float = Field(default=10.0, alias="SOLO_TAGGER_TIMEOUT_S")
+    # Fused Assessor: score + Bloom + SOLO одним вызовом вместо трёх
+    fused_assessor: bool = Field(default=False, alias="FUSED_ASSESSOR")
+    assessor_timeout_s: float = Field(default=20.0, alias="ASSESSOR_TIMEOUT_S")
+
+    # Рекомендации Summarizer — в фоне после хода, не чаще чем раз в N ходов или при сдвиге EMA навыка
+    recs_every_n_turns: int = Field(default=3, alias="RECS_EVERY_N_TURNS")
+    recs_profile_delta: float = Field(default=0.15, alias="RECS_PROFILE_DELTA")
+
+    # Спекулятивный prefetch следующего вопроса для самых вероятных веток планировщика (0 — выключен)
+    prefetch_branches: int = Field(default=0, alias="PREFETCH_BRANCHES")
+    prefetch_ttl_s: float = Field(default=900.0, alias="PREFETCH_TTL_S")
+    prefetch_max_sessions: int = Field(default=5000, alias="PREFETCH_MAX_SESSIONS")
+
+    # Кэш состояния сессий для оркестратора (LRU, write-through в БД)
+    session_cache_size: int = Field(default=2000, alias="SESSION_CACHE_SIZE")
+    session_history_window: int = Field(default=12, alias="SESSION_HISTORY_WINDOW")
+
+    # Индекс curated-вопросов по темам: сверять TopicDB.bank_version (нужно, если воркеров несколько)
+    curated_version_check: bool = Field(default=True, alias="CURATED_VERSION_CHECK")
+    # Завершение exam: fixed — ровно EXAM_MAX_QUESTIONS вопросов; precision — раньше, как только SE theta
+    # сессии <= EXAM_TARGET_SE (но не раньше EXAM_MIN_QUESTIONS вопросов). Ответ даёт не больше a^2/4 информации:
+    # при a=1 SE 0.6 достижима за 8 ответов, 0.5 — только за 12, т.е. не раньше лимита в 10
+    exam_stop_rule: str = Field(default="fixed", alias="EXAM_STOP_RULE")
+    exam_max_questions: int = Field(default=10, alias="EXAM_MAX_QUESTIONS")
+    exam_min_questions: int = Field(default=4, alias="EXAM_MIN_QUESTIONS")
+    exam_target_se: float = Field(default=0.6, alias="EXAM_TARGET_SE")
+    # Выбор curated-вопроса в exam: sequential — по created_at (как раньше), adaptive — максимум информации 2PL
+    # в theta сессии (включать явно)
+    exam_item_selection: str = Field(default="sequential", alias="EXAM_ITEM_SELECTION")
+
+    # Трассировка хода по этапам: Server-Timing всегда, meta.timings — TRACE_META;
+    # в агрегаты (/api/admin/timings) попадает доля TRACE_SAMPLE_RATE ходов, последние TRACE_WINDOW на этап
+    trace_meta: bool = Field(default=True, alias="TRACE_META")
+    trace_sample_rate: float = Field(default=1.0, alias="TRACE_SAMPLE_RATE")
+    trace_window: int = Field(default=1000, alias="TRACE_WINDOW")
+
+    # Офлайн-калибровка IRT (python -m backend.app.calibration): ответы младше IRT_CALIBRATION_LAG_S не берём —
+    # ход коммитится позже, чем проставлен ts сообщения. Онлайн-воркеры перечитывают параметры раз в IRT_PARAMS_REFRESH_S.
+    irt_calibration_lag_s: float = Field(default=600.0, alias="IRT_CALIBRATION_LAG_S")
+    irt_calibration_max_iter: int = Field(default=50, alias="IRT_CALIBRATION_MAX_ITER")
+    irt_params_refresh_s: float = Field(default=60.0, alias="IRT_PARAMS_REFRESH_S")
 
     # Mistral
+    mistral_api_url: str = Field(default="https://api.mistral.ai/v1", alias="MISTRAL_API_URL")
     mistral_api_key: str = Field(default="", alias="MISTRAL_API_KEY")
     mistral_chat_model: str = Field(default="mistral-large-latest", alias="MISTRAL_CHAT_MODEL")
     mistral_embed_model: str = Field(default="mistral-embed", alias="MISTRAL_EMBED_MODEL")
@@ -21,6 +127,24 @@ class Settings(BaseSettings):
     yandex_folder_id: str = Field(default="", alias="YANDEX_FOLDER_ID")
     yandex_gpt_model: str = Field(default="yandexgpt", alias="YANDEX_GPT_MODEL")
     yandex_embed_model: str = Field(default="text-search-query", alias="YANDEX_EMBED_MODEL")
+    yandex_embed_concurrency: int = Field(default=8, alias="YANDEX_EMBED_CONCURRENCY")
+    yandex_embed_retries: int = Field(default=2, alias="YANDEX_EMBED_RETRIES")
+
+    # RAG-ингест: размер батча для эмбеддингов и записи в Chroma
+    embed_batch_size: int = Field(default=256, alias="EMBED_BATCH_SIZE")
+
+    # Mock-провайдер (LLM_PROVIDER=mock) для нагрузочных тестов без сети
+    mock_chat_model: str = Field(default="mock-chat", alias="MOCK_CHAT_MODEL")
+    mock_embed_model: str = Field(default="mock-embed", alias="MOCK_EMBED_MODEL")
+    mock_seed: int = Field(default=42, alias="MOCK_SEED")
+    mock_chat_latency_ms: float = Field(default=800.0, alias="MOCK_CHAT_LATENCY_MS")  # медиана
+    mock_embed_latency_ms: float = Field(default=120.0, alias="MOCK_EMBED_LATENCY_MS")
+    mock_latency_sigma: float = Field(default=0.5, alias="MOCK_LATENCY_SIGMA")  # lognormal sigma
+    mock_token_ms: float = Field(default=15.0, alias="MOCK_TOKEN_MS")
+    mock_error_rate: float = Field(default=0.0, alias="MOCK_ERROR_RATE")
+    mock_rate_limit_rate: float = Field(default=0.0, alias="MOCK_RATE_LIMIT_RATE")
+    mock_retry_after_s: float = Field(default=1.0, alias="MOCK_RETRY_AFTER_S")
+    mock_embed_dim: int = Field(default=1024, alias="MOCK_EMBED_DIM")
 
     # S3/MinIO
     s3_endpoint_url: str = Field(default="http://localhost:9000", alias="S3_ENDPOINT_URL")
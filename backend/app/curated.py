@@ -0,0 +1,89 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List
+from sqlmodel import Session, select
+from .cat import ItemIndex
+from .calibration import item_key, item_params
+from .config import settings
+from .models import QuestionDB, TopicDB
+
+
+@dataclass
+class TopicBank:
+    """Банк вопросов темы в порядке created_at: вопрос экзамена № i — texts[i]."""
+
+    topic_id: str | None
+    version: int = 0
+    ids: List[str] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    keys: List[str] = field(default_factory=list)  # calibration.item_key(text)
+    difficulties: List[str | None] = field(default_factory=list)
+    blooms: List[str | None] = field(default_factory=list)
+    _index: ItemIndex | None = field(default=None, repr=False)
+
+    def question(self, index: int) -> str | None:
+        return self.texts[index] if 0 <= index < len(self.texts) else None
+
+    def select(self, theta: float, seen: Collection[str]) -> str | None:
+        """Незаданный вопрос с максимальной информацией в theta; индекс перестраивается после новой калибровки."""
+        index = self._index
+        if index is None or index.version != item_params.version:
+            index = self._index = ItemIndex.build(self.keys, self.difficulties, self.blooms)
+        pos = index.select(theta, seen)
+        return None if pos is None else self.texts[pos]
+
+
+class CuratedIndex:
+    """
+    In-process индекс админских вопросов по имени темы. Сбрасывается admin_create_topic/admin_add_question;
+    другие воркеры замечают изменения по TopicDB.bank_version (CURATED_VERSION_CHECK, одно чтение по индексу).
+    """
+
+    def __init__(self):
+        self._banks: Dict[str, TopicBank] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, s: Session, topic_name: str) -> TopicBank:
+        topic = s.exec(select(TopicDB).where(TopicDB.name == topic_name)).first()
+        if not topic:
+            return TopicBank(topic_id=None)
+        rows = s.exec(
+            select(QuestionDB.id, QuestionDB.text, QuestionDB.difficulty, QuestionDB.bloom_hint)
+            .where(QuestionDB.topic_id == topic.id)
+            .order_by(QuestionDB.created_at.asc())
+        ).all()
+        return TopicBank(
+            topic_id=topic.id,
+            version=topic.bank_version or 0,
+            ids=[r[0] for r in rows],
+            texts=[r[1] for r in rows],
+            keys=[item_key(r[1]) for r in rows],
+            difficulties=[r[2] for r in rows],
+            blooms=[r[3] for r in rows],
+        )
+
+    def bank(self, s: Session, topic_name: str) -> TopicBank:
+        with self._lock:
+            bank = self._banks.get(topic_name)
+        if bank is not None and settings.curated_version_check:
+            row = s.exec(select(TopicDB.id, TopicDB.bank_version).where(TopicDB.name == topic_name)).first()
+            current = (row[0], row[1] or 0) if row else (None, 0)
+            if current != (bank.topic_id, bank.version):
+                bank = None
+        if bank is None:
+            bank = self._load(s, topic_name)
+            with self._lock:
+                self._banks[topic_name] = bank
+        return bank
+
+    def invalidate(self, topic_name: str) -> None:
+        with self._lock:
+            self._banks.pop(topic_name, None)
+
+
+curated_index = CuratedIndex()
+
+
+def bump_bank_version(topic: TopicDB) -> None:
+    """Перед коммитом изменения банка темы: сигнал остальным воркерам перечитать индекс."""
+    topic.bank_version = (topic.bank_version or 0) + 1
@@ -1,7 +1,10 @@
+import logging
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlmodel import SQLModel, create_engine, Session
 from .config import settings
 
 engine = create_engine(settings.database_url, echo=False)
+log = logging.getLogger(__name__)
 
 
 def init_db():
@@ -20,6 +23,17 @@ def init_db():
                 conn.exec_driver_sql("ALTER TABLE messagedb ADD COLUMN solo_level VARCHAR")
             except Exception:
                 pass
+        if "difficulty" not in [c[1] for c in cols]:
+            try:
+                conn.exec_driver_sql("ALTER TABLE messagedb ADD COLUMN difficulty VARCHAR")
+            except Exception:
+                pass
+        if "item_key" not in [c[1] for c in cols]:
+            try:
+                conn.exec_driver_sql("ALTER TABLE messagedb ADD COLUMN item_key VARCHAR")
+                conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_messagedb_item_key ON messagedb (item_key)")
+            except Exception:
+                pass
 
         # SessionDB.user_id
         cols2 = conn.exec_driver_sql("PRAGMA table_info('sessiondb')").fetchall()
@@ -34,6 +48,66 @@ def init_db():
                 conn.exec_driver_sql("ALTER TABLE sessiondb ADD COLUMN max_questions INTEGER")
             except Exception:
                 pass
+        for col, ddl in (
+            ("recommendations", "VARCHAR"),
+            ("recs_requested", "INTEGER DEFAULT 0"),
+            ("recs_turn", "INTEGER DEFAULT 0"),
+            ("recs_profile", "JSON"),
+            ("recs_updated_at", "DATETIME"),
+            # asked_count без DEFAULT: у старых сессий NULL — пересчитается при первой загрузке состояния
+            ("asked_count", "INTEGER"),
+            ("difficulty", "VARCHAR"),
+            ("state_version", "INTEGER DEFAULT 0"),
+            ("theta_info", "FLOAT DEFAULT 0"),
+            ("start_skills", "JSON"),
+            # score_count без DEFAULT: NULL помечает сессии, которым нужен backfill агрегатов
+            ("score_sum", "FLOAT DEFAULT 0"),
+            ("score_count", "INTEGER"),
+            ("answers_count", "INTEGER DEFAULT 0"),
+            ("bloom_counts", "JSON"),
+            ("solo_counts", "JSON"),
+        ):
+            if col not in existing_cols2:
+                try:
+                    conn.exec_driver_sql(f"ALTER TABLE sessiondb ADD COLUMN {col} {ddl}")
+                except Exception:
+                    pass
+
+        # TopicDB.bank_version
+        cols4 = conn.exec_driver_sql("PRAGMA table_info('topicdb')").fetchall()
+        if "bank_version" not in [c[1] for c in cols4]:
+            try:
+                conn.exec_driver_sql("ALTER TABLE topicdb ADD COLUMN bank_version INTEGER DEFAULT 0")
+            except Exception:
+                pass
+
+        # SkillScoreDB: уникальный (session_id, skill); дубликаты старых версий — один раз, до создания индекса
+        if not _has_index(conn, "ux_skillscoredb_session_skill"):
+            try:
+                _drop_skill_duplicates(conn)
+                conn.exec_driver_sql(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ux_skillscoredb_session_skill ON skillscoredb (session_id, skill)"
+                )
+            except Exception:
+                pass
+
+        cols5 = conn.exec_driver_sql("PRAGMA table_info('skillscoredb')").fetchall()
+        if "irt_info" not in [c[1] for c in cols5]:
+            try:
+                conn.exec_driver_sql("ALTER TABLE skillscoredb ADD COLUMN irt_info FLOAT DEFAULT 0")
+            except Exception:
+                pass
+
+        # LLMUsageDB: уникальный ключ под upsert; дубликаты (раньше писались SELECT-then-INSERT) — складываем в одну строку
+        if not _has_index(conn, "ux_llmusagedb_key"):
+            try:
+                _merge_usage_duplicates(conn)
+                conn.exec_driver_sql(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS ux_llmusagedb_key ON llmusagedb "
+                    "(coalesce(session_id, ''), agent, provider, model, kind)"
+                )
+            except Exception:
+                pass
 
         # UserDB.role
         cols3 = conn.exec_driver_sql("PRAGMA table_info('userdb')").fetchall()
@@ -44,6 +118,46 @@ def init_db():
                 pass
 
 
+def _has_index(conn, name: str) -> bool:
+    return conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).first() is not None
+
+
+def _drop_skill_duplicates(conn) -> int:
+    # оставляем строку с самым поздним last_update (при равных — последнюю вставленную)
+    deleted = conn.exec_driver_sql(
+        "DELETE FROM skillscoredb WHERE rowid IN (SELECT rowid FROM (SELECT rowid, ROW_NUMBER() OVER "
+        "(PARTITION BY session_id, skill ORDER BY last_update DESC, rowid DESC) AS rn FROM skillscoredb) WHERE rn > 1)"
+    ).rowcount
+    if deleted:
+        log.warning("skillscoredb: deleted %d duplicate (session_id, skill) rows", deleted)
+    return deleted
+
+
+def _merge_usage_duplicates(conn) -> int:
+    key = "coalesce(session_id, ''), agent, provider, model, kind"
+    groups = conn.exec_driver_sql(
+        f"SELECT MIN(rowid), SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(latency_ms_total), "
+        f"MAX(latency_ms_max), SUM(cost), MAX(updated_at) FROM llmusagedb GROUP BY {key} HAVING COUNT(*) > 1"
+    ).fetchall()
+    for keep, *totals in groups:
+        conn.exec_driver_sql(
+            "UPDATE llmusagedb SET calls = ?, prompt_tokens = ?, completion_tokens = ?, latency_ms_total = ?, "
+            "latency_ms_max = ?, cost = ?, updated_at = ? WHERE rowid = ?",
+            (*totals, keep),
+        )
+    deleted = conn.exec_driver_sql(
+        f"DELETE FROM llmusagedb WHERE rowid NOT IN (SELECT MIN(rowid) FROM llmusagedb GROUP BY {key})"
+    ).rowcount
+    if deleted:
+        log.warning("llmusagedb: merged %d duplicate usage rows into %d", deleted, len(groups))
+    return deleted
+
+
+def insert_for(s: Session):
+    """insert() диалекта БД сессии — нужен для INSERT ... ON CONFLICT (bulk upsert)."""
+    return (postgresql if s.get_bind().dialect.name == "postgresql" else sqlite).insert
+
+
 def get_session():
     with Session(engine) as session:
         yield session
@@ -0,0 +1,16 @@
+class ClientLayer:
+    """
+    Слой поверх LLM-клиента (кэш, лимиты и т.п.).
+    Всё, что слой не переопределяет, делегируется внутреннему клиенту, поэтому агенты
+    продолжают вызывать client.chat / client.embed как раньше.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def stats(self) -> dict:
+        inner_stats = getattr(self.inner, "stats", None)
+        return inner_stats() if callable(inner_stats) else {}
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Awaitable, List, Dict, TypeVar
+from ..config import settings
+from ..telemetry import log_event
+from .base import ClientLayer
+from .errors import CircuitOpenError, ProviderHTTPError, ProviderConnectionError
+
+T = TypeVar("T")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def _counts_as_failure(e: BaseException) -> bool:
+    # 4xx (кроме 429) — ошибка запроса, а не провайдера; 429 разруливает rate limiter
+    if isinstance(e, ProviderConnectionError):
+        return True
+    return isinstance(e, ProviderHTTPError) and e.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    closed -> open: N ошибок подряд или доля ошибок в окне >= порога (медленный вызов = ошибка);
+    open -> half_open: через LLM_BREAKER_OPEN_S; half_open -> closed: успешные пробные вызовы,
+    half_open -> open: любая ошибка пробного вызова.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.half_open_in_flight = 0
+        self.half_open_successes = 0
+        self._window: deque[bool] = deque(maxlen=settings.llm_breaker_window)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+        self._events: List[dict] = []
+
+    def _transition(self, state: str) -> None:
+        prev, self.state = self.state, state
+        key = f"{prev}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state in (CLOSED, HALF_OPEN):
+            self.half_open_in_flight = 0
+            self.half_open_successes = 0
+        if state == CLOSED:
+            self.consecutive_failures = 0
+            self._window.clear()
+        self._events.append({"breaker": self.name, "from": prev, "to": state})
+
+    def _flush_events(self) -> None:
+        # Пишем в EventLogDB вне лока: смена состояния редкая, а запись в БД может быть медленной
+        with self._lock:
+            events, self._events = self._events, []
+        for ev in events:
+            try:
+                log_event("circuit", ev)
+            except Exception:
+                pass
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= settings.llm_breaker_open_s:
+                self._transition(HALF_OPEN)
+            allowed = self.state == CLOSED
+            if self.state == HALF_OPEN and self.half_open_in_flight < settings.llm_breaker_half_open_calls:
+                self.half_open_in_flight += 1
+                allowed = True
+            if not allowed:
+                self.rejected += 1
+        self._flush_events()
+        if not allowed:
+            raise CircuitOpenError(f"circuit open: {self.name}")
+
+    def release(self) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+
+    def on_result(self, latency_s: float, error: BaseException | None) -> None:
+        failed = (error is not None and _counts_as_failure(error)) or latency_s > settings.llm_breaker_slow_call_s
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.half_open_in_flight = max(0, self.half_open_in_flight - 1)
+                if failed:
+                    self._transition(OPEN)
+                else:
+                    self.half_open_successes += 1
+                    if self.half_open_successes >= settings.llm_breaker_half_open_calls:
+                        self._transition(CLOSED)
+            elif self.state == CLOSED:
+                self._record_closed(failed)
+        self._flush_events()
+
+    def _record_closed(self, failed: bool) -> None:
+        self._window.append(failed)
+        self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+        errors = sum(self._window)
+        if self.consecutive_failures >= settings.llm_breaker_failure_threshold or (
+            len(self._window) >= settings.llm_breaker_min_calls
+            and errors / len(self._window) >= settings.llm_breaker_error_rate
+        ):
+            self._transition(OPEN)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "window_error_rate": round(sum(self._window) / len(self._window), 3) if self._window else 0.0,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+class CircuitBreakerClient(ClientLayer):
+    """Отдельный breaker на каждый эндпоинт провайдера (chat, embed): при open — мгновенный CircuitOpenError."""
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        provider = getattr(inner, "provider", "")
+        self.breakers = {ep: CircuitBreaker(f"{provider}:{ep}") for ep in ("chat", "embed")}
+
+    def _call(self, endpoint: str, fn: Callable[[], T]) -> T:
+        br = self.breakers[endpoint]
+        br.acquire()
+        t0 = time.perf_counter()
+        try:
+            out = fn()
+        except Exception as e:
+            br.on_result(time.perf_counter() - t0, e)
+            raise
+        br.on_result(time.perf_counter() - t0, None)
+        return out
+
+    async def _acall(self, endpoint: str, fn: Callable[[], Awaitable[T]]) -> T:
+        br = self.breakers[endpoint]
+        br.acquire()
+        t0 = time.perf_counter()
+        try:
+            out = await fn()
+        except asyncio.CancelledError:
+            # Отмена (таймаут агента, проигравший хедж) — не ответ провайдера: слот half-open освобождаем, исход не пишем
+            br.release()
+            raise
+        except Exception as e:
+            br.on_result(time.perf_counter() - t0, e)
+            raise
+        br.on_result(time.perf_counter() - t0, None)
+        return out
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return self._call(
+            "chat",
+            lambda: self.inner.chat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return await self._acall(
+            "chat",
+            lambda: self.inner.achat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        br = self.breakers["chat"]
+        br.acquire()
+        t0 = time.perf_counter()
+        started = False
+        try:
+            async for chunk in self.inner.astream_chat(messages, temperature=temperature):
+                if not started:
+                    started = True
+                    # для стрима здоровье провайдера — время до первого токена
+                    br.on_result(time.perf_counter() - t0, None)
+                yield chunk
+            if not started:
+                started = True
+                br.on_result(time.perf_counter() - t0, None)
+        except Exception as e:
+            if not started:
+                started = True
+                br.on_result(time.perf_counter() - t0, e)
+            raise
+        finally:
+            if not started:
+                # отмена или закрытие стрима до первого токена — исход не пишем
+                br.release()
+
+    def embed(self, texts: List[str], call: Callable | None = None) -> List[List[float]]:
+        if call is not None:
+            # Поэлементный эмбеддинг (Yandex): breaker на каждый запрос, внутри ретраев rate limiter
+            return self.inner.embed(texts, call=lambda fn: call(lambda: self._call("embed", fn)))
+        return self._call("embed", lambda: self.inner.embed(texts))
+
+    async def aembed(self, texts: List[str], call: Callable | None = None) -> List[List[float]]:
+        if call is not None:
+            return await self.inner.aembed(texts, call=lambda fn: call(lambda: self._acall("embed", fn)))
+        return await self._acall("embed", lambda: self.inner.aembed(texts))
+
+    def stats(self) -> dict:
+        provider = getattr(self.inner, "provider", "")
+        return super().stats() | {"circuit": {f"{provider}:{ep}": b.stats() for ep, b in self.breakers.items()}}
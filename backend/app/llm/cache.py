@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, List, Dict
+from ..config import settings
+from .base import ClientLayer
+
+# Проверка ответа перед записью в кэш, которую задаёт вызывающий агент (например, теггер — что в ответе есть уровень).
+# Передаётся через контекст, как agent_scope, чтобы не протаскивать аргумент через все слои клиента.
+_validator: contextvars.ContextVar[Callable[[str], bool] | None] = contextvars.ContextVar(
+    "llm_cache_validator", default=None
+)
+
+# last_access дисковых попаданий пишем пачкой, а не коммитом на каждое попадание
+TOUCH_BATCH = 64
+
+
+@contextmanager
+def cache_only_if(check: Callable[[str], bool]):
+    token = _validator.set(check)
+    try:
+        yield
+    finally:
+        _validator.reset(token)
+
+
+class ResponseCache:
+    """In-memory LRU поверх SQLite-хранилища. TTL + ограничение по числу записей."""
+
+    def __init__(self, path: str, ttl_s: float, max_entries: int, mem_entries: int):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.mem_entries = mem_entries
+        self._mem: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.mem_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache(last_access)")
+        self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: str) -> None:
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    def _get_mem(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item and item[0] > now:
+                self._mem.move_to_end(key)
+                self.mem_hits += 1
+                return item[1]
+            return None
+
+    def _get_disk(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            self._mem.pop(key, None)
+            row = self._db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._db.commit()
+                self._remember(key, row[1], row[0])
+                self.disk_hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def get(self, key: str) -> str | None:
+        hit = self._get_mem(key)
+        return hit if hit is not None else self._get_disk(key)
+
+    async def aget(self, key: str) -> str | None:
+        """Память проверяем на event loop, SQLite — в потоке."""
+        hit = self._get_mem(key)
+        return hit if hit is not None else await asyncio.to_thread(self._get_disk, key)
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_s
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._touched.pop(key, None)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._flush_touched()
+            self._writes += 1
+            # Эвикцию делаем не на каждой записи — COUNT(*) по большой таблице не бесплатен
+            if self._writes % 100 == 0:
+                self._evict(now)
+            self._db.commit()
+
+    async def aset(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", [(ts, k) for k, ts in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self, now: float) -> None:
+        cur = self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        self.evictions += cur.rowcount
+        (count,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            cur = self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            (size,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            hits = self.mem_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "hits": hits,
+                "mem_hits": self.mem_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / total) if total else None,
+                "evictions": self.evictions,
+                "mem_size": len(self._mem),
+                "disk_size": size,
+            }
+
+
+class CachedClient(ClientLayer):
+    """Кэширует детерминированные (temperature <= LLM_CACHE_MAX_TEMPERATURE) ответы chat."""
+
+    def __init__(self, inner, cache: ResponseCache):
+        super().__init__(inner)
+        self.cache = cache
+
+    def _key(
+        self,
+        messages: List[Dict],
+        temperature: float,
+        tools: List[Dict] | None,
+        response_format: Dict | None,
+    ) -> str | None:
+        if temperature > settings.llm_cache_max_temperature:
+            return None
+        payload = {
+            "provider": getattr(self.inner, "provider", ""),
+            "model": getattr(self.inner, "chat_model", ""),
+            "messages": messages,
+            "temperature": temperature,
+            "tools": tools,
+            "response_format": response_format,
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cacheable(resp: str, response_format: Dict | None) -> bool:
+        """
+        Пустой ответ, невалидный JSON при JSON-режиме и ответ, не прошедший проверку агента (cache_only_if),
+        не кэшируем — иначе ошибка повторялась бы весь TTL.
+        """
+        if not resp:
+            return False
+        if response_format and response_format.get("type") in ("json_object", "json_schema"):
+            try:
+                js = json.loads(resp)
+            except ValueError:
+                return False
+            if response_format.get("type") == "json_object" and not isinstance(js, dict):
+                return False
+        check = _validator.get()
+        return check is None or bool(check(resp))
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        key = self._key(messages, temperature, tools, response_format)
+        if key:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+        resp = self.inner.chat(messages, temperature=temperature, tools=tools, response_format=response_format)
+        if key and self._cacheable(resp, response_format):
+            self.cache.set(key, resp)
+        return resp
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        key = self._key(messages, temperature, tools, response_format)
+        if key:
+            hit = await self.cache.aget(key)
+            if hit is not None:
+                return hit
+        resp = await self.inner.achat(messages, temperature=temperature, tools=tools, response_format=response_format)
+        if key and self._cacheable(resp, response_format):
+            await self.cache.aset(key, resp)
+        return resp
+
+    def stats(self) -> dict:
+        return super().stats() | {"response_cache": self.cache.stats()}
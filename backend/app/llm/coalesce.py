@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, List, Dict
+from .base import ClientLayer
+
+
+class _Flight:
+    """Один in-flight вызов для потоков: лидер выполняет, остальные ждут event."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlightClient(ClientLayer):
+    """
+    Схлопывает одновременные одинаковые chat/embed-запросы (ключ — нормализованный payload):
+    к провайдеру уходит один вызов, его результат или ошибку получают все ожидающие.
+    Потоки и asyncio-корутины обслуживаются раздельно; стрим не схлопывается.
+    """
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _key(self, kind: str, payload: Dict) -> str:
+        payload = payload | {
+            "kind": kind,
+            "provider": getattr(self.inner, "provider", ""),
+            "model": getattr(self.inner, "embed_model" if kind == "embed" else "chat_model", ""),
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    async def _ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        # Общий вызов — отдельная задача: отмена (timeout) одного ожидающего не отменяет его для остальных.
+        # Future привязан к своему event loop — ключуем и по нему.
+        key = f"{id(asyncio.get_running_loop())}:{key}"
+        with self._lock:
+            task = self._tasks.get(key)
+            follower = task is not None
+            if follower:
+                self.coalesced += 1
+            else:
+                task = self._tasks[key] = asyncio.ensure_future(fn())
+                self.leaders += 1
+                task.add_done_callback(lambda t, k=key: self._adone(k, t))
+        return await asyncio.shield(task), follower
+
+    def _adone(self, key: str, task: asyncio.Future) -> None:
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            # ошибку могли не забрать, если все ожидающие ушли по таймауту
+            task.exception()
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        key = self._key(
+            "chat",
+            {"messages": messages, "temperature": temperature, "tools": tools, "response_format": response_format},
+        )
+        resp, _ = self._do(
+            key,
+            lambda: self.inner.chat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+        return resp
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        key = self._key(
+            "chat",
+            {"messages": messages, "temperature": temperature, "tools": tools, "response_format": response_format},
+        )
+        resp, _ = await self._ado(
+            key,
+            lambda: self.inner.achat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+        return resp
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        embs, shared = self._do(self._key("embed", {"texts": texts}), lambda: self.inner.embed(texts))
+        # списки общие у всех ожидающих — отдаём копии, чтобы никто не испортил чужой результат
+        return [list(e) for e in embs] if shared else embs
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        embs, shared = await self._ado(self._key("embed", {"texts": texts}), lambda: self.inner.aembed(texts))
+        return [list(e) for e in embs] if shared else embs
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights) + len(self._tasks)
+        return super().stats() | {
+            "single_flight": {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": in_flight}
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import List
+import numpy as np
+from .base import ClientLayer
+
+
+class EmbeddingCache:
+    """
+    Content-addressed кэш эмбеддингов: LRU в памяти + компактное float32-хранилище в SQLite.
+    Ключ — sha256(provider, embed_model, text).
+    """
+
+    def __init__(self, path: str, max_entries: int, mem_entries: int):
+        self.max_entries = max_entries
+        self.mem_entries = mem_entries
+        self._mem: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.mem_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings(last_access)")
+        self._db.commit()
+
+    @staticmethod
+    def key(provider: str, model: str, text: str) -> str:
+        return hashlib.sha256(f"{provider}\x00{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._mem[key] = vec
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    def _get_mem(self, keys: List[str]) -> tuple[dict[str, np.ndarray], List[str]]:
+        found: dict[str, np.ndarray] = {}
+        on_disk: List[str] = []
+        with self._lock:
+            for k in keys:
+                vec = self._mem.get(k)
+                if vec is not None:
+                    self._mem.move_to_end(k)
+                    found[k] = vec
+                    self.mem_hits += 1
+                else:
+                    on_disk.append(k)
+        return found, on_disk
+
+    def _get_disk(self, keys: List[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            marks = ",".join("?" * len(keys))
+            rows = self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", keys).fetchall()
+            for k, blob in rows:
+                vec = np.frombuffer(blob, dtype=np.float32)
+                found[k] = vec
+                self._remember(k, vec)
+            if rows:
+                self._db.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k, _ in rows]
+                )
+                self._db.commit()
+            self.disk_hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return found
+
+    def get_many(self, keys: List[str]) -> dict[str, np.ndarray]:
+        found, on_disk = self._get_mem(keys)
+        return found | self._get_disk(on_disk)
+
+    async def aget_many(self, keys: List[str]) -> dict[str, np.ndarray]:
+        """Память проверяем на event loop, SQLite — в потоке и только если есть промахи."""
+        found, on_disk = self._get_mem(keys)
+        if on_disk:
+            found |= await asyncio.to_thread(self._get_disk, on_disk)
+        return found
+
+    def set_many(self, items: dict[str, np.ndarray], dim: int | None = None) -> None:
+        """Пустые векторы и векторы не той размерности (dim) не сохраняем."""
+        items = {k: v for k, v in items.items() if v.size and (dim is None or v.size == dim)}
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for k, vec in items.items():
+                self._remember(k, vec)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, vec, last_access) VALUES (?, ?, ?)",
+                [(k, vec.astype(np.float32).tobytes(), now) for k, vec in items.items()],
+            )
+            self._writes += len(items)
+            if self._writes >= 100:
+                self._writes = 0
+                self._evict()
+            self._db.commit()
+
+    async def aset_many(self, items: dict[str, np.ndarray], dim: int | None = None) -> None:
+        await asyncio.to_thread(self.set_many, items, dim)
+
+    def _evict(self) -> None:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            cur = self._db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            (size,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            hits = self.mem_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "hits": hits,
+                "mem_hits": self.mem_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / total) if total else None,
+                "evictions": self.evictions,
+                "mem_size": len(self._mem),
+                "disk_size": size,
+            }
+
+
+class CachedEmbedClient(ClientLayer):
+    """embed/aembed через EmbeddingCache: к провайдеру уходят только недостающие тексты, одним батчем."""
+
+    def __init__(self, inner, cache: EmbeddingCache):
+        super().__init__(inner)
+        self.cache = cache
+        # Размерность модели: берём из первого попадания или самого частого размера в ответе провайдера
+        self.dim: int | None = None
+
+    def _keys(self, texts: List[str]) -> List[str]:
+        provider = getattr(self.inner, "provider", "")
+        model = getattr(self.inner, "embed_model", "")
+        return [EmbeddingCache.key(provider, model, t) for t in texts]
+
+    @staticmethod
+    def _missing(texts: List[str], keys: List[str], found: dict) -> dict[str, str]:
+        # key -> text, без дублей (одинаковые тексты эмбеддим один раз)
+        return {k: t for k, t in zip(keys, texts) if k not in found}
+
+    def _fresh(self, missing: dict[str, str], embs: List[List[float]], found: dict) -> dict[str, np.ndarray]:
+        fresh = {k: np.asarray(e, dtype=np.float32).ravel() for k, e in zip(missing.keys(), embs)}
+        if self.dim is None:
+            sizes = Counter(v.size for v in (*found.values(), *fresh.values()) if v.size)
+            self.dim = sizes.most_common(1)[0][0] if sizes else None
+        found.update(fresh)
+        return fresh
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys(texts)
+        found = self.cache.get_many(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            fresh = self._fresh(missing, self.inner.embed(list(missing.values())), found)
+            self.cache.set_many(fresh, self.dim)
+        return [found[k].tolist() for k in keys]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        keys = self._keys(texts)
+        found = await self.cache.aget_many(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            fresh = self._fresh(missing, await self.inner.aembed(list(missing.values())), found)
+            await self.cache.aset_many(fresh, self.dim)
+        return [found[k].tolist() for k in keys]
+
+    def stats(self) -> dict:
+        return super().stats() | {"embedding_cache": self.cache.stats()}
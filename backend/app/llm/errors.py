@@ -1,3 +1,9 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import httpx
+import requests
+
+
 class LLMError(Exception):
     """Base class for provider-related errors."""
     pass
@@ -5,13 +11,63 @@ class LLMError(Exception):
 
 class RateLimitError(LLMError):
     """Provider returned 429 / rate limited."""
-    pass
+
+    def __init__(self, message: str = "Provider rate limited", retry_after: float | None = None):
+        self.retry_after = retry_after
+        super().__init__(message)
 
 
 class ProviderHTTPError(LLMError):
     """Non-429 HTTP error from provider."""
 
-    def __init__(self, status_code: int, body: str | None = None):
+    def __init__(self, status_code: int, body: str | None = None, retry_after: float | None = None):
         self.status_code = status_code
         self.body = (body or "").strip()
+        self.retry_after = retry_after
         super().__init__(f"Provider HTTP {status_code}: {self.body[:200]}")
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code >= 500
+
+
+class ProviderConnectionError(LLMError):
+    """Network error / timeout talking to provider."""
+    pass
+
+
+class CircuitOpenError(LLMError):
+    """Circuit breaker провайдера открыт — вызов отклонён без обращения к сети."""
+    pass
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After: секунды или HTTP-date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())
+
+
+def check_response(r: requests.Response | httpx.Response) -> None:
+    """Вместо raise_for_status(): 429 -> RateLimitError, прочие 4xx/5xx -> ProviderHTTPError."""
+    if r.status_code < 400:
+        return
+    retry_after = parse_retry_after(r.headers.get("Retry-After"))
+    if r.status_code == 429:
+        raise RateLimitError(f"Provider HTTP 429: {r.text[:200]}", retry_after=retry_after)
+    raise ProviderHTTPError(r.status_code, r.text, retry_after=retry_after)
+
+
+# Сетевые ошибки обоих HTTP-стеков (requests для sync, httpx для async)
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, httpx.TransportError)
@@ -1,39 +1,126 @@
+import json
+import time
 import requests
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict
 from ..config import settings
+from .errors import check_response, ProviderConnectionError, TRANSPORT_ERRORS
+from .http import get_async_client
+from .usage import record_usage
 
 API_URL = "https://api.mistral.ai/v1"
 
 
 class MistralClient:
+    provider = "mistral"
+
     def __init__(self, api_key: str | None = None):
         self.api_key = api_key or settings.mistral_api_key
+        self.api_url = (settings.mistral_api_url or API_URL).rstrip("/")
         self.chat_model = settings.mistral_chat_model
         self.embed_model = settings.mistral_embed_model
+        self.headers = {"Authorization": f"Bearer {self.api_key}"}
         self.session = requests.Session()
-        self.session.headers.update({"Authorization": f"Bearer {self.api_key}"})
+        self.session.headers.update(self.headers)
 
-    def chat(
+    def _post(self, path: str, payload: Dict) -> Dict:
+        try:
+            r = self.session.post(f"{self.api_url}{path}", json=payload, timeout=settings.llm_timeout_s)
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        check_response(r)
+        return r.json()
+
+    async def _apost(self, path: str, payload: Dict) -> Dict:
+        try:
+            r = await get_async_client().post(f"{self.api_url}{path}", json=payload, headers=self.headers)
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        check_response(r)
+        return r.json()
+
+    def _record(self, kind: str, model: str, js: Dict, t0: float) -> None:
+        u = js.get("usage") or {}
+        record_usage(
+            self.provider, model, kind, u.get("prompt_tokens", 0), u.get("completion_tokens", 0),
+            time.perf_counter() - t0,
+        )
+
+    def _chat_payload(
         self,
         messages: List[Dict],
-        temperature: float = 0.2,
-        tools: List[Dict] | None = None,
-        response_format: Dict | None = None,
-    ) -> str:
+        temperature: float,
+        tools: List[Dict] | None,
+        response_format: Dict | None,
+    ) -> Dict:
         payload: Dict = {"model": self.chat_model, "messages": messages, "temperature": temperature}
         if tools:
             payload["tools"] = tools
         if response_format:
             payload["response_format"] = response_format
-        r = self.session.post(f"{API_URL}/chat/completions", json=payload, timeout=60)
-        r.raise_for_status()
-        return r.json()["choices"][0]["message"]["content"]
+        return payload
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        js = self._post("/chat/completions", self._chat_payload(messages, temperature, tools, response_format))
+        self._record("chat", self.chat_model, js, t0)
+        return js["choices"][0]["message"]["content"]
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        js = await self._apost("/chat/completions", self._chat_payload(messages, temperature, tools, response_format))
+        self._record("chat", self.chat_model, js, t0)
+        return js["choices"][0]["message"]["content"]
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        """SSE-стрим chat/completions: отдаёт дельты текста по мере генерации."""
+        payload = self._chat_payload(messages, temperature, None, None) | {"stream": True}
+        t0 = time.perf_counter()
+        last: Dict = {}
+        try:
+            async with get_async_client().stream(
+                "POST", f"{self.api_url}/chat/completions", json=payload, headers=self.headers
+            ) as r:
+                if r.status_code >= 400:
+                    await r.aread()
+                    check_response(r)
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        # usage приходит в последнем чанке
+                        last = chunk
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        self._record("chat", self.chat_model, last, t0)
 
     def embed(self, texts: List[str]) -> List[List[float]]:
-        r = self.session.post(
-            f"{API_URL}/embeddings",
-            json={"model": self.embed_model, "input": texts},
-            timeout=60,
-        )
-        r.raise_for_status()
-        return [d["embedding"] for d in r.json()["data"]]
+        t0 = time.perf_counter()
+        js = self._post("/embeddings", {"model": self.embed_model, "input": texts})
+        self._record("embed", self.embed_model, js, t0)
+        return [d["embedding"] for d in js["data"]]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        t0 = time.perf_counter()
+        js = await self._apost("/embeddings", {"model": self.embed_model, "input": texts})
+        self._record("embed", self.embed_model, js, t0)
+        return [d["embedding"] for d in js["data"]]
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from typing import AsyncIterator, List, Dict
+import numpy as np
+from ..config import settings
+from .errors import RateLimitError, ProviderHTTPError
+from .usage import record_usage
+
+BLOOM = ["remember", "understand", "apply", "analyze", "evaluate", "create"]
+SOLO = ["prestructural", "unistructural", "multistructural", "relational", "extended-abstract"]
+SKILLS = ["algebra", "logic", "probability", "geometry", "calculus"]
+
+
+def _digest(*parts: str) -> int:
+    return int(hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16], 16)
+
+
+class MockClient:
+    """
+    Локальный офлайн-провайдер для нагрузочных тестов: детерминированные ответы по содержимому запроса,
+    настраиваемые задержки (lognormal), инъекция 5xx и 429. Совместим по интерфейсу с MistralClient.
+    """
+
+    provider = "mock"
+
+    def __init__(self, seed: int | None = None):
+        self.chat_model = settings.mock_chat_model
+        self.embed_model = settings.mock_embed_model
+        self._rng = random.Random(settings.mock_seed if seed is None else seed)
+        self._lock = threading.Lock()
+
+    # --- поведение провайдера ---
+
+    def latency_s(self, median_ms: float) -> float:
+        if median_ms <= 0:
+            return 0.0
+        with self._lock:
+            z = self._rng.gauss(0.0, 1.0)
+        return median_ms * math.exp(settings.mock_latency_sigma * z) / 1000
+
+    def maybe_fail(self) -> None:
+        with self._lock:
+            r = self._rng.random()
+        if r < settings.mock_error_rate:
+            raise ProviderHTTPError(503, "mock: injected server error")
+        if r < settings.mock_error_rate + settings.mock_rate_limit_rate:
+            raise RateLimitError("mock: injected 429", retry_after=settings.mock_retry_after_s)
+
+    def complete(self, messages: List[Dict]) -> str:
+        """Детерминированный ответ: тип агента определяется по системному промпту."""
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+        h = _digest(system, user)
+        if "Judge" in system or "Assessor" in system:
+            out = {
+                "bloom_level": BLOOM[h % len(BLOOM)],
+                "score": round((h >> 8) % 101 / 100, 2),
+                "confidence": round(0.5 + (h >> 16) % 51 / 100, 2),
+                "errors": [] if (h >> 24) % 3 else ["неполное обоснование"],
+                "skills": sorted({SKILLS[(h >> 32) % len(SKILLS)], SKILLS[(h >> 40) % len(SKILLS)]}),
+            }
+            if "Assessor" in system:
+                out["solo_level"] = SOLO[(h >> 48) % len(SOLO)]
+            return json.dumps(out, ensure_ascii=False)
+        if "Bloom-Tagger" in system:
+            return BLOOM[h % len(BLOOM)]
+        if "SOLO-Tagger" in system:
+            return SOLO[h % len(SOLO)]
+        if "Summarizer" in system:
+            return "\n".join(f"{i}. Рекомендация #{(h >> i) % 1000}" for i in range(1, 6))
+        return f"Mock-вопрос #{h % 100000}: объясните ключевую идею и приведите пример."
+
+    def embedding(self, text: str) -> List[float]:
+        rng = np.random.default_rng(_digest(self.embed_model, text))
+        v = rng.standard_normal(settings.mock_embed_dim).astype(np.float32)
+        return (v / (np.linalg.norm(v) or 1.0)).tolist()
+
+    def _tokens(self, messages: List[Dict]) -> int:
+        # грубая оценка «токенов» по словам — как в mock_server
+        return sum(len(m.get("content", "").split()) for m in messages)
+
+    # --- клиентский интерфейс ---
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        time.sleep(self.latency_s(settings.mock_chat_latency_ms))
+        self.maybe_fail()
+        out = self.complete(messages)
+        record_usage(self.provider, self.chat_model, "chat", self._tokens(messages), len(out.split()), time.perf_counter() - t0)
+        return out
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.latency_s(settings.mock_chat_latency_ms))
+        self.maybe_fail()
+        out = self.complete(messages)
+        record_usage(self.provider, self.chat_model, "chat", self._tokens(messages), len(out.split()), time.perf_counter() - t0)
+        return out
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.latency_s(settings.mock_chat_latency_ms))
+        self.maybe_fail()
+        words = self.complete(messages).split(" ")
+        for i, w in enumerate(words):
+            if i:
+                await asyncio.sleep(settings.mock_token_ms / 1000)
+            yield w if i == len(words) - 1 else w + " "
+        record_usage(self.provider, self.chat_model, "chat", self._tokens(messages), len(words), time.perf_counter() - t0)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        t0 = time.perf_counter()
+        time.sleep(self.latency_s(settings.mock_embed_latency_ms))
+        self.maybe_fail()
+        record_usage(self.provider, self.embed_model, "embed", sum(len(t.split()) for t in texts), 0, time.perf_counter() - t0)
+        return [self.embedding(t) for t in texts]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        t0 = time.perf_counter()
+        await asyncio.sleep(self.latency_s(settings.mock_embed_latency_ms))
+        self.maybe_fail()
+        record_usage(self.provider, self.embed_model, "embed", sum(len(t.split()) for t in texts), 0, time.perf_counter() - t0)
+        return [self.embedding(t) for t in texts]
@@ -0,0 +1,116 @@
+"""
+Mock-провайдер как локальный HTTP-сервер в wire-формате Mistral (/v1/chat/completions, /v1/embeddings).
+
+    python -m backend.app.llm.mock_server --port 8099
+    MISTRAL_API_URL=http://127.0.0.1:8099/v1 MISTRAL_API_KEY=mock LLM_PROVIDER=mistral uvicorn backend.app.main:app
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .errors import RateLimitError, ProviderHTTPError
+from .mock_client import MockClient
+from ..config import settings
+
+mock = MockClient()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура BaseHTTPRequestHandler
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chat(self, req: dict) -> None:
+        messages = req.get("messages", [])
+        text = mock.complete(messages)
+        usage = {
+            "prompt_tokens": sum(len(m.get("content", "").split()) for m in messages),
+            "completion_tokens": len(text.split()),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not req.get("stream"):
+            self._send_json(
+                200,
+                {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "model": req.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage,
+                },
+            )
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = text.split(" ")
+        for i, w in enumerate(words):
+            delta = w if i == len(words) - 1 else w + " "
+            chunk = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+            if i == len(words) - 1:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(settings.mock_token_ms / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _embeddings(self, req: dict) -> None:
+        texts = req.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        self._send_json(
+            200,
+            {
+                "object": "list",
+                "model": req.get("model"),
+                "data": [{"index": i, "embedding": mock.embedding(t)} for i, t in enumerate(texts)],
+                "usage": {"prompt_tokens": sum(len(t.split()) for t in texts)},
+            },
+        )
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        latency_ms = settings.mock_embed_latency_ms if self.path.endswith("/embeddings") else settings.mock_chat_latency_ms
+        time.sleep(mock.latency_s(latency_ms))
+        try:
+            mock.maybe_fail()
+        except RateLimitError as e:
+            self._send_json(429, {"message": str(e)}, {"Retry-After": str(e.retry_after or 1)})
+            return
+        except ProviderHTTPError as e:
+            self._send_json(e.status_code, {"message": e.body})
+            return
+        if self.path.endswith("/chat/completions"):
+            self._chat(req)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(req)
+        else:
+            self._send_json(404, {"message": "not found"})
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Mock LLM provider (Mistral wire format)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    args = ap.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"[mock-llm] listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
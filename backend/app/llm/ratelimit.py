@@ -0,0 +1,318 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Awaitable, List, Dict, TypeVar
+from ..config import settings
+from .base import ClientLayer
+from .errors import LLMError, RateLimitError, ProviderHTTPError, ProviderConnectionError
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Token bucket с резервированием: reserve() сразу списывает токены и говорит, сколько подождать."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate)
+
+
+class AIMDLimiter:
+    """
+    Адаптивный лимит параллелизма: +1/limit на каждый успешный вызов (additive increase),
+    x0.5 на 429 (multiplicative decrease, не чаще раза в секунду).
+    Лимитер общий для потоков и event loop'ов, поэтому async-ожидающие — очередь future без опроса:
+    release() передаёт освободившийся слот первому из них через call_soon_threadsafe.
+    """
+
+    def __init__(self, initial: float, lo: float, hi: float):
+        self.limit = float(initial)
+        self.lo = float(lo)
+        self.hi = float(hi)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait(0.1)
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            fut = loop.create_future()
+            self._waiters.append((loop, fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._cond:
+                if (loop, fut) in self._waiters:
+                    self._waiters.remove((loop, fut))
+                elif fut.done() and not fut.cancelled():
+                    # слот уже передан, но задачу отменили до возобновления — возвращаем
+                    self._free_slot()
+            raise
+
+    def _free_slot(self) -> None:
+        # под self._cond
+        self.in_flight -= 1
+        self._grant_waiters()
+        self._cond.notify_all()
+
+    def _grant_waiters(self) -> None:
+        # под self._cond: слот занимаем сразу, future лишь будит ожидающего
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, fut = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._resolve, fut)
+            except RuntimeError:
+                # event loop ожидающего уже закрыт
+                self.in_flight -= 1
+
+    def _resolve(self, fut: asyncio.Future) -> None:
+        if fut.done():
+            # ожидание отменено, пока слот шёл к нему
+            with self._cond:
+                self._free_slot()
+        else:
+            fut.set_result(None)
+
+    def release(self, rate_limited: bool) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if rate_limited:
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.lo, self.limit * 0.5)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.hi, self.limit + 1.0 / self.limit)
+            self._free_slot()
+
+
+class ProviderLimiter:
+    """Лимиты одной пары (provider, model): token bucket + AIMD + счётчики."""
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.aimd = AIMDLimiter(
+            settings.llm_aimd_initial_concurrency,
+            settings.llm_aimd_min_concurrency,
+            settings.llm_aimd_max_concurrency,
+        )
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttled_s = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "rate_rps": self.bucket.rate,
+            "concurrency_limit": round(self.aimd.limit, 2),
+            "in_flight": self.aimd.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "throttled_s": round(self.throttled_s, 3),
+        }
+
+
+_limiters: dict[tuple[str, str], ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _rate_for(provider: str, model: str) -> float:
+    overrides = settings.llm_rate_limits
+    for key in (f"{provider}:{model}", provider):
+        if key in overrides:
+            return float(overrides[key])
+    return settings.llm_rate_limit_rps
+
+
+def get_limiter(provider: str, model: str) -> ProviderLimiter:
+    key = (provider, model)
+    with _limiters_lock:
+        lim = _limiters.get(key)
+        if lim is None:
+            lim = ProviderLimiter(_rate_for(provider, model), settings.llm_rate_limit_burst)
+            _limiters[key] = lim
+        return lim
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (RateLimitError, ProviderConnectionError)):
+        return True
+    return isinstance(e, ProviderHTTPError) and e.retryable
+
+
+def backoff_delay(attempt: int, e: Exception | None = None) -> float:
+    """Full-jitter экспоненциальный backoff; Retry-After от провайдера имеет приоритет."""
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is not None:
+        return min(settings.llm_backoff_max_s, retry_after) + random.uniform(0, settings.llm_backoff_base_s)
+    cap = min(settings.llm_backoff_max_s, settings.llm_backoff_base_s * (2**attempt))
+    return random.uniform(0, cap)
+
+
+def call_with_retries(lim: ProviderLimiter, fn: Callable[[], T], cost: float, retries: int) -> T:
+    for attempt in range(retries + 1):
+        wait = lim.bucket.reserve(cost)
+        if wait:
+            lim.throttled_s += wait
+            time.sleep(wait)
+        lim.aimd.acquire()
+        lim.calls += 1
+        rate_limited = False
+        try:
+            return fn()
+        except LLMError as e:
+            rate_limited = isinstance(e, RateLimitError)
+            if rate_limited:
+                lim.rate_limited += 1
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            lim.aimd.release(rate_limited)
+        lim.retries += 1
+        time.sleep(delay)
+    raise LLMError("unreachable")
+
+
+async def acall_with_retries(
+    lim: ProviderLimiter, fn: Callable[[], Awaitable[T]], cost: float, retries: int
+) -> T:
+    for attempt in range(retries + 1):
+        wait = lim.bucket.reserve(cost)
+        if wait:
+            lim.throttled_s += wait
+            await asyncio.sleep(wait)
+        await lim.aimd.aacquire()
+        lim.calls += 1
+        rate_limited = False
+        try:
+            return await fn()
+        except LLMError as e:
+            rate_limited = isinstance(e, RateLimitError)
+            if rate_limited:
+                lim.rate_limited += 1
+            if attempt >= retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            lim.aimd.release(rate_limited)
+        lim.retries += 1
+        await asyncio.sleep(delay)
+    raise LLMError("unreachable")
+
+
+class RateLimitedClient(ClientLayer):
+    """Клиентский rate limit per (provider, model) + ретраи 429/5xx с учётом Retry-After."""
+
+    def _limiter(self, model: str) -> ProviderLimiter:
+        return get_limiter(getattr(self.inner, "provider", ""), model)
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return call_with_retries(
+            self._limiter(self.inner.chat_model),
+            lambda: self.inner.chat(messages, temperature=temperature, tools=tools, response_format=response_format),
+            cost=1.0,
+            retries=settings.llm_max_retries,
+        )
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return await acall_with_retries(
+            self._limiter(self.inner.chat_model),
+            lambda: self.inner.achat(messages, temperature=temperature, tools=tools, response_format=response_format),
+            cost=1.0,
+            retries=settings.llm_max_retries,
+        )
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        # Ретраим только до первого токена: начатый стрим повторить прозрачно нельзя
+        lim = self._limiter(self.inner.chat_model)
+        for attempt in range(settings.llm_max_retries + 1):
+            wait = lim.bucket.reserve(1.0)
+            if wait:
+                lim.throttled_s += wait
+                await asyncio.sleep(wait)
+            await lim.aimd.aacquire()
+            lim.calls += 1
+            started = False
+            rate_limited = False
+            try:
+                async for chunk in self.inner.astream_chat(messages, temperature=temperature):
+                    started = True
+                    yield chunk
+                return
+            except LLMError as e:
+                rate_limited = isinstance(e, RateLimitError)
+                if rate_limited:
+                    lim.rate_limited += 1
+                if started or attempt >= settings.llm_max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, e)
+            finally:
+                lim.aimd.release(rate_limited)
+            lim.retries += 1
+            await asyncio.sleep(delay)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        lim = self._limiter(self.inner.embed_model)
+        if getattr(self.inner, "embed_per_text", False):
+            # Провайдер без батчевого API (Yandex) шлёт запрос на каждый текст: токен, AIMD и ретраи — на запрос
+            retries = self.inner.embed_item_retries
+            return self.inner.embed(texts, call=lambda fn: call_with_retries(lim, fn, 1.0, retries))
+        return call_with_retries(lim, lambda: self.inner.embed(texts), 1.0, settings.llm_max_retries)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        lim = self._limiter(self.inner.embed_model)
+        if getattr(self.inner, "embed_per_text", False):
+            retries = self.inner.embed_item_retries
+            return await self.inner.aembed(texts, call=lambda fn: acall_with_retries(lim, fn, 1.0, retries))
+        return await acall_with_retries(lim, lambda: self.inner.aembed(texts), 1.0, settings.llm_max_retries)
+
+    def stats(self) -> dict:
+        provider = getattr(self.inner, "provider", "")
+        own = {f"{p}:{m}": lim.stats() for (p, m), lim in list(_limiters.items()) if p == provider}
+        return super().stats() | {"rate_limits": own}
@@ -1,9 +1,349 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import AsyncIterator, Callable, Awaitable, List, Dict, TypeVar
 from .mistral_client import MistralClient
 from .yandex_client import YandexGPTClient
+from .mock_client import MockClient
+from .base import ClientLayer
+from .ratelimit import RateLimitedClient
+from .breaker import CircuitBreakerClient
+from .cache import CachedClient, ResponseCache
+from .embed_cache import CachedEmbedClient, EmbeddingCache
+from .coalesce import SingleFlightClient
 from ..config import settings
 
-provider = (settings.llm_provider or "mistral").lower()
-if provider == "yandex":
-    client = YandexGPTClient()
-else:
-    client = MistralClient()
+T = TypeVar("T")
+
+
+def _base_client(provider: str):
+    if provider == "yandex":
+        return YandexGPTClient()
+    if provider == "mock":
+        return MockClient()
+    return MistralClient()
+
+
+def _build_client(provider: str):
+    c = _base_client(provider)
+    if settings.llm_breaker_enabled:
+        # Breaker внутри rate limiter: ожидание токена и backoff не входят в latency вызова,
+        # а каждая попытка ретрая учитывается отдельно
+        c = CircuitBreakerClient(c)
+    c = RateLimitedClient(c)
+    if settings.llm_cache_enabled:
+        c = CachedClient(
+            c,
+            ResponseCache(
+                settings.llm_cache_path,
+                ttl_s=settings.llm_cache_ttl_s,
+                max_entries=settings.llm_cache_max_entries,
+                mem_entries=settings.llm_cache_mem_entries,
+            ),
+        )
+    if settings.embed_cache_enabled:
+        c = CachedEmbedClient(
+            c,
+            EmbeddingCache(
+                settings.embed_cache_path,
+                max_entries=settings.embed_cache_max_entries,
+                mem_entries=settings.embed_cache_mem_entries,
+            ),
+        )
+    if settings.llm_coalesce_enabled:
+        # снаружи кэшей: пока первый запрос не записал ответ в кэш, одинаковые ждут его, а не идут к провайдеру
+        c = SingleFlightClient(c)
+    return c
+
+
+class ProviderHealth:
+    """Скользящее окно (latency, ok) по последним LLM_ROUTER_WINDOW вызовам одного провайдера/эндпоинта."""
+
+    def __init__(self, window: int):
+        self._samples: deque[tuple[float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_s: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((latency_s, ok))
+
+    def _snapshot(self) -> tuple[list[float], float]:
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return [], 0.0
+        lat = sorted(l for l, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        return lat, errors / len(samples)
+
+    @staticmethod
+    def _pct(lat: list[float], q: float) -> float:
+        return lat[min(len(lat) - 1, int(q * len(lat)))] if lat else 0.0
+
+    def ready(self) -> bool:
+        with self._lock:
+            return len(self._samples) >= settings.llm_router_min_samples
+
+    def score(self) -> float:
+        """Чем меньше, тем здоровее: p95 + штраф за долю ошибок."""
+        lat, err = self._snapshot()
+        return self._pct(lat, 0.95) + err * settings.llm_router_error_penalty_s
+
+    def stats(self) -> dict:
+        lat, err = self._snapshot()
+        return {
+            "samples": len(lat),
+            "p50_ms": round(self._pct(lat, 0.5) * 1000, 1),
+            "p95_ms": round(self._pct(lat, 0.95) * 1000, 1),
+            "error_rate": round(err, 4),
+        }
+
+
+class LLMRouter(ClientLayer):
+    """
+    Маршрутизация между провайдерами: каждый chat уходит самому здоровому провайдеру
+    (по p95 и доле ошибок), при ошибке — failover на следующий, медленный вызов
+    опционально хеджируется вторым запросом (LLM_HEDGE_AFTER_MS).
+    Эмбеддинги по умолчанию привязаны к основному провайдеру: индекс в Chroma построен в его пространстве.
+    """
+
+    def __init__(self, stacks: Dict[str, object], primary: str):
+        super().__init__(stacks[primary])
+        self.stacks = stacks
+        self.primary = primary
+        self.health: Dict[tuple[str, str], ProviderHealth] = {
+            (name, ep): ProviderHealth(settings.llm_router_window) for name in stacks for ep in ("chat", "embed")
+        }
+        self.failovers = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        self._hedge_losers: weakref.WeakSet[asyncio.Task] = weakref.WeakSet()
+
+    def _ranked(self, endpoint: str) -> List[str]:
+        if endpoint == "embed" and not settings.llm_embed_failover:
+            return [self.primary]
+        names = [self.primary] + [n for n in self.stacks if n != self.primary]
+        ready = [n for n in names if self.health[(n, endpoint)].ready()]
+        if self.primary not in ready:
+            return names
+        # Без замеров оценка 0 выглядела бы лучшей: непроверенные провайдеры идут после ранжированных, в порядке
+        # конфига. sorted стабилен: при равных оценках основной провайдер остаётся первым
+        ranked = sorted(ready, key=lambda n: self.health[(n, endpoint)].score())
+        return ranked + [n for n in names if n not in ready]
+
+    def _hedge_delay(self, names: List[str]) -> float | None:
+        if settings.llm_hedge_after_ms <= 0 or len(names) < 2:
+            return None
+        return settings.llm_hedge_after_ms / 1000
+
+    # --- sync ---
+
+    def _timed(self, name: str, endpoint: str, fn: Callable[[object], T]) -> T:
+        t0 = time.perf_counter()
+        try:
+            out = fn(self.stacks[name])
+        except Exception:
+            self.health[(name, endpoint)].record(time.perf_counter() - t0, False)
+            raise
+        self.health[(name, endpoint)].record(time.perf_counter() - t0, True)
+        return out
+
+    def _hedged(self, names: List[str], endpoint: str, fn: Callable[[object], T], delay: float) -> T:
+        first = self._hedge_pool.submit(self._timed, names[0], endpoint, fn)
+        done, _ = wait([first], timeout=delay)
+        if done and first.exception() is None:
+            return first.result()
+        if done:
+            # основной упал быстрее порога хеджирования — обычный failover
+            self.failovers += 1
+            pending = set()
+        else:
+            self.hedged += 1
+            pending = {first}
+        second = self._hedge_pool.submit(self._timed, names[1], endpoint, fn)
+        pending.add(second)
+        error = first.exception() if done else None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is second and first in pending:
+                        self.hedge_wins += 1
+                    return fut.result()
+                error = fut.exception()
+        raise error  # type: ignore[misc]
+
+    def _route(self, endpoint: str, fn: Callable[[object], T]) -> T:
+        names = self._ranked(endpoint)
+        delay = self._hedge_delay(names) if endpoint == "chat" else None
+        if delay is not None:
+            try:
+                return self._hedged(names, endpoint, fn, delay)
+            except Exception:
+                if len(names) <= 2:
+                    raise
+                self.failovers += 1
+                names = names[2:]
+        error: Exception | None = None
+        for i, name in enumerate(names):
+            if i:
+                self.failovers += 1
+            try:
+                return self._timed(name, endpoint, fn)
+            except Exception as e:
+                error = e
+        raise error  # type: ignore[misc]
+
+    # --- async ---
+
+    async def _atimed(self, name: str, endpoint: str, fn: Callable[[object], Awaitable[T]]) -> T:
+        t0 = time.perf_counter()
+        try:
+            out = await fn(self.stacks[name])
+        except asyncio.CancelledError:
+            # Проигравший хедж снят нами: вызов не завершился, ни успеха, ни latency у него нет.
+            # Таймаут агента — latency не меньше прошедшего времени, пишем как нижнюю оценку
+            if asyncio.current_task() not in self._hedge_losers:
+                self.health[(name, endpoint)].record(time.perf_counter() - t0, True)
+            raise
+        except Exception:
+            self.health[(name, endpoint)].record(time.perf_counter() - t0, False)
+            raise
+        self.health[(name, endpoint)].record(time.perf_counter() - t0, True)
+        return out
+
+    async def _ahedged(
+        self, names: List[str], endpoint: str, fn: Callable[[object], Awaitable[T]], delay: float
+    ) -> T:
+        first = asyncio.ensure_future(self._atimed(names[0], endpoint, fn))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done and first.exception() is None:
+            return first.result()
+        if done:
+            self.failovers += 1
+            pending = set()
+        else:
+            self.hedged += 1
+            pending = {first}
+        second = asyncio.ensure_future(self._atimed(names[1], endpoint, fn))
+        pending.add(second)
+        error: BaseException | None = first.exception() if done else None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second and first in pending:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                self._hedge_losers.add(task)
+                task.cancel()
+        raise error  # type: ignore[misc]
+
+    async def _aroute(self, endpoint: str, fn: Callable[[object], Awaitable[T]]) -> T:
+        names = self._ranked(endpoint)
+        delay = self._hedge_delay(names) if endpoint == "chat" else None
+        if delay is not None:
+            try:
+                return await self._ahedged(names, endpoint, fn, delay)
+            except Exception:
+                if len(names) <= 2:
+                    raise
+                self.failovers += 1
+                names = names[2:]
+        error: Exception | None = None
+        for i, name in enumerate(names):
+            if i:
+                self.failovers += 1
+            try:
+                return await self._atimed(name, endpoint, fn)
+            except Exception as e:
+                error = e
+        raise error  # type: ignore[misc]
+
+    # --- client API ---
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return self._route(
+            "chat",
+            lambda c: c.chat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        return await self._aroute(
+            "chat",
+            lambda c: c.achat(messages, temperature=temperature, tools=tools, response_format=response_format),
+        )
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        """Стрим без хеджирования; failover возможен только до первого токена."""
+        error: Exception | None = None
+        for i, name in enumerate(self._ranked("chat")):
+            if i:
+                self.failovers += 1
+            health = self.health[(name, "chat")]
+            t0 = time.perf_counter()
+            started = False
+            try:
+                async for chunk in self.stacks[name].astream_chat(messages, temperature=temperature):
+                    if not started:
+                        started = True
+                        # для стрима здоровье меряем по времени до первого токена
+                        health.record(time.perf_counter() - t0, True)
+                    yield chunk
+                if not started:
+                    health.record(time.perf_counter() - t0, True)
+                return
+            except Exception as e:
+                if started:
+                    raise
+                health.record(time.perf_counter() - t0, False)
+                error = e
+        raise error  # type: ignore[misc]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._route("embed", lambda c: c.embed(texts))
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await self._aroute("embed", lambda c: c.aembed(texts))
+
+    def stats(self) -> dict:
+        return {
+            "router": {
+                "primary": self.primary,
+                "failovers": self.failovers,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "health": {f"{n}:{ep}": h.stats() for (n, ep), h in self.health.items()},
+            },
+            "providers": {name: getattr(c, "stats", dict)() for name, c in self.stacks.items()},
+        }
+
+
+def _provider_names() -> List[str]:
+    primary = (settings.llm_provider or "mistral").lower()
+    extra = [p.strip().lower() for p in settings.llm_providers.split(",") if p.strip()]
+    return [primary] + [p for p in extra if p != primary]
+
+
+provider = _provider_names()[0]
+client = LLMRouter({name: _build_client(name) for name in _provider_names()}, primary=provider)
@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Tuple
+from sqlalchemy import case
+from sqlmodel import Session
+from ..config import settings
+from ..models import uuid_str
+
+# Кто и в рамках какой сессии вызывает LLM. Агенты выставляют agent_scope, оркестратор — session_scope;
+# asyncio-задачи и asyncio.to_thread наследуют контекст автоматически.
+_agent: contextvars.ContextVar[str] = contextvars.ContextVar("llm_agent", default="other")
+_session_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("llm_session_id", default=None)
+
+# (session_id, agent, provider, model, kind)
+Key = Tuple[str | None, str, str, str, str]
+
+
+@contextmanager
+def _scope(var: contextvars.ContextVar, value):
+    token = var.set(value)
+    try:
+        yield
+    finally:
+        try:
+            var.reset(token)
+        except ValueError:
+            # async-генератор закрыт из другого контекста — переменная там и не выставлялась
+            pass
+
+
+def agent_scope(name: str):
+    return _scope(_agent, name)
+
+
+def session_scope(session_id: str | None):
+    return _scope(_session_id, session_id)
+
+
+def current_agent() -> str:
+    return _agent.get()
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    p = settings.llm_prices.get(model)
+    if not p:
+        return 0.0
+    prompt_price, completion_price = (list(p) + [0.0, 0.0])[:2]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _empty() -> Dict:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency_ms_total": 0.0,
+        "latency_ms_max": 0.0,
+        "cost": 0.0,
+    }
+
+
+class UsageAccumulator:
+    """
+    Копит usage по (session, agent, provider, model, kind) в памяти; запись — дешёвая, без I/O.
+    В БД — upsert с инкрементом по уникальному ключу LLMUsageDB: в транзакции хода (только записи его сессии)
+    или flush() остатков. Если транзакция не закоммитилась, записи возвращаются в очередь.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Key, Dict] = {}
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        kind: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        elapsed_s: float,
+    ) -> None:
+        key = (_session_id.get(), _agent.get(), provider, model, kind)
+        ms = elapsed_s * 1000
+        with self._lock:
+            agg = self._pending.setdefault(key, _empty())
+            agg["calls"] += 1
+            agg["prompt_tokens"] += prompt_tokens
+            agg["completion_tokens"] += completion_tokens
+            agg["latency_ms_total"] += ms
+            agg["latency_ms_max"] = max(agg["latency_ms_max"], ms)
+            agg["cost"] += price(model, prompt_tokens, completion_tokens)
+
+    def has_pending(self, session_id: str | None = None) -> bool:
+        with self._lock:
+            if session_id is None:
+                return bool(self._pending)
+            return any(k[0] == session_id for k in self._pending)
+
+    def drain(self) -> Dict[Key, Dict]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def take(self, session_id: str | None) -> Dict[Key, Dict]:
+        """Забирает записи одной сессии — usage параллельных ходов остаётся в очереди."""
+        with self._lock:
+            keys = [k for k in self._pending if k[0] == session_id]
+            return {k: self._pending.pop(k) for k in keys}
+
+    def restore(self, pending: Dict[Key, Dict]) -> None:
+        """Возвращает в очередь записи, чья транзакция откатилась (складывая с накопленным за это время)."""
+        with self._lock:
+            for key, agg in pending.items():
+                cur = self._pending.setdefault(key, _empty())
+                for f in ("calls", "prompt_tokens", "completion_tokens", "latency_ms_total", "cost"):
+                    cur[f] += agg[f]
+                cur["latency_ms_max"] = max(cur["latency_ms_max"], agg["latency_ms_max"])
+
+    def write(self, s: Session, pending: Dict[Key, Dict]) -> int:
+        """INSERT ... ON CONFLICT DO UPDATE (инкремент) в транзакции s; коммит — за вызывающим."""
+        from ..db import insert_for
+        from ..models import LLMUsageDB, llm_usage_key
+
+        if not pending:
+            return 0
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": uuid_str(),
+                "session_id": session_id,
+                "agent": agent,
+                "provider": provider,
+                "model": model,
+                "kind": kind,
+                **agg,
+                "updated_at": now,
+            }
+            for (session_id, agent, provider, model, kind), agg in pending.items()
+        ]
+        stmt = insert_for(s)(LLMUsageDB)
+        ex = stmt.excluded
+        s.execute(
+            stmt.on_conflict_do_update(
+                index_elements=llm_usage_key(),
+                set_={
+                    "calls": LLMUsageDB.calls + ex.calls,
+                    "prompt_tokens": LLMUsageDB.prompt_tokens + ex.prompt_tokens,
+                    "completion_tokens": LLMUsageDB.completion_tokens + ex.completion_tokens,
+                    "latency_ms_total": LLMUsageDB.latency_ms_total + ex.latency_ms_total,
+                    "latency_ms_max": case(
+                        (ex.latency_ms_max > LLMUsageDB.latency_ms_max, ex.latency_ms_max),
+                        else_=LLMUsageDB.latency_ms_max,
+                    ),
+                    "cost": LLMUsageDB.cost + ex.cost,
+                    "updated_at": ex.updated_at,
+                },
+            ),
+            rows,
+        )
+        return len(rows)
+
+    def flush(self, session_id: str | None = None) -> int:
+        """Все накопленные записи или, если задан session_id, только записи этой сессии."""
+        if not self.has_pending(session_id):
+            return 0
+        from ..db import engine
+
+        pending = self.drain() if session_id is None else self.take(session_id)
+        try:
+            with Session(engine) as s:
+                n = self.write(s, pending)
+                s.commit()
+        except BaseException:
+            self.restore(pending)
+            raise
+        return n
+
+
+usage = UsageAccumulator()
+
+
+def record_usage(
+    provider: str, model: str, kind: str, prompt_tokens: int, completion_tokens: int, elapsed_s: float
+) -> None:
+    usage.record(provider, model, kind, int(prompt_tokens or 0), int(completion_tokens or 0), elapsed_s)
+
+
+@contextmanager
+def staged_usage(s: Session, session_id: str | None) -> Iterator[None]:
+    """
+    Usage сессии кладём в транзакцию хода — без отдельного коммита. Коммит делается внутри блока;
+    если он (или сам upsert) не удался — записи возвращаются в очередь до следующего хода / flush.
+    """
+    pending = usage.take(session_id)
+    try:
+        usage.write(s, pending)
+        yield
+    except BaseException:
+        usage.restore(pending)
+        raise
+
+
+def flush_usage(session_id: str | None = None) -> int:
+    """
+    Сбрасывает накопленный usage в БД (shutdown, перед чтением в админке, офлайн-задачи).
+    С session_id — только остаток одной сессии: usage параллельных ходов уходит в их собственные транзакции.
+    """
+    try:
+        return usage.flush(session_id)
+    except Exception:
+        # учёт не должен ронять ход
+        return 0
+
+
+async def aflush_usage(session_id: str | None = None) -> int:
+    """flush_usage из асинхронного кода: запись в БД — в потоке, не на event loop."""
+    if not usage.has_pending(session_id):
+        return 0
+    return await asyncio.to_thread(flush_usage, session_id)
@@ -1,51 +1,205 @@
+import asyncio
+import contextvars
+import json
+import time
 import requests
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Awaitable, List, Dict, Callable
+from requests.adapters import HTTPAdapter
 from ..config import settings
+from .errors import check_response, ProviderConnectionError, TRANSPORT_ERRORS
+from .http import get_async_client
+from .usage import record_usage
 
 BASE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1"
 
+# Обёртка поэлементного запроса эмбеддинга (RateLimitedClient: token bucket, AIMD, ретраи)
+ItemCall = Callable[[Callable[[], List[float]]], List[float]]
+AItemCall = Callable[[Callable[[], Awaitable[List[float]]]], Awaitable[List[float]]]
+
 
 class YandexGPTClient:
+    provider = "yandex"
+    # textEmbedding принимает один текст за запрос; лимиты и ретраи — поэлементно, через call из RateLimitedClient
+    embed_per_text = True
+
     def __init__(self, api_key: str | None = None, folder_id: str | None = None):
         self.api_key = api_key or settings.yandex_api_key
         self.folder_id = folder_id or settings.yandex_folder_id
         self.chat_model = settings.yandex_gpt_model
         self.embed_model = settings.yandex_embed_model
+        self.headers = {"Authorization": f"Api-Key {self.api_key}"}
         self.session = requests.Session()
-        self.session.headers.update({"Authorization": f"Api-Key {self.api_key}"})
+        self.session.headers.update(self.headers)
+        # батч эмбеддингов раскидываем по ограниченному пулу потоков
+        self.embed_concurrency = max(1, settings.yandex_embed_concurrency)
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.embed_concurrency))
+        self._embed_pool = ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="yc-embed")
+        self.embed_item_retries = settings.yandex_embed_retries
 
     def _model_uri(self, model: str) -> str:
         return f"gpt://{self.folder_id}/{model}"
 
-    def chat(
-        self,
-        messages: List[Dict],
-        temperature: float = 0.2,
-        tools: List[Dict] | None = None,
-        response_format: Dict | None = None,
-    ) -> str:
+    def _post(self, path: str, payload: Dict) -> Dict:
+        try:
+            r = self.session.post(f"{BASE_URL}{path}", json=payload, timeout=settings.llm_timeout_s)
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        check_response(r)
+        return r.json()
+
+    async def _apost(self, path: str, payload: Dict) -> Dict:
+        try:
+            r = await get_async_client().post(f"{BASE_URL}{path}", json=payload, headers=self.headers)
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        check_response(r)
+        return r.json()
+
+    def _chat_payload(self, messages: List[Dict], temperature: float, stream: bool = False) -> Dict:
         yc_msgs: List[Dict] = []
         for m in messages:
             yc_msgs.append({"role": m.get("role", "user"), "text": m.get("content", "")})
-        payload = {
+        return {
             "modelUri": self._model_uri(self.chat_model),
-            "completionOptions": {"stream": False, "temperature": temperature, "maxTokens": "2000"},
+            "completionOptions": {"stream": stream, "temperature": temperature, "maxTokens": "2000"},
             "messages": yc_msgs,
         }
-        r = self.session.post(f"{BASE_URL}/completion", json=payload, timeout=60)
-        r.raise_for_status()
-        js = r.json()
+
+    @staticmethod
+    def _chat_text(js: Dict) -> str:
         alts = js.get("result", {}).get("alternatives", [])
         if not alts:
             return ""
         return alts[0]["message"]["text"]
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        embs: List[List[float]] = []
-        for t in texts:
-            payload = {"modelUri": self._model_uri(self.embed_model), "text": t}
-            r = self.session.post(f"{BASE_URL}/textEmbedding", json=payload, timeout=60)
-            r.raise_for_status()
-            js = r.json()
-            embs.append([float(x) for x in js.get("embedding", [])])
+    def _record_chat(self, js: Dict, t0: float) -> None:
+        u = js.get("result", {}).get("usage", {})
+        record_usage(
+            self.provider, self.chat_model, "chat",
+            int(u.get("inputTextTokens", 0)), int(u.get("completionTokens", 0)), time.perf_counter() - t0,
+        )
+
+    def _record_embed(self, js: Dict, t0: float) -> None:
+        record_usage(
+            self.provider, self.embed_model, "embed", int(js.get("numTokens", 0)), 0, time.perf_counter() - t0
+        )
+
+    def _embed_payload(self, text: str) -> Dict:
+        return {"modelUri": self._model_uri(self.embed_model), "text": text}
+
+    def chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        js = self._post("/completion", self._chat_payload(messages, temperature))
+        self._record_chat(js, t0)
+        return self._chat_text(js)
+
+    async def achat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.2,
+        tools: List[Dict] | None = None,
+        response_format: Dict | None = None,
+    ) -> str:
+        t0 = time.perf_counter()
+        js = await self._apost("/completion", self._chat_payload(messages, temperature))
+        self._record_chat(js, t0)
+        return self._chat_text(js)
+
+    async def astream_chat(self, messages: List[Dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        """
+        Стрим completion: провайдер шлёт JSON-объекты построчно, в каждом — накопленный текст.
+        Отдаём только прирост.
+        """
+        payload = self._chat_payload(messages, temperature, stream=True)
+        sent = 0
+        t0 = time.perf_counter()
+        last: Dict = {}
+        try:
+            async with get_async_client().stream(
+                "POST", f"{BASE_URL}/completion", json=payload, headers=self.headers
+            ) as r:
+                if r.status_code >= 400:
+                    await r.aread()
+                    check_response(r)
+                async for line in r.aiter_lines():
+                    if not line.strip():
+                        continue
+                    last = json.loads(line)
+                    text = self._chat_text(last)
+                    if len(text) > sent:
+                        yield text[sent:]
+                        sent = len(text)
+        except TRANSPORT_ERRORS as e:
+            raise ProviderConnectionError(str(e)) from e
+        self._record_chat(last, t0)
+
+    def _embed_one(self, text: str) -> List[float]:
+        t0 = time.perf_counter()
+        js = self._post("/textEmbedding", self._embed_payload(text))
+        self._record_embed(js, t0)
+        return [float(x) for x in js.get("embedding", [])]
+
+    async def _aembed_one(self, text: str) -> List[float]:
+        t0 = time.perf_counter()
+        js = await self._apost("/textEmbedding", self._embed_payload(text))
+        self._record_embed(js, t0)
+        return [float(x) for x in js.get("embedding", [])]
+
+    def embed(
+        self,
+        texts: List[str],
+        on_progress: Callable[[int, int], None] | None = None,
+        call: ItemCall | None = None,
+    ) -> List[List[float]]:
+        """
+        Параллельно (до YANDEX_EMBED_CONCURRENCY запросов), порядок результатов = порядок texts.
+        call оборачивает запрос одного текста — упавший элемент повторяется отдельно, не перезапуская батч.
+        """
+        embs: List[List[float]] = [[] for _ in texts]
+
+        def one(t: str) -> List[float]:
+            return call(lambda: self._embed_one(t)) if call else self._embed_one(t)
+
+        # контекст (агент/сессия для учёта usage) в потоки пула не наследуется — передаём копию явно
+        futures = {
+            self._embed_pool.submit(contextvars.copy_context().run, one, t): i
+            for i, t in enumerate(texts)
+        }
+        try:
+            for done, fut in enumerate(as_completed(futures), start=1):
+                embs[futures[fut]] = fut.result()
+                if on_progress:
+                    on_progress(done, len(texts))
+        except Exception:
+            for fut in futures:
+                fut.cancel()
+            raise
+        return embs
+
+    async def aembed(
+        self,
+        texts: List[str],
+        on_progress: Callable[[int, int], None] | None = None,
+        call: AItemCall | None = None,
+    ) -> List[List[float]]:
+        sem = asyncio.Semaphore(self.embed_concurrency)
+        embs: List[List[float]] = [[] for _ in texts]
+        done = 0
+
+        async def one(i: int, t: str) -> None:
+            nonlocal done
+            async with sem:
+                embs[i] = await (call(lambda: self._aembed_one(t)) if call else self._aembed_one(t))
+            done += 1
+            if on_progress:
+                on_progress(done, len(texts))
+
+        await asyncio.gather(*(one(i, t) for i, t in enumerate(texts)))
         return embs
@@ -1,23 +1,38 @@
-from collections import Counter
+import asyncio
+import json
+from functools import partial
+from typing import Awaitable, Callable
 from sqlalchemy import func
 from sqlmodel import Session, select
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
 
 from .config import settings
-from .db import init_db, get_session
+from .db import engine, init_db, get_session
 from .models import (
     SessionDB,
     MessageDB,
     UserDB,
     TopicDB,
     QuestionDB,
+    LLMUsageDB,
 )
 from .deps import moderation_guard
-from .orchestrator import run_turn
+from .orchestrator import run_turn, run_turn_stream
+from .recommendations import refresh_recommendations, recommendations_state
+from .prefetch import prefetch_questions, store as prefetch_store
+from .session_state import SessionState, session_states
+from .curated import curated_index, bump_bank_version
+from .tracing import Trace, span, trace_scope, timing_stats
 from .reporting import generate_report_png, export_profile_json
+from . import aggregates, user_profile
 from .s3_client import ensure_bucket
+from .llm.http import aclose_async_client
+from .llm.router import client as llm_client
+from .llm.usage import flush_usage, aflush_usage
 from .security import hash_password, verify_password, create_token, get_current_user
 from .agents.judge import score_answer  # <-- добавлено
 
@@ -38,6 +53,12 @@ def _startup() -> None:
     ensure_bucket()
 
 
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await aflush_usage()
+    await aclose_async_client()
+
+
 # ---------- Auth ----------
 
 class RegisterReq(BaseModel):
@@ -148,6 +169,8 @@ def admin_create_topic(
     s.add(t)
     s.commit()
     s.refresh(t)
+    # сессии могли стартовать по этому имени до создания темы — закэширован пустой банк
+    curated_index.invalidate(t.name)
     return TopicResp(id=t.id, name=t.name, question_count=0)
 
 
@@ -169,11 +192,87 @@ def admin_add_question(
         difficulty=req.difficulty,
     )
     s.add(q)
+    bump_bank_version(topic)
+    s.add(topic)
     s.commit()
     s.refresh(q)
+    curated_index.invalidate(topic.name)
     return QuestionItem(id=q.id, text=q.text, ideal_answer=q.ideal_answer, created_at=q.created_at.isoformat())
 
 
+@app.get("/api/admin/llm/stats")
+def admin_llm_stats(_: UserDB = Depends(require_admin)) -> dict:
+    """Счётчики слоёв LLM-клиента (кэш и т.п.)."""
+    return llm_client.stats()
+
+
+USAGE_GROUPS = {
+    "agent": (LLMUsageDB.agent,),
+    "model": (LLMUsageDB.provider, LLMUsageDB.model, LLMUsageDB.kind),
+    "agent_model": (LLMUsageDB.agent, LLMUsageDB.provider, LLMUsageDB.model, LLMUsageDB.kind),
+    "session": (LLMUsageDB.session_id,),
+}
+
+
+@app.get("/api/admin/llm/usage")
+def admin_llm_usage(
+    group_by: str = "agent_model",
+    session_id: str | None = None,
+    _: UserDB = Depends(require_admin),
+    s: Session = Depends(get_session),
+) -> dict:
+    """Токены / время / стоимость LLM-вызовов: по агентам, моделям или сессиям (опционально — одной сессии)."""
+    if group_by not in USAGE_GROUPS:
+        raise HTTPException(400, f"group_by must be one of {sorted(USAGE_GROUPS)}")
+    flush_usage()
+    keys = USAGE_GROUPS[group_by]
+    stmt = select(
+        *keys,
+        func.sum(LLMUsageDB.calls),
+        func.sum(LLMUsageDB.prompt_tokens),
+        func.sum(LLMUsageDB.completion_tokens),
+        func.sum(LLMUsageDB.latency_ms_total),
+        func.max(LLMUsageDB.latency_ms_max),
+        func.sum(LLMUsageDB.cost),
+    ).group_by(*keys)
+    if session_id:
+        stmt = stmt.where(LLMUsageDB.session_id == session_id)
+
+    rows: list[dict] = []
+    for r in s.exec(stmt).all():
+        calls, prompt, completion, lat_total, lat_max, cost = r[len(keys):]
+        rows.append(
+            {k.key: v for k, v in zip(keys, r[: len(keys)])}
+            | {
+                "calls": int(calls or 0),
+                "prompt_tokens": int(prompt or 0),
+                "completion_tokens": int(completion or 0),
+                "latency_ms_total": round(lat_total or 0.0, 1),
+                "latency_ms_avg": round((lat_total or 0.0) / calls, 1) if calls else 0.0,
+                "latency_ms_max": round(lat_max or 0.0, 1),
+                "cost": round(cost or 0.0, 6),
+            }
+        )
+    rows.sort(key=lambda x: x["latency_ms_total"], reverse=True)
+    totals = {
+        k: round(sum(x[k] for x in rows), 6)
+        for k in ("calls", "prompt_tokens", "completion_tokens", "latency_ms_total", "cost")
+    }
+    return {"group_by": group_by, "rows": rows, "totals": totals}
+
+
+@app.get("/api/admin/timings")
+def admin_timings(_: UserDB = Depends(require_admin)) -> dict:
+    """Задержки этапов хода (сэмпл TRACE_SAMPLE_RATE): count, mean/p50/p95/max, мс."""
+    return timing_stats.stats()
+
+
+@app.get("/api/admin/prefetch/stats")
+def admin_prefetch_stats(_: UserDB = Depends(require_admin)) -> dict:
+    """Hit rate спекулятивного prefetch вопросов (для подбора PREFETCH_BRANCHES)."""
+    return prefetch_store.stats()
+
+
 @app.get("/api/topics", response_model=list[TopicResp])
 def list_topics(s: Session = Depends(get_session)) -> list[TopicResp]:
     topics = s.exec(select(TopicDB)).all()
@@ -216,32 +315,45 @@ class StartSessionResp(BaseModel):
     first_question: str
 
 
-@app.post("/api/session/start", response_model=StartSessionResp)
-def start_session(
-    req: StartSessionReq,
-    s: Session = Depends(get_session),
-    user: UserDB | None = Depends(get_current_user),
-) -> StartSessionResp:
+def _create_session(s: Session, req: StartSessionReq, user: UserDB | None) -> SessionDB:
     se = SessionDB(
         mode=req.mode,
         topic=req.topic,
         student_id=req.student_id,
         user_id=(user.id if user else None),
-        max_questions=(10 if req.mode == "exam" else None),
+        max_questions=(settings.exam_max_questions if req.mode == "exam" else None),
+        start_skills=(user_profile.warm_start(s, user.id) if user else None),
     )
     s.add(se)
     s.commit()
     s.refresh(se)
-    q, _ = run_turn(
-        s,
-        session_id=se.id,
-        topic=req.topic,
-        mode=req.mode,
-        last_user="Я готов начать.",
-        prev_bloom=None,
-        prev_diff=None,
-        prev_question=None,
-    )
+    return se
+
+
+# async-ручки хода: синхронная работа с БД (SQLModel) — через asyncio.to_thread, event loop держат только LLM-вызовы
+@app.post("/api/session/start", response_model=StartSessionResp)
+async def start_session(
+    req: StartSessionReq,
+    background: BackgroundTasks,
+    response: Response,
+    s: Session = Depends(get_session),
+    user: UserDB | None = Depends(get_current_user),
+) -> StartSessionResp:
+    with trace_scope() as tr:
+        with span("commit"):
+            se = await asyncio.to_thread(_create_session, s, req, user)
+        q, meta = await run_turn(
+            s,
+            session_id=se.id,
+            topic=req.topic,
+            mode=req.mode,
+            last_user="Я готов начать.",
+            prev_bloom=None,
+            prev_diff=None,
+            prev_question=None,
+        )
+        response.headers["Server-Timing"] = tr.server_timing()
+    _after_turn(background, se, q, meta)
     return StartSessionResp(session_id=se.id, first_question=q)
 
 
@@ -254,39 +366,144 @@ class ChatResp(BaseModel):
     meta: dict
 
 
+def _active_session(s: Session, session_id: str, user: UserDB | None) -> SessionDB:
+    se = s.get(SessionDB, session_id)
+    if not se or se.status != "active":
+        raise HTTPException(404, "Session not found or inactive")
+    if se.user_id and user and se.user_id != user.id:
+        raise HTTPException(403, "Forbidden")
+    return se
+
+
+def _load_turn(
+    s: Session, session_id: str, message: str, user: UserDB | None
+) -> tuple[SessionDB, SessionState]:
+    """Модерация и чтение сессии перед ходом (в потоке)."""
+    with span("moderation"):
+        moderation_guard(message, session_id=session_id)
+    with span("db_read"):
+        se = _active_session(s, session_id, user)
+        return se, session_states.get(s, se)
+
+
+async def _gather_jobs(*jobs: Callable[[], Awaitable]) -> None:
+    await asyncio.gather(*(job() for job in jobs))
+
+
+def _after_turn(background: BackgroundTasks, se: SessionDB, reply: str, meta: dict) -> None:
+    """
+    Работа после ответа, не на критическом пути хода: prefetch следующего вопроса и рекомендации Summarizer.
+    Starlette выполняет BackgroundTasks по очереди — одна задача с gather, чтобы prefetch не ждал Summarizer.
+    """
+    jobs = []
+    if meta.get("prefetch_next"):
+        jobs.append(partial(prefetch_questions, se.id, se.topic, se.mode, reply, meta))
+    if meta.get("recommendations_pending"):
+        jobs.append(partial(refresh_recommendations, se.id))
+    if jobs:
+        background.add_task(_gather_jobs, *jobs)
+
+
 @app.post("/api/session/{session_id}/message", response_model=ChatResp)
-def send_message(
+async def send_message(
     session_id: str,
     req: ChatReq,
+    background: BackgroundTasks,
+    response: Response,
     s: Session = Depends(get_session),
     user: UserDB | None = Depends(get_current_user),
 ) -> ChatResp:
-    _ = moderation_guard(req.message, session_id=session_id)
-    se = s.get(SessionDB, session_id)
-    if not se or se.status != "active":
-        raise HTTPException(404, "Session not found or inactive")
-    if se.user_id and user and se.user_id != user.id:
-        raise HTTPException(403, "Forbidden")
+    with trace_scope() as tr:
+        se, st = await asyncio.to_thread(_load_turn, s, session_id, req.message, user)
+        reply, meta = await run_turn(
+            s,
+            session_id=session_id,
+            topic=se.topic,
+            mode=se.mode,
+            last_user=req.message,
+            prev_bloom=st.last_bloom,
+            prev_diff=st.difficulty,
+            prev_question=st.last_question,
+        )
+        response.headers["Server-Timing"] = tr.server_timing()
+    _after_turn(background, se, reply, meta)
+    return ChatResp(reply=reply, meta=meta)
 
-    last_q = s.exec(
-        select(MessageDB)
-        .where(MessageDB.session_id == session_id, MessageDB.role == "assistant")
-        .order_by(MessageDB.ts.desc())
-    ).first()
-    last_bloom = last_q.bloom_level if last_q else None
-    prev_diff = "medium"
 
-    reply, meta = run_turn(
-        s,
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/session/{session_id}/message/stream")
+async def send_message_stream(
+    session_id: str,
+    req: ChatReq,
+    s: Session = Depends(get_session),
+    user: UserDB | None = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    SSE-вариант /message: event "meta" (оценка ответа) -> "token"* (следующий вопрос) -> "done"
+    [-> "recommendations", если их нужно было пересчитать]. Сбой посреди хода — event "error": ход не сохранён,
+    полученные токены клиент отбрасывает и может повторить сообщение.
+    Server-Timing содержит только этапы до начала стрима; полная разбивка — в meta.timings события "done".
+    """
+    tr = Trace()
+    with trace_scope(tr, sample=False):
+        se, st = await asyncio.to_thread(_load_turn, s, session_id, req.message, user)
+    turn = dict(
         session_id=session_id,
         topic=se.topic,
         mode=se.mode,
         last_user=req.message,
-        prev_bloom=last_bloom,
-        prev_diff=prev_diff,
-        prev_question=last_q.content if last_q else None,
+        prev_bloom=st.last_bloom,
+        prev_diff=st.difficulty,
+        prev_question=st.last_question,
+    )
+
+    done_meta: dict = {}
+
+    async def events():
+        # Сессия из Depends закрывается до начала стрима — открываем свою
+        with Session(engine) as ss, trace_scope(tr):
+            try:
+                async for event, data in run_turn_stream(ss, **turn):
+                    if event == "done":
+                        done_meta.update(data["meta"], reply=data["reply"])
+                    yield _sse(event, data)
+            except Exception as e:
+                # заголовки уже ушли — статус не поменять, сообщаем об ошибке событием
+                yield _sse("error", {"detail": "turn failed", "type": type(e).__name__, "committed": bool(done_meta)})
+
+    async def after_stream():
+        if done_meta.get("prefetch_next"):
+            await prefetch_questions(session_id, turn["topic"], turn["mode"], done_meta["reply"], done_meta)
+
+    return StreamingResponse(
+        events(),
+        background=BackgroundTask(after_stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Server-Timing": tr.server_timing()},
     )
-    return ChatResp(reply=reply, meta=meta)
+
+
+@app.get("/api/session/{session_id}/recommendations")
+def get_recommendations(
+    session_id: str,
+    background: BackgroundTasks,
+    s: Session = Depends(get_session),
+    user: UserDB | None = Depends(get_current_user),
+) -> dict:
+    """Poll: последние рекомендации сессии; pending=true — пересчёт ещё идёт."""
+    se = s.get(SessionDB, session_id)
+    if not se:
+        raise HTTPException(404, "Session not found")
+    if se.user_id and user and se.user_id != user.id:
+        raise HTTPException(403, "Forbidden")
+    state = recommendations_state(se)
+    if state["pending"]:
+        # воркер мог упасть или не дожить до рестарта — перезапускаем (параллельный не стартует)
+        background.add_task(refresh_recommendations, session_id)
+    return state
 
 
 class ReportResp(BaseModel):
@@ -324,6 +541,7 @@ def complete_session(
     se.status = "completed"
     s.add(se)
     s.commit()
+    session_states.invalidate(session_id)
     return {"ok": True}
 
 
@@ -361,6 +579,22 @@ def my_sessions(
     ]
 
 
+@app.get("/api/me/profile")
+def my_profile(
+    skill: str | None = None,
+    limit: int = 50,
+    s: Session = Depends(get_session),
+    user: UserDB | None = Depends(get_current_user),
+) -> dict:
+    """Навыки пользователя по всем сессиям и тренд с прошлой сессии; ?skill= — ещё и история навыка."""
+    if not user:
+        raise HTTPException(401, "Unauthorized")
+    out = {"user_id": user.id, "skills": user_profile.profile(s, user.id)}
+    if skill:
+        out["history"] = user_profile.history(s, user.id, skill, max(1, min(limit, 1000)))
+    return out
+
+
 class MessageItem(BaseModel):
     role: str
     content: str
@@ -415,15 +649,8 @@ def session_metrics(
         raise HTTPException(404, "Session not found")
     if se.user_id and user and se.user_id != user.id:
         raise HTTPException(403, "Forbidden")
-    rows = s.exec(
-        select(MessageDB).where(MessageDB.session_id == session_id).order_by(MessageDB.ts.asc())
-    ).all()
-    scores = [m.score for m in rows if m.role == "user" and m.score is not None]
-    avg = sum(scores) / len(scores) if scores else None
-    bloom = Counter([m.bloom_level for m in rows if m.role == "user" and m.bloom_level])
-    solo = Counter([m.solo_level for m in rows if m.role == "user" and m.solo_level])
-    turns = len([m for m in rows if m.role == "user"])
-    return MetricsResp(avg_score=avg, bloom_counts=dict(bloom), solo_counts=dict(solo), turns=turns)
+    aggregates.ensure_aggregates(s, se)
+    return MetricsResp(**aggregates.metrics(se))
 
 
 # ---------- Testbench ----------
@@ -1,6 +1,6 @@
 from typing import Optional, Any
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, Index, JSON, func, literal_column
 from datetime import datetime
 import uuid
 
@@ -29,6 +29,7 @@ class TopicDB(SQLModel, table=True):
     name: str = Field(index=True, unique=True)
     created_by: Optional[str] = Field(default=None, index=True)  # UserDB.id
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    bank_version: int = Field(default=0)  # растёт при изменении банка вопросов (curated.CuratedIndex)
 
 
 class QuestionDB(SQLModel, table=True):
@@ -52,7 +53,28 @@ class SessionDB(SQLModel, table=True):
     user_id: Optional[str] = Field(default=None, index=True)  # FK soft link to UserDB.id
     started_at: datetime = Field(default_factory=datetime.utcnow)
     status: str = Field(default="active")  # active/completed
-    max_questions: Optional[int] = Field(default=None, index=True)  # 10 для exam, None иначе
+    max_questions: Optional[int] = Field(default=None, index=True)  # EXAM_MAX_QUESTIONS для exam, None иначе
+    # Рекомендации Summarizer считаются в фоне: pending, пока recs_requested > recs_turn
+    recommendations: Optional[str] = Field(default=None)
+    recs_requested: int = Field(default=0)  # ход, на котором запрошен пересчёт
+    recs_turn: int = Field(default=0)  # ход, по которому посчитаны текущие recommendations
+    recs_profile: Optional[dict[str, float]] = Field(default=None, sa_column=Column(JSON))  # EMA на момент запроса
+    recs_updated_at: Optional[datetime] = Field(default=None)
+    # Состояние хода (кэшируется в session_state.SessionStateCache, write-through)
+    asked_count: Optional[int] = Field(default=0)  # сколько вопросов задано; None — старая сессия, посчитать
+    difficulty: Optional[str] = Field(default=None)  # сложность последнего вопроса
+    state_version: int = Field(default=0)  # растёт при каждом изменении состояния хода
+    theta_info: float = Field(default=0.0)  # информация ответов о theta сессии — по ней правило точности exam
+    # Навыки из профиля пользователя на старте сессии (warm start) — при перезагрузке состояния берём их, а не
+    # текущий профиль, который с тех пор могли изменить другие сессии
+    start_skills: Optional[dict[str, dict[str, float]]] = Field(default=None, sa_column=Column(JSON))
+    # Агрегаты по ответам студента — ведутся в транзакции хода (см. aggregates.py);
+    # score_count None — старая сессия, досчитать (aggregates.backfill)
+    score_sum: float = Field(default=0.0)
+    score_count: Optional[int] = Field(default=0)
+    answers_count: int = Field(default=0)  # сообщений студента (turns в метриках)
+    bloom_counts: Optional[dict[str, int]] = Field(default_factory=dict, sa_column=Column(JSON))
+    solo_counts: Optional[dict[str, int]] = Field(default_factory=dict, sa_column=Column(JSON))
 
 
 class MessageDB(SQLModel, table=True):
@@ -62,25 +84,129 @@ class MessageDB(SQLModel, table=True):
     content: str = Field()
     bloom_level: Optional[str] = Field(default=None)
     solo_level: Optional[str] = Field(default=None)
+    difficulty: Optional[str] = Field(default=None)  # для вопросов ассистента: easy/medium/hard
     score: Optional[float] = Field(default=None)
     confidence: Optional[float] = Field(default=None)
     meta: Optional[dict[str, Any]] = Field(default=None, sa_column=Column(JSON))
+    item_key: Optional[str] = Field(default=None, index=True)  # calibration.item_key вопроса (у ответа — заданного перед ним)
     ts: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
 class SkillScoreDB(SQLModel, table=True):
+    # одна строка на навык сессии — на этом держится bulk upsert в assessment.AssessmentEngine
+    __table_args__ = (Index("ux_skillscoredb_session_skill", "session_id", "skill", unique=True),)
+
     id: str = Field(default_factory=uuid_str, primary_key=True)
     session_id: str = Field(index=True)
     skill: str = Field(index=True)
     ema_score: float = Field(default=0.0)  # 0..1
     ema_alpha: float = Field(default=0.3)
     irt_theta: float = Field(default=0.0)  # ability
+    irt_info: float = Field(default=0.0)  # сумма информации Фишера ответов: SE theta = 1/sqrt(1 + irt_info)
     last_update: datetime = Field(default_factory=datetime.utcnow)
 
 
+class UserSkillDB(SQLModel, table=True):
+    """
+    Навык пользователя поверх сессий: последнее состояние (с него стартуют новые сессии) и значения
+    на конец предыдущей сессии, затронувшей навык, — тренд без чтения истории.
+    """
+
+    __table_args__ = (Index("ux_userskilldb_user_skill", "user_id", "skill", unique=True),)
+
+    id: str = Field(default_factory=uuid_str, primary_key=True)
+    user_id: str = Field(index=True)
+    skill: str = Field(index=True)
+    ema_score: float = Field(default=0.5)
+    irt_theta: float = Field(default=0.0)
+    prev_ema_score: float = Field(default=0.5)
+    prev_irt_theta: float = Field(default=0.0)
+    answers: int = Field(default=0)
+    last_session_id: Optional[str] = Field(default=None)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UserSkillHistoryDB(SQLModel, table=True):
+    """Append-only история навыков пользователя: строка на каждое обновление навыка в ходе."""
+
+    __table_args__ = (Index("ix_userskillhistorydb_user_skill_ts", "user_id", "skill", "ts"),)
+
+    id: str = Field(default_factory=uuid_str, primary_key=True)
+    user_id: str = Field(index=True)
+    skill: str = Field()
+    session_id: str = Field(index=True)
+    ema_score: float = Field()
+    irt_theta: float = Field()
+    score: Optional[float] = Field(default=None)
+    ts: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
 class EventLogDB(SQLModel, table=True):
     id: str = Field(default_factory=uuid_str, primary_key=True)
     session_id: Optional[str] = Field(default=None, index=True)
     type: str = Field(index=True)  # telemetry, moderation, error, info
     payload: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
     ts: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class LLMUsageDB(SQLModel, table=True):
+    """Агрегат LLM-вызовов по (session, agent, provider, model, kind); пополняется upsert-ом из llm.usage."""
+
+    id: str = Field(default_factory=uuid_str, primary_key=True)
+    session_id: Optional[str] = Field(default=None, index=True)
+    agent: str = Field(index=True)  # tutor/judge/bloom_tagger/solo_tagger/summarizer/assessor/other
+    provider: str = Field()
+    model: str = Field(index=True)
+    kind: str = Field()  # chat | embed
+    calls: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    latency_ms_total: float = Field(default=0.0)
+    latency_ms_max: float = Field(default=0.0)
+    cost: float = Field(default=0.0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+def llm_usage_key() -> list:
+    """Уникальный ключ LLMUsageDB (цель ON CONFLICT): session_id без сессии — NULL, в индексе — ''."""
+    return [
+        func.coalesce(LLMUsageDB.session_id, literal_column("''")),
+        LLMUsageDB.agent,
+        LLMUsageDB.provider,
+        LLMUsageDB.model,
+        LLMUsageDB.kind,
+    ]
+
+
+Index("ux_llmusagedb_key", *llm_usage_key(), unique=True)
+
+
+# --- IRT calibration ---
+
+
+class ItemParamDB(SQLModel, table=True):
+    """Параметры 2PL пункта (вопрос × навык) из офлайн-калибровки; precision — апостериорная точность, prior следующего прогона."""
+
+    __table_args__ = (Index("ux_itemparamdb_item_skill", "item_key", "skill", unique=True),)
+
+    id: str = Field(default_factory=uuid_str, primary_key=True)
+    item_key: str = Field(index=True)
+    skill: str = Field(index=True)
+    a: float = Field(default=1.0)  # discrimination
+    b: float = Field(default=0.0)  # difficulty
+    log_a_precision: float = Field(default=0.0)
+    b_precision: float = Field(default=0.0)
+    responses: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class CalibrationRunDB(SQLModel, table=True):
+    id: str = Field(default_factory=uuid_str, primary_key=True)
+    started_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    finished_at: Optional[datetime] = Field(default=None)
+    watermark: datetime = Field()  # обработаны ответы с ts <= watermark
+    full: bool = Field(default=False)
+    responses: int = Field(default=0)
+    items: int = Field(default=0)
+    persons: int = Field(default=0)
+    iterations: int = Field(default=0)
@@ -1,155 +1,327 @@
-from typing import Tuple, Dict, List
-from sqlmodel import Session, select
-from .agents.tutor import generate_question
-from .agents.judge import score_answer
-from .agents.bloom_tagger import tag_bloom
-from .agents.solo_tagger import tag_solo
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Tuple, Dict, List
+from sqlmodel import Session
+from .config import settings
+from .agents.tutor import agenerate_question, astream_question
+from .agents.judge import ascore_answer
+from .agents.bloom_tagger import atag_bloom
+from .agents.solo_tagger import atag_solo
+from .agents.assessor import aassess_answer
 from .agents.planner import next_bloom, next_difficulty
-from .agents.summarizer import recommendations
-from .models import MessageDB, SessionDB, TopicDB, QuestionDB
-from .assessment import update_ema, irt_update_2pl, aggregate_profile
+from .agents.summarizer import arecommendations, fallback_recommendations
+from .recommendations import request_recommendations, recommendations_state, refresh_recommendations
+from .llm.usage import session_scope, aflush_usage, staged_usage
+from .tracing import span, trace_scope, Trace
+from . import aggregates, prefetch, user_profile
+from .models import MessageDB, SessionDB
+from .curated import TopicBank, curated_index
+from .cat import session_theta
+from .assessment import answer_info, answer_score, assessment_engine, theta_se
+from .calibration import item_key, item_params
+from .session_state import SessionState, session_states, bump_version
 
 
-def _assistant_count(s: Session, session_id: str) -> int:
-    rows = s.exec(
-        select(MessageDB).where(MessageDB.session_id == session_id, MessageDB.role == "assistant")
-    ).all()
-    return len(rows)
+async def _assess_answer(question: str, answer: str) -> Tuple[Dict, str, str, Dict[str, float]]:
+    """
+    Judge, Bloom-Tagger и SOLO-Tagger зависят только от (question, answer) — запускаем их параллельно.
+    При FUSED_ASSESSOR=true — один вызов Assessor вместо трёх.
+    Возвращает (judge_json, bloom, solo, timings_ms).
+    """
+    if settings.fused_assessor:
+        t0 = time.perf_counter()
+        with span("assessor"):
+            js = await aassess_answer(question, answer, timeout=settings.assessor_timeout_s)
+        timings = {"assessor": round((time.perf_counter() - t0) * 1000, 1)}
+        timings["assessment_total"] = timings["assessor"]
+        return js, js["bloom_level"], js["solo_level"], timings
 
+    sem = asyncio.Semaphore(max(1, settings.assess_concurrency))
+    timings: Dict[str, float] = {}
 
-def _curated_question(s: Session, topic_name: str, index: int) -> str | None:
-    topic = s.exec(select(TopicDB).where(TopicDB.name == topic_name)).first()
-    if not topic:
-        return None
-    qs: List[QuestionDB] = (
-        s.exec(
-            select(QuestionDB)
-            .where(QuestionDB.topic_id == topic.id)
-            .order_by(QuestionDB.created_at.asc())
-        ).all()
+    async def timed(name: str, coro_fn, *args, timeout: float):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                with span(name):
+                    return await coro_fn(*args, timeout=timeout)
+            finally:
+                timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    t0 = time.perf_counter()
+    js, bloom, solo = await asyncio.gather(
+        timed("judge", ascore_answer, question, answer, timeout=settings.judge_timeout_s),
+        timed("bloom_tagger", atag_bloom, answer, timeout=settings.bloom_tagger_timeout_s),
+        timed("solo_tagger", atag_solo, answer, timeout=settings.solo_tagger_timeout_s),
     )
-    if index < len(qs):
-        return qs[index].text
-    return None
+    timings["assessment_total"] = round((time.perf_counter() - t0) * 1000, 1)
+    return js, bloom, solo, timings
 
 
-def run_turn(
-    s: Session,
-    session_id: str,
-    topic: str,
-    mode: str,
-    last_user: str,
-    prev_bloom: str | None,
-    prev_diff: str | None,
-    prev_question: str | None,
-) -> Tuple[str, Dict]:
+class TurnUnitOfWork:
     """
-    Возвращает (assistant_reply, meta).
-    В режиме 'exam': после ответа на 10-й вопрос — завершение сессии (без генерации нового вопроса).
+    Всё, что ход пишет в БД: сообщение студента, обновления навыков (сессии и профиля пользователя), ответ ассистента,
+    поля SessionDB и usage LLM.
+    До commit() — только память (пока ждём LLM, соединение из пула не держим); commit() — одна транзакция,
+    после неё write-through в SessionState.
+    """
+
+    def __init__(self, st: SessionState):
+        self.st = st
+        self.user_msg: MessageDB | None = None
+        self.skills: Dict[str, Dict[str, float]] = {}
+        self.theta_info = 0.0  # информация ответа этого хода о theta сессии
+        self.reply: MessageDB | None = None
+
+    def emas(self) -> Dict[str, float]:
+        """EMA навыков с учётом ещё не закоммиченного ответа."""
+        return self.st.emas() | {k: v["ema"] for k, v in self.skills.items()}
+
+    def profile(self) -> Dict[str, Dict[str, float]]:
+        return self.st.profile() | {k: dict(v) for k, v in self.skills.items()}
+
+    def session_se(self) -> float:
+        """SE theta сессии (той, по которой CAT выбирает вопросы) с учётом ответа этого хода."""
+        return theta_se(self.st.theta_info + self.theta_info)
+
+    async def commit(self, s: Session, on_session: Callable[[SessionDB], None] | None = None) -> None:
+        """
+        Одна транзакция хода — в потоке, чтобы синхронная запись в БД не держала event loop.
+        on_session(se) вызывается внутри неё — до ответа ассистента, для полей SessionDB (счётчики, рекомендации)
+        и чтений, которые должны видеть ответ студента.
+        """
+        entries = await asyncio.to_thread(self._write, s, on_session)
+        # write-through: состояние обновляем только после успешного коммита
+        self.st.skills.update(self.skills)
+        self.st.theta_info += self.theta_info
+        self.st.history.extend(entries)
+
+    def _write(self, s: Session, on_session: Callable[[SessionDB], None] | None) -> List[Dict]:
+        with span("commit"):
+            st = self.st
+            se = s.get(SessionDB, st.session_id)
+            if aggregates.needs_backfill(se):
+                # до добавления ответа: иначе autoflush посчитает его дважды
+                aggregates.backfill_session(s, se)
+            if self.user_msg is not None:
+                s.add(self.user_msg)
+                aggregates.apply_answer(se, self.user_msg)
+                se.theta_info = (se.theta_info or 0.0) + self.theta_info
+            assessment_engine.upsert(s, {st.session_id: self.skills})
+            if st.user_id:
+                score = self.user_msg.score if self.user_msg is not None else None
+                user_profile.record(s, st.user_id, st.session_id, self.skills, score)
+            if on_session:
+                on_session(se)
+            if self.reply is not None:
+                s.add(self.reply)
+            entries = [SessionState.history_entry(m) for m in (self.user_msg, self.reply) if m is not None]
+            bump_version(se, st)
+            s.add(se)
+            with staged_usage(s, st.session_id):
+                s.commit()
+        return entries
+
+
+def _begin_turn(s: Session, session_id: str, mode: str, topic: str) -> Tuple[SessionState, TopicBank | None]:
+    """
+    Read-фаза хода: состояние сессии и (для exam) банк вопросов темы — вопрос из него выбирается
+    после оценки ответа, уже в памяти. Затем отпускаем соединение — дальше до коммита хода только LLM.
+    Синхронная — вызывается через asyncio.to_thread.
     """
+    with span("db_read"):
+        se = s.get(SessionDB, session_id)
+        st = session_states.get(s, se)
+        item_params.refresh(s)
+        bank = curated_index.bank(s, topic) if mode == "exam" else None
+        s.close()
+    return st, bank
+
+
+async def _assess_turn(
+    uow: TurnUnitOfWork, last_user: str, prev_question: str | None
+) -> Tuple[Dict, Dict[str, float]]:
+    """Шаг 1: оценка ответа (если был предыдущий вопрос) и обновления навыков — в unit of work, без БД."""
+    session_id = uow.st.session_id
     metrics: Dict = {}
-    # 1) Сохраняем/оцениваем пользовательский ответ (если был предыдущий вопрос)
+    agent_timings: Dict[str, float] = {}
     if prev_question:
-        js = score_answer(prev_question, last_user)
+        js, bloom_from_answer, solo_from_answer, agent_timings = await _assess_answer(prev_question, last_user)
         metrics = js | {}
-        bloom_from_answer = tag_bloom(last_user)
-        solo_from_answer = tag_solo(last_user)
         skills = js.get("skills") or ["general"]
-        for sk in skills:
-            update_ema(s, session_id, sk, js.get("score", 0.0), alpha=0.35)
-            irt_update_2pl(s, session_id, sk, js.get("score", 0.0))
-        s.add(
-            MessageDB(
-                session_id=session_id,
-                role="user",
-                content=last_user,
-                bloom_level=bloom_from_answer,
-                solo_level=solo_from_answer,
-                score=js.get("score"),
-                confidence=js.get("confidence"),
-                meta=js,
-            )
+        key = item_key(prev_question)
+        score = answer_score(js)
+        if score is not None:
+            with span("ema_irt"):
+                uow.skills = assessment_engine.update(uow.st.skills, skills, score, item=key)
+                uow.theta_info = answer_info(uow.st.skills, uow.skills)
+        uow.user_msg = MessageDB(
+            session_id=session_id,
+            role="user",
+            content=last_user,
+            bloom_level=bloom_from_answer,
+            solo_level=solo_from_answer,
+            score=score,
+            confidence=js.get("confidence"),
+            meta=js,
+            item_key=key,
         )
     else:
-        s.add(MessageDB(session_id=session_id, role="user", content=last_user))
-    s.commit()
-
-    # 2) Проверяем лимит экзамена
-    asked = _assistant_count(s, session_id)  # сколько вопросов уже задано
-    if mode == "exam":
-        # На старте asked==0; после ответа на 10-й вопрос asked==10
-        if asked >= 10 and prev_question is not None:
-            # Итоговое резюме и авто-завершение
-            history_rows = (
-                s.exec(
-                    select(MessageDB)
-                    .where(MessageDB.session_id == session_id)
-                    .order_by(MessageDB.ts.asc())
-                ).all()
-            )
-            prof = aggregate_profile(s, session_id)
-            scores = [m.score for m in history_rows if m.role == "user" and m.score is not None]
-            avg = (sum(scores) / len(scores)) if scores else 0.0
-            recs = recommendations(
-                topic,
-                history=[m.model_dump() for m in history_rows],
-                skills={k: v["ema"] for k, v in prof.items()},
-            )
-            summary = (
-                f"Экзамен завершён. Всего вопросов: 10.\n"
-                f"Средний score: {avg:.2f}.\n"
-                f"Рекомендации:\n{recs}"
-            )
-            # Сохраним финальное сообщение ассистента (не вопрос)
-            s.add(MessageDB(session_id=session_id, role="assistant", content=summary))
-            se = s.get(SessionDB, session_id)
-            if se:
-                se.status = "completed"
-                s.add(se)
-            s.commit()
-            return summary, {
-                "completed": True,
-                "avg_score": avg,
-                "profile": prof,
-                "errors": metrics.get("errors", []),
-            }
+        uow.user_msg = MessageDB(session_id=session_id, role="user", content=last_user)
+    return metrics, agent_timings
+
+
+def _max_questions(st: SessionState) -> int:
+    return st.max_questions or settings.exam_max_questions
+
+
+def _skill_se(profile: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    # только навыки с ответами в этой сессии: прогретые из профиля пользователя приходят с info=0
+    return {k: round(theta_se(v["info"]), 3) for k, v in profile.items() if v.get("info")}
+
+
+def _exam_stop(mode: str, uow: TurnUnitOfWork, prev_question: str | None) -> str | None:
+    """
+    Причина завершения экзамена после этого ответа (None — продолжаем). На старте asked==0;
+    после ответа на N-й вопрос asked==N: max_questions — задан лимит сессии; target_se (EXAM_STOP_RULE=precision) —
+    SE theta сессии уже не больше EXAM_TARGET_SE. SE по навыкам для этого не годится: навык, который
+    Judge отметил в одном ответе, держал бы max(SE) около 0.9 до конца экзамена.
+    """
+    asked = uow.st.asked
+    if mode != "exam" or prev_question is None:
+        return None
+    if asked >= _max_questions(uow.st):
+        return "max_questions"
+    if settings.exam_stop_rule == "precision" and asked >= settings.exam_min_questions:
+        if uow.session_se() <= settings.exam_target_se:
+            return "target_se"
+    return None
+
+
+async def _complete_exam(
+    s: Session, uow: TurnUnitOfWork, topic: str, metrics: Dict, agent_timings: Dict[str, float], stop_reason: str
+) -> Tuple[str, Dict]:
+    """Итоговое резюме и авто-завершение экзамена."""
+    st = uow.st
+    session_id = st.session_id
+    prof = uow.profile()
+    skill_se = _skill_se(prof)
+    session_se = round(uow.session_se(), 3)
+    history = list(st.history) + [SessionState.history_entry(uow.user_msg)]
+    recs: str | None = None
+    try:
+        with span("summarizer"):
+            recs = await arecommendations(topic, history=history, skills=uow.emas())
+    except Exception:
+        # провайдер недоступен (в т.ч. CircuitOpenError) — экзамен всё равно завершаем, ниже подставим fallback
+        pass
+    result: Dict = {"recs_fallback": not recs}
+
+    def finish(se: SessionDB) -> None:
+        # агрегаты уже учитывают ответ этого хода
+        result["avg"] = avg = aggregates.avg_score(se) or 0.0
+        early = (
+            f"Оценка достигла нужной точности (SE <= {settings.exam_target_se:g}) — экзамен завершён досрочно.\n"
+            if stop_reason == "target_se"
+            else ""
+        )
+        # без ответа провайдера — последние сохранённые рекомендации сессии, иначе шаблон
+        text = recs or se.recommendations or fallback_recommendations(uow.emas())
+        summary = (
+            f"Экзамен завершён. Всего вопросов: {st.asked}.\n"
+            f"{early}"
+            f"Средний score: {avg:.2f}.\n"
+            f"Рекомендации:\n{text}"
+        )
+        # Сохраним финальное сообщение ассистента (не вопрос)
+        uow.reply = MessageDB(
+            session_id=session_id,
+            role="assistant",
+            content=summary,
+            meta={"stop_reason": stop_reason, "session_se": session_se, "theta_se": skill_se},
+        )
+        result["summary"] = summary
+        se.status = "completed"
+
+    await uow.commit(s, finish)
+    prefetch.store.drop(session_id)
+    session_states.invalidate(session_id)
+    return result["summary"], {
+        "completed": True,
+        "stop_reason": stop_reason,
+        "questions": st.asked,
+        "session_se": session_se,
+        "theta_se": skill_se,
+        "avg_score": result["avg"],
+        "recommendations_fallback": result["recs_fallback"],
+        "profile": prof,
+        "errors": metrics.get("errors", []),
+        "agent_timings_ms": agent_timings,
+    }
+
 
-    # 3) Планирование следующего вопроса (или продолжение диагностики)
+def _curated_question(bank: TopicBank | None, uow: TurnUnitOfWork) -> str | None:
+    """
+    Вопрос из админского банка темы (exam): по умолчанию (sequential) — по порядку (asked: 0->Q1, 1->Q2, ...),
+    EXAM_ITEM_SELECTION=adaptive — максимум информации в theta с учётом только что оценённого ответа.
+    """
+    if bank is None:
+        return None
+    if settings.exam_item_selection != "adaptive":
+        return bank.question(uow.st.asked)
+    with span("cat_select"):
+        return bank.select(session_theta(uow.profile()), uow.st.seen)
+
+
+def _plan(mode: str, prev_bloom: str | None, prev_diff: str | None, metrics: Dict) -> Tuple[str, str]:
+    """Шаг 3: планирование следующего вопроса (или продолжение диагностики)."""
     current_bloom = prev_bloom or "understand"
     difficulty = prev_diff or "medium"
     score = metrics.get("score", 0.6)
-    target_bloom = next_bloom(current_bloom, score, mode)
-    next_diff = next_difficulty(difficulty, score)
-
-    # 4) Выбираем источник вопроса:
-    #    для exam — сначала пробуем curated (админский банк), иначе fallback на LLM;
-    #    для diagnostic — сразу LLM.
-    question = None
-    if mode == "exam":
-        question = _curated_question(s, topic_name=topic, index=asked)  # asked: 0->Q1, 1->Q2, ...
-    if not question:
-        question = generate_question(
-            topic=topic, target_bloom=target_bloom, difficulty=next_diff, last_answer=last_user
-        )
+    return next_bloom(current_bloom, score, mode), next_difficulty(difficulty, score)
 
-    s.add(
-        MessageDB(session_id=session_id, role="assistant", content=question, bloom_level=target_bloom)
-    )
-    s.commit()
 
-    # 5) Рекомендации/профиль (для UI панели)
-    history_rows = (
-        s.exec(select(MessageDB).where(MessageDB.session_id == session_id).order_by(MessageDB.ts.asc()))
-        .all()
-    )
-    prof = aggregate_profile(s, session_id)
-    recs = recommendations(
-        topic,
-        history=[m.model_dump() for m in history_rows],
-        skills={k: v["ema"] for k, v in prof.items()},
+async def _finish_turn(
+    s: Session,
+    uow: TurnUnitOfWork,
+    question: str,
+    target_bloom: str,
+    next_diff: str,
+    metrics: Dict,
+    agent_timings: Dict[str, float],
+    prefetch_next: bool,
+) -> Dict:
+    """
+    Коммитит ход (ответ, навыки, вопрос ассистента со сложностью и счётчиком вопросов в SessionDB)
+    и собирает meta (профиль + последние рекомендации для UI панели).
+    Рекомендации не ждём: при необходимости помечаем их к пересчёту (refresh_recommendations после ответа).
+    """
+    st = uow.st
+    session_id = st.session_id
+    turn = st.asked + 1
+    key = item_key(question)
+    uow.reply = MessageDB(
+        session_id=session_id,
+        role="assistant",
+        content=question,
+        bloom_level=target_bloom,
+        difficulty=next_diff,
+        item_key=key,
     )
+    recs: Dict = {}
 
-    return question, {
+    def advance(se: SessionDB) -> None:
+        se.asked_count = turn
+        se.difficulty = next_diff
+        request_recommendations(se, turn, uow.emas())
+        recs.update(recommendations_state(se))
+
+    await uow.commit(s, advance)
+    st.last_question, st.last_bloom, st.difficulty, st.asked = question, target_bloom, next_diff, turn
+    st.seen.add(key)
+    prof = st.profile()
+
+    return {
         "completed": False,
         "target_bloom": target_bloom,
         "difficulty": next_diff,
@@ -157,5 +329,162 @@ def run_turn(
         "confidence": metrics.get("confidence"),
         "errors": metrics.get("errors", []),
         "profile": prof,
-        "recommendations": recs,
+        "recommendations": recs.get("recommendations"),
+        "recommendations_pending": recs.get("pending", False),
+        "recommendations_url": f"/api/session/{session_id}/recommendations",
+        "agent_timings_ms": agent_timings,
+        "prefetch_next": prefetch_next,
     }
+
+
+def _prefetch_next(mode: str, turn: int, curated: bool, max_questions: int) -> bool:
+    """Спекулятивно готовить следующий вопрос имеет смысл, если он будет от LLM и экзамен не закончится по лимиту."""
+    return settings.prefetch_branches > 0 and not curated and not (mode == "exam" and turn >= max_questions)
+
+
+def _with_timings(meta: Dict, tr: Trace) -> Dict:
+    """meta.timings — спаны хода в мс (TRACE_META); те же значения уходят в Server-Timing."""
+    if settings.trace_meta:
+        meta["timings"] = tr.timings()
+    return meta
+
+
+async def run_turn(
+    s: Session,
+    session_id: str,
+    topic: str,
+    mode: str,
+    last_user: str,
+    prev_bloom: str | None,
+    prev_diff: str | None,
+    prev_question: str | None,
+) -> Tuple[str, Dict]:
+    """
+    Возвращает (assistant_reply, meta).
+    В режиме 'exam': после последнего ответа (лимит или правило точности) — завершение сессии
+    (без генерации нового вопроса).
+    """
+    with session_scope(session_id), trace_scope() as tr:
+        try:
+            st, bank = await asyncio.to_thread(_begin_turn, s, session_id, mode, topic)
+            uow = TurnUnitOfWork(st)
+            metrics, agent_timings = await _assess_turn(uow, last_user, prev_question)
+
+            # 2) Проверяем правило завершения экзамена (лимит вопросов / точность theta)
+            asked = st.asked  # сколько вопросов уже задано
+            stop_reason = _exam_stop(mode, uow, prev_question)
+            if stop_reason:
+                summary, meta = await _complete_exam(s, uow, topic, metrics, agent_timings, stop_reason)
+                return summary, _with_timings(meta, tr)
+
+            target_bloom, next_diff = _plan(mode, prev_bloom, prev_diff, metrics)
+
+            # 4) Выбираем источник вопроса:
+            #    для exam — сначала пробуем curated (админский банк), иначе fallback на LLM;
+            #    для diagnostic — сразу LLM.
+            #    LLM-вопрос мог быть заготовлен спекулятивно, пока студент отвечал.
+            #    Банк темы прочитан ещё в _begin_turn, выбор — в памяти.
+            question = _curated_question(bank, uow)
+            curated = question is not None
+            if not curated:
+                with span("prefetch"):
+                    question = await prefetch.store.take(session_id, (target_bloom, next_diff))
+            if not question:
+                with span("tutor"):
+                    question = await agenerate_question(
+                        topic=topic, target_bloom=target_bloom, difficulty=next_diff, last_answer=last_user
+                    )
+
+            meta = await _finish_turn(
+                s, uow, question, target_bloom, next_diff, metrics, agent_timings,
+                prefetch_next=_prefetch_next(mode, asked + 1, curated, _max_questions(st)),
+            )
+            return question, _with_timings(meta, tr)
+        except BaseException:
+            # ход не дошёл до конца — кэш мог разойтись с БД, перечитаем при следующем ходе
+            session_states.invalidate(session_id)
+            raise
+        finally:
+            # usage обычно уходит в транзакцию хода; здесь — остаток этой сессии, если ход оборвался до коммита
+            # (в потоке: синхронная запись в БД не должна держать event loop)
+            await aflush_usage(session_id)
+
+
+async def run_turn_stream(
+    s: Session,
+    session_id: str,
+    topic: str,
+    mode: str,
+    last_user: str,
+    prev_bloom: str | None,
+    prev_diff: str | None,
+    prev_question: str | None,
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Потоковый вариант run_turn: отдаёт события (event, data).
+    "meta" — оценка ответа, как только готова; "token" — куски следующего вопроса;
+    "done" — итоговый reply + полная meta (после сохранения MessageDB);
+    "recommendations" — обновлённые рекомендации, если по debounce их нужно было пересчитать.
+    """
+    with session_scope(session_id), trace_scope() as tr:
+        try:
+            st, bank = await asyncio.to_thread(_begin_turn, s, session_id, mode, topic)
+            uow = TurnUnitOfWork(st)
+            metrics, agent_timings = await _assess_turn(uow, last_user, prev_question)
+
+            asked = st.asked
+            stop_reason = _exam_stop(mode, uow, prev_question)
+            if stop_reason:
+                summary, meta = await _complete_exam(s, uow, topic, metrics, agent_timings, stop_reason)
+                meta = _with_timings(meta, tr)
+                yield "meta", meta
+                yield "done", {"reply": summary, "meta": meta}
+                return
+
+            target_bloom, next_diff = _plan(mode, prev_bloom, prev_diff, metrics)
+            yield "meta", {
+                "completed": False,
+                "target_bloom": target_bloom,
+                "difficulty": next_diff,
+                "score": metrics.get("score"),
+                "confidence": metrics.get("confidence"),
+                "errors": metrics.get("errors", []),
+                "agent_timings_ms": agent_timings,
+            }
+
+            question = _curated_question(bank, uow)
+            curated = question is not None
+            if not curated:
+                with span("prefetch"):
+                    question = await prefetch.store.take(session_id, (target_bloom, next_diff))
+            if question:
+                yield "token", {"text": question}
+            else:
+                parts: List[str] = []
+                with span("tutor"):
+                    async for chunk in astream_question(
+                        topic=topic, target_bloom=target_bloom, difficulty=next_diff, last_answer=last_user
+                    ):
+                        parts.append(chunk)
+                        yield "token", {"text": chunk}
+                question = "".join(parts)
+
+            meta = await _finish_turn(
+                s, uow, question, target_bloom, next_diff, metrics, agent_timings,
+                prefetch_next=_prefetch_next(mode, asked + 1, curated, _max_questions(st)),
+            )
+            meta = _with_timings(meta, tr)
+            yield "done", {"reply": question, "meta": meta}
+            if meta["recommendations_pending"]:
+                # Вопрос уже у студента — досчитываем рекомендации и отдаём отдельным событием
+                state = await refresh_recommendations(session_id)
+                if state:
+                    yield "recommendations", state
+        except BaseException:
+            # ход не дошёл до конца — кэш мог разойтись с БД, перечитаем при следующем ходе
+            session_states.invalidate(session_id)
+            raise
+        finally:
+            # usage обычно уходит в транзакцию хода; здесь — остаток этой сессии, если ход оборвался до коммита
+            # (в потоке: синхронная запись в БД не должна держать event loop)
+            await aflush_usage(session_id)
@@ -0,0 +1,165 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from .config import settings
+from .agents.planner import next_bloom, next_difficulty
+from .agents.tutor import agenerate_question
+from .llm.usage import session_scope, aflush_usage
+
+Branch = Tuple[str, str]  # (target_bloom, difficulty)
+
+# Разброс ожидаемого score вокруг последнего — для оценки вероятности веток планировщика
+SCORE_SIGMA = 0.25
+SCORE_GRID = [i / 100 for i in range(101)]
+
+
+def likely_branches(mode: str, bloom: str, difficulty: str, score: float | None, k: int) -> List[Branch]:
+    """
+    Исходы планировщика для следующего ответа: next_bloom/next_difficulty ступенчатые по score,
+    поэтому веток немного. Вероятность ветки — масса нормального распределения вокруг последнего score.
+    """
+    center = 0.6 if score is None else score
+    mass: Dict[Branch, float] = {}
+    for x in SCORE_GRID:
+        b = (next_bloom(bloom, x, mode), next_difficulty(difficulty, x))
+        mass[b] = mass.get(b, 0.0) + math.exp(-((x - center) ** 2) / (2 * SCORE_SIGMA**2))
+    return [b for b, _ in sorted(mass.items(), key=lambda kv: -kv[1])[:k]]
+
+
+class PrefetchStore:
+    """
+    Спекулятивные вопросы по сессиям: {session_id: {(bloom, difficulty): (expires_at, task | str)}}.
+    Ограничение по числу сессий (LRU) + TTL. take() забирает подходящую ветку и выбрасывает остальные.
+    """
+
+    def __init__(self, ttl_s: float, max_sessions: int):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._items: OrderedDict[str, Dict[Branch, Tuple[float, object]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.hits = 0
+        self.hits_waited = 0
+        self.misses = 0
+        self.no_prefetch = 0
+        self.wasted = 0
+        self.expired = 0
+
+    def _discard(self, entries: Dict[Branch, Tuple[float, object]]) -> None:
+        for _, value in entries.values():
+            if isinstance(value, asyncio.Task) and not value.done():
+                value.cancel()
+        self.wasted += len(entries)
+
+    def put(self, session_id: str, branches: Dict[Branch, asyncio.Task]) -> None:
+        expires_at = time.time() + self.ttl_s
+        with self._lock:
+            old = self._items.pop(session_id, None)
+            if old:
+                self._discard(old)
+            self._items[session_id] = {b: (expires_at, t) for b, t in branches.items()}
+            while len(self._items) > self.max_sessions:
+                _, evicted = self._items.popitem(last=False)
+                self._discard(evicted)
+            self.generated += len(branches)
+
+    def resolve(self, session_id: str, branch: Branch, task: asyncio.Task) -> None:
+        """Готовый результат храним строкой: задача могла жить в другом event loop."""
+        with self._lock:
+            entries = self._items.get(session_id)
+            if not entries or entries.get(branch, (0.0, None))[1] is not task:
+                return
+            if task.cancelled() or task.exception() is not None or not task.result():
+                del entries[branch]
+                return
+            entries[branch] = (entries[branch][0], task.result())
+
+    async def take(self, session_id: str, branch: Branch) -> str | None:
+        with self._lock:
+            entries = self._items.pop(session_id, None)
+            if not entries:
+                self.no_prefetch += 1
+                return None
+            expires_at, value = entries.pop(branch, (0.0, None))
+            self._discard(entries)
+            if value is None:
+                self.misses += 1
+                return None
+            if expires_at <= time.time():
+                self.expired += 1
+                self._discard({branch: (expires_at, value)})
+                return None
+            if isinstance(value, str):
+                self.hits += 1
+                return value
+        # Ещё генерируется: дождаться дешевле, чем начинать заново (если задача в нашем loop)
+        task: asyncio.Task = value
+        if task.get_loop() is not asyncio.get_running_loop():
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            q = await asyncio.shield(task)
+        except Exception:
+            q = None
+        with self._lock:
+            if q:
+                self.hits_waited += 1
+            else:
+                self.misses += 1
+        return q
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            entries = self._items.pop(session_id, None)
+            if entries:
+                self._discard(entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.hits_waited + self.misses + self.expired
+            return {
+                "branches": settings.prefetch_branches,
+                "generated": self.generated,
+                "hits": self.hits,
+                "hits_waited": self.hits_waited,
+                "misses": self.misses,
+                "expired": self.expired,
+                "no_prefetch": self.no_prefetch,
+                "wasted": self.wasted,
+                # доля ходов с prefetch, где нужная ветка нашлась
+                "hit_rate": ((self.hits + self.hits_waited) / lookups) if lookups else None,
+                "sessions": len(self._items),
+            }
+
+
+store = PrefetchStore(ttl_s=settings.prefetch_ttl_s, max_sessions=settings.prefetch_max_sessions)
+
+
+async def prefetch_questions(session_id: str, topic: str, mode: str, question: str, meta: Dict) -> None:
+    """
+    Запускается после отправки вопроса (фоновая задача): генерирует вопросы для PREFETCH_BRANCHES
+    самых вероятных исходов планировщика. Ответ студента ещё неизвестен — опираемся на заданный вопрос.
+    """
+    if settings.prefetch_branches <= 0 or not meta.get("prefetch_next"):
+        return
+    branches = likely_branches(
+        mode, meta["target_bloom"], meta.get("difficulty") or "medium", meta.get("score"), settings.prefetch_branches
+    )
+    with session_scope(session_id):
+        tasks = {
+            b: asyncio.ensure_future(
+                agenerate_question(
+                    topic=topic, target_bloom=b[0], difficulty=b[1], last_answer="", previous_question=question
+                )
+            )
+            for b in branches
+        }
+    store.put(session_id, tasks)
+    for b, t in tasks.items():
+        t.add_done_callback(lambda task, b=b: store.resolve(session_id, b, task))
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    await aflush_usage(session_id)
@@ -1,12 +1,18 @@
+import asyncio
 import json
 import os
+import threading
+from typing import Callable
 import chromadb
 from chromadb.config import Settings
 from ..config import settings
 from ..llm.router import client as llm_client
 from ..llm.errors import RateLimitError, LLMError
+from ..tracing import span
 
 COLLECTION = "content_bank"
+# Создание PersistentClient не потокобезопасно, а _search параллельно идёт через asyncio.to_thread
+_client_lock = threading.Lock()
 
 
 def _client():
@@ -15,35 +21,37 @@ def _client():
 
 
 def _collection():
-    c = _client()
-    try:
-        return c.get_collection(COLLECTION)
-    except Exception:
-        return c.create_collection(COLLECTION)
+    with _client_lock:
+        c = _client()
+        try:
+            return c.get_collection(COLLECTION)
+        except Exception:
+            return c.create_collection(COLLECTION)
 
 
-def add_docs(docs: list[dict]):
+def add_docs(docs: list[dict], on_progress: Callable[[int, int], None] | None = None):
     col = _collection()
-    texts = [d["text"] for d in docs]
-    embs = llm_client.embed(texts)  # пусть поднимет исключение выше — сидирование делаем оффлайн
-    col.add(
-        documents=texts,
-        embeddings=embs,
-        ids=[d["id"] for d in docs],
-        metadatas=[
-            {"topic": d.get("topic", ""), "skill": d.get("skill", ""), "level": d.get("level", "")}
-            for d in docs
-        ],
-    )
+    batch = max(1, settings.embed_batch_size)
+    for start in range(0, len(docs), batch):
+        chunk = docs[start : start + batch]
+        texts = [d["text"] for d in chunk]
+        # llm_client кэширует эмбеддинги по содержимому — повторное сидирование не ходит к провайдеру
+        embs = llm_client.embed(texts)  # пусть поднимет исключение выше — сидирование делаем оффлайн
+        col.add(
+            documents=texts,
+            embeddings=embs,
+            ids=[d["id"] for d in chunk],
+            metadatas=[
+                {"topic": d.get("topic", ""), "skill": d.get("skill", ""), "level": d.get("level", "")}
+                for d in chunk
+            ],
+        )
+        if on_progress:
+            on_progress(start + len(chunk), len(docs))
 
 
-def query(text: str, n: int = 5, topic: str | None = None):
+def _search(q_emb: list[float], n: int, topic: str | None):
     col = _collection()
-    try:
-        q_emb = llm_client.embed([text])[0]
-    except (RateLimitError, LLMError, Exception):
-        # Если эмбеддинги недоступны (rate limit/ошибка), просто вернём пустой контекст — тут есть graceful fallback в Tutor.
-        return []
     where = {"topic": topic} if topic else None
     res = col.query(query_embeddings=[q_emb], n_results=n, where=where)
     hits = []
@@ -59,6 +67,26 @@ def query(text: str, n: int = 5, topic: str | None = None):
     return hits
 
 
+def query(text: str, n: int = 5, topic: str | None = None):
+    try:
+        q_emb = llm_client.embed([text])[0]
+    except (RateLimitError, LLMError, Exception):
+        # Если эмбеддинги недоступны (rate limit/ошибка), просто вернём пустой контекст — тут есть graceful fallback в Tutor.
+        return []
+    return _search(q_emb, n, topic)
+
+
+async def aquery(text: str, n: int = 5, topic: str | None = None):
+    try:
+        with span("rag_embed"):
+            q_emb = (await llm_client.aembed([text]))[0]
+    except (RateLimitError, LLMError, Exception):
+        return []
+    # Chroma синхронная — поиск уводим в поток, чтобы не блокировать event loop
+    with span("rag_search"):
+        return await asyncio.to_thread(_search, q_emb, n, topic)
+
+
 def seed_if_empty():
     col = _collection()
     if col.count() > 0:
@@ -76,4 +104,4 @@ def seed_if_empty():
                 "level": item.get("level", "remember"),
             }
         )
-    add_docs(docs)
+    add_docs(docs, on_progress=lambda done, total: print(f"[seed] embedded {done}/{total}"))
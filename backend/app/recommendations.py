@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlmodel import Session, select
+from .config import settings
+from .db import engine
+from .models import MessageDB, SessionDB
+from .assessment import aggregate_profile
+from .agents.summarizer import HISTORY_WINDOW, arecommendations
+from .llm.usage import session_scope, aflush_usage
+from .tracing import span
+
+# Сессии, для которых пересчёт уже идёт в этом процессе (второй воркер не запускаем)
+_running: set[str] = set()
+
+
+def _profile_delta(prev: Dict[str, float] | None, skills: Dict[str, float]) -> float:
+    prev = prev or {}
+    keys = set(prev) | set(skills)
+    return max((abs(skills.get(k, 0.0) - prev.get(k, 0.0)) for k in keys), default=0.0)
+
+
+def request_recommendations(se: SessionDB, turn: int, skills: Dict[str, float]) -> bool:
+    """
+    Debounce: помечает сессию «рекомендации устарели» (recs_requested = turn), если профиль уже есть и
+    прошло RECS_EVERY_N_TURNS ходов с прошлого запроса либо EMA какого-то навыка сдвинулась на RECS_PROFILE_DELTA.
+    Коммит — вместе с ходом; сам пересчёт — refresh_recommendations() после ответа.
+    """
+    if not skills:
+        return False
+    due = (
+        not se.recs_requested
+        or turn - se.recs_requested >= settings.recs_every_n_turns
+        or _profile_delta(se.recs_profile, skills) >= settings.recs_profile_delta
+    )
+    if due:
+        se.recs_requested = turn
+        se.recs_profile = skills
+    return due
+
+
+def recommendations_state(se: SessionDB) -> Dict:
+    """Последние сохранённые рекомендации + признак, что пересчёт ещё не завершён."""
+    return {
+        "recommendations": se.recommendations,
+        "pending": (se.recs_requested or 0) > (se.recs_turn or 0),
+        "turn": se.recs_turn or 0,
+        "updated_at": se.recs_updated_at.isoformat() if se.recs_updated_at else None,
+    }
+
+
+def _load_inputs(session_id: str) -> Tuple[str, int, List[Dict], Dict[str, float]] | None:
+    """(topic, recs_requested, последние HISTORY_WINDOW сообщений, EMA навыков) или None, если пересчитывать нечего."""
+    with Session(engine) as s:
+        se = s.get(SessionDB, session_id)
+        if not se or (se.recs_requested or 0) <= (se.recs_turn or 0):
+            return None
+        rows = s.exec(
+            select(MessageDB)
+            .where(MessageDB.session_id == session_id)
+            .order_by(MessageDB.ts.desc())
+            .limit(HISTORY_WINDOW)
+        ).all()
+        prof = aggregate_profile(s, session_id)
+        return se.topic, se.recs_requested, [m.model_dump() for m in reversed(rows)], {k: v["ema"] for k, v in prof.items()}
+
+
+def _save(session_id: str, requested: int, recs: str) -> Dict:
+    with Session(engine) as s:
+        se = s.get(SessionDB, session_id)
+        se.recommendations = recs
+        se.recs_turn = requested
+        se.recs_updated_at = datetime.utcnow()
+        s.add(se)
+        s.commit()
+        return recommendations_state(se)
+
+
+async def refresh_recommendations(session_id: str) -> Dict | None:
+    """
+    Фоновый пересчёт: пока recs_requested > recs_turn — считаем рекомендации по свежей истории и профилю.
+    Возвращает новое состояние или None, если пересчитывать нечего / уже считает другой воркер.
+    Чтение и запись БД — в потоке, соединение на время вызова Summarizer не держим.
+    """
+    if session_id in _running:
+        return None
+    _running.add(session_id)
+    try:
+        with session_scope(session_id):
+            state = None
+            while True:
+                inputs = await asyncio.to_thread(_load_inputs, session_id)
+                if inputs is None:
+                    return state
+                topic, requested, history, skills = inputs
+                try:
+                    with span("summarizer"):
+                        recs = await arecommendations(topic, history=history, skills=skills)
+                except Exception:
+                    # Провайдер недоступен — оставляем прошлые рекомендации, повторим на следующем запросе
+                    return None
+                state = await asyncio.to_thread(_save, session_id, requested, recs)
+    finally:
+        _running.discard(session_id)
+        await aflush_usage(session_id)
@@ -1,18 +1,12 @@
 import io
 import matplotlib.pyplot as plt
-from collections import Counter
-from sqlmodel import Session, select
-from .models import MessageDB
-from .assessment import aggregate_profile
+from sqlmodel import Session
+from .models import SessionDB
+from .assessment import aggregate_profile, theta_se
+from .aggregates import ensure_aggregates, metrics
 from .s3_client import put_bytes, put_json
 
 
-def _bloom_solo_counts(msgs: list[MessageDB]):
-    bloom = Counter([m.bloom_level for m in msgs if m.role == "user" and m.bloom_level])
-    solo = Counter([m.solo_level for m in msgs if m.role == "user" and m.solo_level])
-    return bloom, solo
-
-
 def generate_report_png(s: Session, session_id: str) -> str:
     prof = aggregate_profile(s, session_id)
     skills = list(prof.keys()) or ["general"]
@@ -33,22 +27,14 @@ def generate_report_png(s: Session, session_id: str) -> str:
 
 def export_profile_json(s: Session, session_id: str) -> str:
     prof = aggregate_profile(s, session_id)
-    msgs = (
-        s.exec(select(MessageDB).where(MessageDB.session_id == session_id).order_by(MessageDB.ts.asc()))
-        .all()
-    )
-    bloom_c, solo_c = _bloom_solo_counts(msgs)
-    scores = [m.score for m in msgs if m.role == "user" and m.score is not None]
-    avg_score = (sum(scores) / len(scores)) if scores else None
+    se = s.get(SessionDB, session_id)
+    ensure_aggregates(s, se)
     data = {
         "session_id": session_id,
-        "profile": [{"skill": k, "ema": v["ema"], "theta": v["theta"]} for k, v in prof.items()],
-        "metrics": {
-            "avg_score": avg_score,
-            "bloom_counts": dict(bloom_c),
-            "solo_counts": dict(solo_c),
-            "turns": len([m for m in msgs if m.role == "user"]),
-        },
+        "profile": [
+            {"skill": k, "ema": v["ema"], "theta": v["theta"], "theta_se": theta_se(v["info"])} for k, v in prof.items()
+        ],
+        "metrics": metrics(se),
     }
     key = f"reports/{session_id}/profile.json"
     return put_json(key, data)
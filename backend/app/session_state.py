@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Set
+from sqlalchemy import func
+from sqlmodel import Session, select
+from .calibration import item_key
+from .config import settings
+from .models import MessageDB, SessionDB, SkillScoreDB
+from . import user_profile
+
+
+@dataclass
+class SessionState:
+    """
+    Всё, что нужно ходу: последний вопрос (текст, Bloom, сложность), сколько вопросов задано,
+    вектор навыков и короткое окно истории. Источник истины — БД; здесь — write-through копия.
+    """
+
+    session_id: str
+    topic: str
+    mode: str
+    user_id: str | None = None
+    last_question: str | None = None
+    last_bloom: str | None = None
+    difficulty: str | None = None
+    asked: int = 0
+    max_questions: int | None = None
+    skills: Dict[str, Dict[str, float]] = field(default_factory=dict)  # skill -> {"ema", "theta", "info"}
+    history: Deque[Dict] = field(default_factory=deque)
+    seen: Set[str] = field(default_factory=set)  # item_key заданных вопросов — CAT их не повторяет
+    theta_info: float = 0.0  # информация ответов о theta сессии (SessionDB.theta_info)
+    version: int = 0
+
+    def profile(self) -> Dict[str, Dict[str, float]]:
+        return {k: dict(v) for k, v in self.skills.items()}
+
+    def emas(self) -> Dict[str, float]:
+        return {k: v["ema"] for k, v in self.skills.items()}
+
+    @staticmethod
+    def history_entry(m: MessageDB) -> Dict:
+        # снимок до коммита: после commit атрибуты ORM-объекта истекают и читаются заново из БД
+        return {
+            "role": m.role,
+            "content": m.content,
+            "bloom_level": m.bloom_level,
+            "solo_level": m.solo_level,
+            "score": m.score,
+        }
+
+
+def _load(s: Session, se: SessionDB) -> SessionState:
+    window = max(1, settings.session_history_window)
+    st = SessionState(
+        session_id=se.id,
+        topic=se.topic,
+        mode=se.mode,
+        user_id=se.user_id,
+        difficulty=se.difficulty,
+        max_questions=se.max_questions,
+        version=se.state_version or 0,
+        theta_info=se.theta_info or 0.0,
+        history=deque(maxlen=window),
+    )
+    recent: List[MessageDB] = s.exec(
+        select(MessageDB).where(MessageDB.session_id == se.id).order_by(MessageDB.ts.desc()).limit(window)
+    ).all()
+    for m in reversed(recent):
+        st.history.append(SessionState.history_entry(m))
+    last_q = next((m for m in recent if m.role == "assistant"), None)
+    if last_q is None and len(recent) == window:
+        last_q = s.exec(
+            select(MessageDB)
+            .where(MessageDB.session_id == se.id, MessageDB.role == "assistant")
+            .order_by(MessageDB.ts.desc())
+        ).first()
+    if last_q:
+        st.last_question = last_q.content
+        st.last_bloom = last_q.bloom_level
+        st.difficulty = st.difficulty or last_q.difficulty
+
+    if se.asked_count is None:
+        # сессии до появления asked_count — считаем один раз и сохраняем
+        se.asked_count = s.exec(
+            select(func.count(MessageDB.id)).where(MessageDB.session_id == se.id, MessageDB.role == "assistant")
+        ).one()
+        s.add(se)
+        s.commit()
+    st.asked = se.asked_count
+
+    for key, content in s.exec(
+        select(MessageDB.item_key, MessageDB.content).where(MessageDB.session_id == se.id, MessageDB.role == "assistant")
+    ).all():
+        st.seen.add(key or item_key(content))
+
+    own = {
+        r.skill: {"ema": r.ema_score, "theta": r.irt_theta, "info": r.irt_info or 0.0}
+        for r in s.exec(select(SkillScoreDB).where(SkillScoreDB.session_id == se.id)).all()
+    }
+    if se.user_id:
+        # warm start: навыки, которых сессия ещё не касалась, — из профиля пользователя на старте сессии.
+        # Старые сессии без start_skills снимают профиль, только пока ответов нет: позже он уже не стартовый
+        if se.start_skills is None and not own:
+            se.start_skills = user_profile.warm_start(s, se.user_id)
+            s.add(se)
+            s.commit()
+        st.skills.update({k: dict(v) for k, v in (se.start_skills or {}).items()})
+    st.skills.update(own)
+    return st
+
+
+class SessionStateCache:
+    """
+    Ограниченный LRU SessionState по session_id. Запись — write-through (оркестратор сначала коммитит
+    в БД, потом обновляет состояние); SessionDB.state_version ловит изменения из других процессов.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, SessionState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, s: Session, se: SessionDB) -> SessionState:
+        with self._lock:
+            st = self._items.get(se.id)
+            if st is not None and st.version == (se.state_version or 0):
+                self._items.move_to_end(se.id)
+                return st
+        st = _load(s, se)
+        with self._lock:
+            self._items[se.id] = st
+            self._items.move_to_end(se.id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return st
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._items.pop(session_id, None)
+
+
+session_states = SessionStateCache(max_entries=settings.session_cache_size)
+
+
+def bump_version(se: SessionDB, st: SessionState) -> None:
+    """Перед коммитом хода: новая версия состояния в БД и в кэше."""
+    se.state_version = (se.state_version or 0) + 1
+    st.version = se.state_version
@@ -0,0 +1,120 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+from .config import settings
+
+
+class Trace:
+    """Спаны одного хода: имя -> суммарное время, мс (одноимённые спаны складываются)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+    def timings(self) -> Dict[str, float]:
+        with self._lock:
+            out = {k: round(v, 1) for k, v in self.spans.items()}
+        out["total"] = round(self.total_ms(), 1)
+        return out
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{k};dur={v}" for k, v in self.timings().items())
+
+
+# Текущий ход; asyncio.gather/to_thread копируют контекст — спаны дочерних задач попадают в тот же Trace
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("turn_trace", default=None)
+
+
+@contextmanager
+def trace_scope(tr: Trace | None = None, sample: bool = True) -> Iterator[Trace]:
+    """
+    Корневой scope делает tr (или новый Trace) текущим и по выходу сэмплирует его в timing_stats;
+    вложенный — переиспользует текущий. sample=False — трасса продолжится в другом scope (SSE-стрим).
+    """
+    current = _trace.get()
+    if current is not None:
+        yield current
+        return
+    tr = tr or Trace()
+    token = _trace.set(tr)
+    try:
+        yield tr
+    finally:
+        try:
+            _trace.reset(token)
+        except ValueError:
+            # async-генератор закрыт из другого контекста
+            pass
+        if sample:
+            timing_stats.maybe_add(tr)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    tr = _trace.get()
+    if tr is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add(name, (time.perf_counter() - t0) * 1000)
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class TimingStats:
+    """Сэмплированные тайминги ходов (TRACE_SAMPLE_RATE): последние TRACE_WINDOW значений на этап."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._stages: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.traces = 0
+
+    def maybe_add(self, tr: Trace) -> None:
+        if settings.trace_sample_rate <= 0 or random.random() >= settings.trace_sample_rate:
+            return
+        timings = tr.timings()
+        with self._lock:
+            self.traces += 1
+            for name, ms in timings.items():
+                self._stages.setdefault(name, deque(maxlen=self.window)).append(ms)
+                self._counts[name] = self._counts.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stages = {}
+            for name, values in self._stages.items():
+                vs = sorted(values)
+                stages[name] = {
+                    "count": self._counts[name],
+                    "mean_ms": round(sum(vs) / len(vs), 1),
+                    "p50_ms": _pct(vs, 0.5),
+                    "p95_ms": _pct(vs, 0.95),
+                    "max_ms": vs[-1],
+                }
+            return {"sample_rate": settings.trace_sample_rate, "traces": self.traces, "stages": stages}
+
+
+timing_stats = TimingStats(window=settings.trace_window)
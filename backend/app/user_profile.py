@@ -0,0 +1,164 @@
+"""
+Профиль навыков пользователя поверх сессий. UserSkillDB — текущее состояние (строка на навык) и значения
+на конец предыдущей сессии; UserSkillHistoryDB — append-only история. Оба пишутся в транзакции хода,
+новая сессия стартует с профиля пользователя вместо SKILL_DEFAULT.
+"""
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import case, delete, insert
+from sqlmodel import Session, select
+from .assessment import CHUNK, SKILL_DEFAULT
+from .db import insert_for
+from .models import UserSkillDB, UserSkillHistoryDB, uuid_str
+
+
+def record(s: Session, user_id: str, session_id: str, skills: Dict[str, Dict[str, float]], score: float | None) -> None:
+    """Новые значения навыков хода -> UserSkillDB (upsert) + история; коммит за вызывающим."""
+    if not skills:
+        return
+    now = datetime.utcnow()
+    stmt = insert_for(s)(UserSkillDB)
+    # первая запись хода другой сессии: текущие значения уходят в prev_* — тренд «с прошлой сессии»
+    new_session = UserSkillDB.last_session_id.is_distinct_from(stmt.excluded.last_session_id)
+    s.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id", "skill"],
+            set_={
+                "prev_ema_score": case((new_session, UserSkillDB.ema_score), else_=UserSkillDB.prev_ema_score),
+                "prev_irt_theta": case((new_session, UserSkillDB.irt_theta), else_=UserSkillDB.prev_irt_theta),
+                "ema_score": stmt.excluded.ema_score,
+                "irt_theta": stmt.excluded.irt_theta,
+                "answers": UserSkillDB.answers + 1,
+                "last_session_id": stmt.excluded.last_session_id,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        ),
+        [
+            {
+                "id": uuid_str(),
+                "user_id": user_id,
+                "skill": skill,
+                "ema_score": v["ema"],
+                "irt_theta": v["theta"],
+                "prev_ema_score": SKILL_DEFAULT["ema"],
+                "prev_irt_theta": SKILL_DEFAULT["theta"],
+                "answers": 1,
+                "last_session_id": session_id,
+                "updated_at": now,
+            }
+            for skill, v in skills.items()
+        ],
+    )
+    s.execute(
+        insert(UserSkillHistoryDB),
+        [
+            {
+                "id": uuid_str(),
+                "user_id": user_id,
+                "skill": skill,
+                "session_id": session_id,
+                "ema_score": v["ema"],
+                "irt_theta": v["theta"],
+                "score": score,
+                "ts": now,
+            }
+            for skill, v in skills.items()
+        ],
+    )
+
+
+def rebuild(s: Session, user_ids: List[str], points: List[Dict]) -> None:
+    """
+    Профиль и история пользователей заново из переигранных ответов (assessment.replay_sessions): points —
+    обновления навыков в порядке времени; prev_* и answers сворачиваются так же, как их вёл бы record().
+    Коммит за вызывающим.
+    """
+    for i in range(0, len(user_ids), CHUNK):
+        chunk = user_ids[i : i + CHUNK]
+        s.execute(delete(UserSkillDB).where(UserSkillDB.user_id.in_(chunk)))
+        s.execute(delete(UserSkillHistoryDB).where(UserSkillHistoryDB.user_id.in_(chunk)))
+    current: Dict[Tuple[str, str], Dict] = {}
+    for p in points:
+        row = current.get((p["user_id"], p["skill"]))
+        if row is None:
+            row = current[(p["user_id"], p["skill"])] = {
+                "id": uuid_str(),
+                "user_id": p["user_id"],
+                "skill": p["skill"],
+                "prev_ema_score": SKILL_DEFAULT["ema"],
+                "prev_irt_theta": SKILL_DEFAULT["theta"],
+                "answers": 0,
+            }
+        elif row["last_session_id"] != p["session_id"]:
+            row["prev_ema_score"], row["prev_irt_theta"] = row["ema_score"], row["irt_theta"]
+        row.update(
+            ema_score=p["ema"],
+            irt_theta=p["theta"],
+            answers=row["answers"] + 1,
+            last_session_id=p["session_id"],
+            updated_at=p["ts"],
+        )
+    if current:
+        s.execute(insert(UserSkillDB), list(current.values()))
+    if points:
+        s.execute(
+            insert(UserSkillHistoryDB),
+            [
+                {
+                    "id": uuid_str(),
+                    "user_id": p["user_id"],
+                    "skill": p["skill"],
+                    "session_id": p["session_id"],
+                    "ema_score": p["ema"],
+                    "irt_theta": p["theta"],
+                    "score": p["score"],
+                    "ts": p["ts"],
+                }
+                for p in points
+            ],
+        )
+
+
+def warm_start(s: Session, user_id: str) -> Dict[str, Dict[str, float]]:
+    """
+    Стартовый вектор навыков сессии. info — ноль: SE и правило остановки exam считаются по ответам
+    этой сессии, а не по прошлым.
+    """
+    rows = s.exec(select(UserSkillDB).where(UserSkillDB.user_id == user_id)).all()
+    return {r.skill: {"ema": r.ema_score, "theta": r.irt_theta, "info": 0.0} for r in rows}
+
+
+def profile(s: Session, user_id: str) -> List[Dict]:
+    """Текущий профиль и тренд с прошлой сессии — одно чтение по (user_id)."""
+    rows = s.exec(select(UserSkillDB).where(UserSkillDB.user_id == user_id).order_by(UserSkillDB.skill)).all()
+    return [
+        {
+            "skill": r.skill,
+            "ema": r.ema_score,
+            "theta": r.irt_theta,
+            "answers": r.answers,
+            "trend": {"ema": r.ema_score - r.prev_ema_score, "theta": r.irt_theta - r.prev_irt_theta},
+            "updated_at": r.updated_at.isoformat(),
+        }
+        for r in rows
+    ]
+
+
+def history(s: Session, user_id: str, skill: str, limit: int) -> List[Dict]:
+    """Последние limit точек истории навыка (по индексу user_id, skill, ts) в порядке времени."""
+    rows = s.exec(
+        select(UserSkillHistoryDB)
+        .where(UserSkillHistoryDB.user_id == user_id, UserSkillHistoryDB.skill == skill)
+        .order_by(UserSkillHistoryDB.ts.desc())
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "ts": r.ts.isoformat(),
+            "session_id": r.session_id,
+            "ema": r.ema_score,
+            "theta": r.irt_theta,
+            "score": r.score,
+        }
+        for r in reversed(rows)
+    ]
@@ -0,0 +1,110 @@
+"""
+End-to-end бенчмарк run_turn на mock-провайдере (без сети и ключей).
+
+    python -m backend.bench.run_turn --sessions 50 --turns 10
+    MOCK_CHAT_LATENCY_MS=300 MOCK_RATE_LIMIT_RATE=0.05 python -m backend.bench.run_turn
+    MOCK_CHAT_LATENCY_MS=0 MOCK_EMBED_LATENCY_MS=0 python -m backend.bench.run_turn  # только БД/оркестратор
+    EXAM_STOP_RULE=precision python -m backend.bench.run_turn --mode exam  # stop_reasons: досрочные завершения
+
+Поведение провайдера настраивается через MOCK_* (см. config.py).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def _setup_env(workdir: str) -> None:
+    # Settings читаются при импорте — окружение готовим до импорта backend.app
+    os.environ.setdefault("LLM_PROVIDER", "mock")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    os.environ.setdefault("VECTOR_DB_DIR", f"{workdir}/chroma")
+    os.environ.setdefault("LLM_CACHE_PATH", f"{workdir}/llm_cache.sqlite3")
+    os.environ.setdefault("EMBED_CACHE_PATH", f"{workdir}/embed_cache.sqlite3")
+    os.environ.setdefault("LLM_RATE_LIMIT_RPS", "0")
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def _run(args) -> dict:
+    from sqlalchemy import event
+    from sqlmodel import Session
+    from backend.app.db import engine, init_db
+    from backend.app.models import SessionDB
+    from backend.app.orchestrator import run_turn
+
+    init_db()
+    latencies: list[float] = []
+    stop_reasons: dict[str, int] = {}
+    commits = 0
+
+    def on_commit(conn) -> None:
+        nonlocal commits
+        commits += 1
+
+    # каждый COMMIT в SQLite — fsync и глобальная блокировка записи
+    event.listen(engine, "commit", on_commit)
+
+    async def one_session(i: int) -> None:
+        with Session(engine) as s:
+            se = SessionDB(mode=args.mode, topic=args.topic, student_id=f"bench-{i}")
+            s.add(se)
+            s.commit()
+            s.refresh(se)
+            prev_q, prev_bloom, prev_diff = None, None, None
+            last_user = "Я готов начать."
+            for t in range(args.turns + 1):
+                t0 = time.perf_counter()
+                reply, meta = await run_turn(
+                    s,
+                    session_id=se.id,
+                    topic=args.topic,
+                    mode=args.mode,
+                    last_user=last_user,
+                    prev_bloom=prev_bloom,
+                    prev_diff=prev_diff,
+                    prev_question=prev_q,
+                )
+                latencies.append(time.perf_counter() - t0)
+                if meta.get("completed"):
+                    reason = meta.get("stop_reason", "completed")
+                    stop_reasons[reason] = stop_reasons.get(reason, 0) + 1
+                    break
+                prev_q, prev_bloom, prev_diff = reply, meta.get("target_bloom"), meta.get("difficulty")
+                last_user = f"Ответ студента {i} на ход {t}"
+
+    t0 = time.perf_counter()
+    commits = 0  # создание сессий и сидирование в init_db не считаем
+    await asyncio.gather(*(one_session(i) for i in range(args.sessions)))
+    wall = time.perf_counter() - t0
+    return {
+        "sessions": args.sessions,
+        "turns": len(latencies),
+        "wall_s": round(wall, 3),
+        "turns_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(_pct(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(_pct(latencies, 0.95) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else None,
+        "commits_per_turn": round(commits / len(latencies), 2) if latencies else None,
+        "stop_reasons": stop_reasons,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="run_turn benchmark on the mock LLM provider")
+    ap.add_argument("--sessions", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=10)
+    ap.add_argument("--mode", default="diagnostic", choices=["diagnostic", "exam"])
+    ap.add_argument("--topic", default="probability")
+    args = ap.parse_args()
+    _setup_env(tempfile.mkdtemp(prefix="tutor-bench-"))
+    print(asyncio.run(_run(args)))
+
+
+if __name__ == "__main__":
+    main()
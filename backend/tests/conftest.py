@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+
+# Settings и engine создаются при импорте backend.app — окружение готовим до него
+_tmp = tempfile.mkdtemp(prefix="tutor-tests-")
+os.environ.setdefault("LLM_PROVIDER", "mock")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("VECTOR_DB_DIR", f"{_tmp}/chroma")
+os.environ.setdefault("LLM_CACHE_PATH", f"{_tmp}/llm_cache.sqlite3")
+os.environ.setdefault("EMBED_CACHE_PATH", f"{_tmp}/embed_cache.sqlite3")
+# mock-провайдер без задержек и без клиентского лимита — тесты, которым нужна латентность, выставляют её сами
+os.environ.setdefault("MOCK_CHAT_LATENCY_MS", "0")
+os.environ.setdefault("MOCK_EMBED_LATENCY_MS", "0")
+os.environ.setdefault("MOCK_TOKEN_MS", "0")
+os.environ.setdefault("LLM_RATE_LIMIT_RPS", "1000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import pytest  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    from backend.app.db import engine, init_db
+
+    init_db()
+    with Session(engine) as s:
+        yield s
+        s.rollback()
+
+
+@pytest.fixture
+def api():
+    """TestClient приложения и заголовки зарегистрированного студента."""
+    from fastapi.testclient import TestClient
+    from backend.app.db import init_db
+    from backend.app.main import app
+    from backend.app.models import uuid_str
+
+    init_db()
+    c = TestClient(app)
+    name = uuid_str()[:8]
+    r = c.post("/api/auth/register", json={"email": f"{name}@example.com", "username": name, "password": "pw"})
+    return c, {"Authorization": f"Bearer {r.json()['token']}"}
@@ -0,0 +1,55 @@
+import pytest
+from sqlmodel import select
+from backend.app import aggregates
+from backend.app.models import MessageDB, SessionDB
+
+ANSWERS = [
+    dict(content="Я готов начать."),
+    dict(content="a1", score=0.5, bloom_level="apply", solo_level="relational"),
+    dict(content="a2", score=None, bloom_level="apply"),
+    dict(content="a3", score=1.0, bloom_level="analyze", solo_level="relational"),
+]
+
+
+def _session_with_answers(db, apply: bool) -> SessionDB:
+    se = SessionDB(mode="diagnostic", topic="t")
+    db.add(se)
+    for kw in ANSWERS:
+        msg = MessageDB(session_id=se.id, role="user", **kw)
+        db.add(msg)
+        db.add(MessageDB(session_id=se.id, role="assistant", content="q", bloom_level="remember"))
+        if apply:
+            aggregates.apply_answer(se, msg)
+            aggregates.apply_answer(se, MessageDB(session_id=se.id, role="assistant", content="q"))
+    db.add(se)
+    db.commit()
+    return se
+
+
+def test_incremental_aggregates_survive_commit(db):
+    se = _session_with_answers(db, apply=True)
+    db.expire_all()
+    se = db.exec(select(SessionDB).where(SessionDB.id == se.id)).one()
+    assert aggregates.metrics(se) == {
+        "avg_score": pytest.approx(0.75),
+        "bloom_counts": {"apply": 2, "analyze": 1},
+        "solo_counts": {"relational": 2},
+        "turns": 4,
+    }
+
+
+def test_backfill_matches_incremental(db):
+    live = _session_with_answers(db, apply=True)
+    legacy = _session_with_answers(db, apply=False)
+    legacy.score_count = None
+    db.add(legacy)
+    db.commit()
+    assert aggregates.needs_backfill(legacy)
+    aggregates.ensure_aggregates(db, legacy)
+    db.expire_all()
+    assert not aggregates.needs_backfill(legacy)
+    assert aggregates.metrics(legacy) == aggregates.metrics(live)
+
+
+def test_avg_score_without_scores_is_none():
+    assert aggregates.avg_score(SessionDB(mode="diagnostic", topic="t")) is None
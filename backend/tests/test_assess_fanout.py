@@ -0,0 +1,46 @@
+import asyncio
+import time
+from backend.app import orchestrator
+from backend.app.config import settings
+
+
+def _slow_agents(monkeypatch, delay_s: float) -> None:
+    async def judge(question, answer, timeout=None):
+        await asyncio.sleep(delay_s)
+        return {"score": 0.5, "bloom_level": "apply", "skills": ["algebra"]}
+
+    async def bloom(text, timeout=None):
+        await asyncio.sleep(delay_s)
+        return "analyze"
+
+    async def solo(text, timeout=None):
+        await asyncio.sleep(delay_s)
+        return "relational"
+
+    monkeypatch.setattr(orchestrator, "ascore_answer", judge)
+    monkeypatch.setattr(orchestrator, "atag_bloom", bloom)
+    monkeypatch.setattr(orchestrator, "atag_solo", solo)
+    monkeypatch.setattr(settings, "fused_assessor", False)
+
+
+def _assess():
+    t0 = time.perf_counter()
+    out = asyncio.run(orchestrator._assess_answer("q", "a"))
+    return out, time.perf_counter() - t0
+
+
+def test_judge_and_taggers_run_concurrently(monkeypatch):
+    _slow_agents(monkeypatch, 0.1)
+    monkeypatch.setattr(settings, "assess_concurrency", 3)
+    (js, bloom, solo, timings), elapsed = _assess()
+    assert (js["score"], bloom, solo) == (0.5, "analyze", "relational")
+    assert elapsed < 0.2
+    assert set(timings) == {"judge", "bloom_tagger", "solo_tagger", "assessment_total"}
+    assert timings["assessment_total"] < 200
+
+
+def test_assess_concurrency_limits_fan_out(monkeypatch):
+    _slow_agents(monkeypatch, 0.05)
+    monkeypatch.setattr(settings, "assess_concurrency", 1)
+    _, elapsed = _assess()
+    assert elapsed >= 0.15
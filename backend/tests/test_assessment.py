@@ -0,0 +1,107 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+import pytest
+from backend.app import orchestrator
+from backend.app.agents.assessor import _validate
+from backend.app.assessment import AssessmentEngine, answer_score, assessment_engine, session_answers
+from backend.app.models import SessionDB
+from backend.app.session_state import SessionState
+
+SKILLS = ["algebra", "logic", "geometry", "calculus"]
+
+
+def _answers(n_sessions: int, n_answers: int, seed: int = 0):
+    """Ответы сессий вперемешку (как в MessageDB по ts), порядок внутри сессии сохраняется."""
+    rng = random.Random(seed)
+    queues = []
+    for i in range(n_sessions):
+        q = []
+        for _ in range(rng.randint(1, n_answers)):
+            skills = rng.sample(SKILLS, rng.randint(1, 3))
+            q.append((f"s{i}", skills + skills[:1], rng.random(), None))  # повтор навыка — учитывается один раз
+        queues.append(q[::-1])
+    out = []
+    while queues:
+        q = rng.choice(queues)
+        out.append(q.pop())
+        if not q:
+            queues.remove(q)
+    return out
+
+
+def _sequential(engine: AssessmentEngine, answers, seed=None):
+    vectors = {}
+    for sid, skills, score, item in answers:
+        vec = vectors.setdefault(sid, {k: dict(v) for k, v in (seed or {}).get(sid, {}).items()})
+        vec.update(engine.update(vec, skills, score, item=item))
+    return {sid: {k: v for k, v in vec.items() if k in _touched(answers, sid)} for sid, vec in vectors.items()}
+
+
+def _touched(answers, sid):
+    return {sk for s, skills, *_ in answers if s == sid for sk in skills}
+
+
+def _assert_close(a, b):
+    assert a.keys() == b.keys()
+    for sid in a:
+        assert a[sid].keys() == b[sid].keys()
+        for sk in a[sid]:
+            for f in ("ema", "theta", "info"):
+                assert a[sid][sk][f] == pytest.approx(b[sid][sk][f], abs=1e-12)
+
+
+def test_replay_matches_sequential_updates(db):
+    engine = AssessmentEngine(alpha=0.35)
+    answers = _answers(30, 8)
+    _assert_close(engine.replay(db, answers, from_scratch=True), _sequential(engine, answers))
+
+
+def test_replay_from_seed_matches_warm_started_updates(db):
+    engine = AssessmentEngine(alpha=0.35)
+    answers = _answers(10, 6, seed=1)
+    seed = {f"s{i}": {"algebra": {"ema": 0.8, "theta": 0.7, "info": 0.0}} for i in range(0, 10, 2)}
+    trail = []
+    out = engine.replay(db, answers, from_scratch=True, seed=seed, trail=trail)
+    _assert_close(out, _sequential(engine, answers, seed))
+    # trail: по строке на (ответ, навык); последняя точка навыка — итоговое значение
+    assert len(trail) == sum(len(set(skills)) for _, skills, *_ in answers)
+    last = {(sid, sk): (ema, theta, info) for sid, _, sk, ema, theta, info in trail}
+    for (sid, sk), (ema, theta, info) in last.items():
+        assert (ema, theta, info) == pytest.approx((out[sid][sk]["ema"], out[sid][sk]["theta"], out[sid][sk]["info"]))
+
+
+def test_unscored_answer_is_skipped_online_and_in_replay(db, monkeypatch):
+    replies = [
+        {"score": 0.9, "skills": ["algebra"]},
+        {"skills": ["algebra", "logic"], "errors": ["no score"]},
+        {"score": None, "skills": ["logic"]},
+        {"score": 0.2, "skills": ["logic"]},
+    ]
+
+    async def judge(question, answer):
+        return replies.pop(0), "apply", "relational", {}
+
+    monkeypatch.setattr(orchestrator, "_assess_answer", judge)
+    se = SessionDB(mode="diagnostic", topic="t")
+    db.add(se)
+    st = SessionState(session_id=se.id, topic="t", mode="diagnostic")
+    t0 = datetime(2026, 1, 1)
+    for i in range(len(replies)):
+        uow = orchestrator.TurnUnitOfWork(st)
+        asyncio.run(orchestrator._assess_turn(uow, f"a{i}", "q"))
+        uow.user_msg.ts = t0 + timedelta(seconds=i)
+        db.add(uow.user_msg)
+        st.skills.update(uow.skills)
+    db.commit()
+
+    answers = session_answers(db, [se.id])
+    assert [a[2] for a in answers] == [0.9, 0.2]
+    replayed = assessment_engine.replay(db, answers, from_scratch=True)[se.id]
+    _assert_close({se.id: replayed}, {se.id: st.skills})
+
+
+def test_fused_assessor_default_score_is_not_an_answer():
+    assert answer_score(_validate({"score": 0.7})) == 0.7
+    assert answer_score(_validate({"skills": ["algebra"]})) is None
+    assert answer_score({"score": "0.7"}) is None
@@ -0,0 +1,52 @@
+import asyncio
+import json
+from backend.app import orchestrator
+from backend.app.agents import assessor
+from backend.app.agents.bloom_tagger import LEVELS as BLOOM
+from backend.app.agents.solo_tagger import LEVELS as SOLO
+from backend.app.config import settings
+from backend.app.llm.mock_client import MockClient
+
+
+class Counting:
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = []
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls.append(response_format)
+        return await self.inner.achat(messages, temperature=temperature, response_format=response_format)
+
+
+class Reply:
+    def __init__(self, text: str):
+        self.text = text
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        return self.text
+
+
+def test_fused_mode_makes_one_json_call(monkeypatch):
+    monkeypatch.setattr(settings, "fused_assessor", True)
+    counting = Counting(MockClient())
+    monkeypatch.setattr(assessor, "client", counting)
+    js, bloom, solo, timings = asyncio.run(orchestrator._assess_answer("Что такое производная?", "Скорость изменения"))
+    assert counting.calls == [{"type": "json_object"}]
+    assert bloom in BLOOM and solo in SOLO and 0.0 <= js["score"] <= 1.0
+    assert (bloom, solo) == (js["bloom_level"], js["solo_level"])
+    assert set(timings) == {"assessor", "assessment_total"}
+
+
+def test_invalid_fields_fall_back_individually(monkeypatch):
+    raw = {"bloom_level": "Apply ", "solo_level": "deep", "score": "1.7", "confidence": None, "skills": ["logic", 3]}
+    monkeypatch.setattr(assessor, "client", Reply(json.dumps(raw)))
+    js = asyncio.run(assessor.aassess_answer("q", "a"))
+    assert js["bloom_level"] == "apply" and js["score"] == 1.0 and js["skills"] == ["logic", "3"]
+    assert js["solo_level"] == "unistructural" and js["confidence"] == 0.0
+    assert js["fallback_fields"] == ["solo_level", "confidence", "errors"]
+
+
+def test_non_json_reply_is_a_parse_error(monkeypatch):
+    monkeypatch.setattr(assessor, "client", Reply("не JSON"))
+    js = asyncio.run(assessor.aassess_answer("q", "a"))
+    assert js["errors"] == ["parse_error"] and "score" in js["fallback_fields"]
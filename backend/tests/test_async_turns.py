@@ -0,0 +1,43 @@
+import asyncio
+import time
+import httpx
+from backend.app.config import settings
+from backend.app.main import app
+from backend.app.models import uuid_str
+
+
+def test_turn_endpoints_with_mock_provider(api):
+    c, h = api
+    r = c.post("/api/session/start", json={"mode": "diagnostic", "topic": "algebra"}, headers=h)
+    assert r.status_code == 200 and r.json()["first_question"]
+    sid = r.json()["session_id"]
+    r = c.post(f"/api/session/{sid}/message", json={"message": "ответ"}, headers=h)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["reply"] and 0.0 <= body["meta"]["score"] <= 1.0
+
+
+async def _turns(headers: dict, n: int) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as c:
+
+        async def one():
+            # уникальная тема — без попаданий в кэш ответов и слияния одинаковых запросов
+            r = await c.post("/api/session/start", json={"mode": "diagnostic", "topic": f"t-{uuid_str()}"})
+            assert r.status_code == 200
+
+        await asyncio.gather(*(one() for _ in range(n)))
+
+
+def test_turns_do_not_block_each_other(api, monkeypatch):
+    """С задержкой провайдера параллельные ходы занимают время одного, а не сумму: event loop не блокируется."""
+    _, h = api
+    monkeypatch.setattr(settings, "mock_chat_latency_ms", 150.0)
+    monkeypatch.setattr(settings, "mock_latency_sigma", 0.0)
+    asyncio.run(_turns(h, 1))  # прогрев: Chroma, пулы, лимитеры
+    t0 = time.perf_counter()
+    asyncio.run(_turns(h, 1))
+    single = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    asyncio.run(_turns(h, 8))
+    assert time.perf_counter() - t0 < 3 * single
@@ -0,0 +1,106 @@
+import asyncio
+import time
+import pytest
+from backend.app.llm.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreakerClient, settings
+from backend.app.llm.errors import CircuitOpenError, ProviderHTTPError
+from backend.app.llm.ratelimit import RateLimitedClient
+
+
+class Provider:
+    chat_model = "m"
+
+    def __init__(self, name: str = "fake", delay_s: float = 0.0):
+        self.provider = name
+        self.delay_s = delay_s
+        self.fail = False
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls += 1
+        if self.fail:
+            raise ProviderHTTPError(503, "down")
+        return "ok"
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay_s)
+        if self.fail:
+            raise ProviderHTTPError(503, "down")
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "llm_breaker_failure_threshold", 3)
+    monkeypatch.setattr(settings, "llm_breaker_open_s", 0.05)
+    monkeypatch.setattr(settings, "llm_breaker_half_open_calls", 1)
+    monkeypatch.setattr(settings, "llm_breaker_slow_call_s", 10.0)
+
+
+def _fail(c: CircuitBreakerClient, n: int) -> None:
+    for _ in range(n):
+        with pytest.raises(ProviderHTTPError):
+            c.chat([])
+
+
+def test_opens_after_consecutive_failures_and_rejects_without_calling():
+    p = Provider()
+    p.fail = True
+    c = CircuitBreakerClient(p)
+    _fail(c, 3)
+    assert c.breakers["chat"].state == OPEN
+    with pytest.raises(CircuitOpenError):
+        c.chat([])
+    assert p.calls == 3
+    # embed — отдельный breaker
+    assert c.breakers["embed"].state == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    p = Provider()
+    p.fail = True
+    c = CircuitBreakerClient(p)
+    _fail(c, 3)
+    time.sleep(0.06)
+    _fail(c, 1)  # пробный вызов упал
+    assert c.breakers["chat"].state == OPEN
+    time.sleep(0.06)
+    p.fail = False
+    assert c.chat([]) == "ok"
+    assert c.breakers["chat"].state == CLOSED
+    assert c.breakers["chat"].transitions == {"closed->open": 1, "open->half_open": 2, "half_open->open": 1, "half_open->closed": 1}
+
+
+def test_cancelled_call_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(settings, "llm_breaker_slow_call_s", 0.01)
+    monkeypatch.setattr(settings, "llm_breaker_failure_threshold", 1)
+    c = CircuitBreakerClient(Provider(delay_s=0.5))
+    br = c.breakers["chat"]
+
+    async def cancelled():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(c.achat([]), 0.05)
+
+    asyncio.run(cancelled())
+    assert br.state == CLOSED and not br._window
+    # в half-open отмена освобождает пробный слот
+    br.state, br.opened_at = OPEN, 0.0
+    asyncio.run(cancelled())
+    assert br.state == HALF_OPEN and br.half_open_in_flight == 0
+
+
+def test_rate_limit_wait_is_not_counted_as_slow_call(monkeypatch):
+    monkeypatch.setattr(settings, "llm_breaker_slow_call_s", 0.1)
+    monkeypatch.setattr(settings, "llm_breaker_failure_threshold", 1)
+    monkeypatch.setattr(settings, "llm_rate_limit_rps", 4.0)
+    monkeypatch.setattr(settings, "llm_rate_limit_burst", 1.0)
+    inner = CircuitBreakerClient(Provider("fake-throttled"))
+    c = RateLimitedClient(inner)
+
+    async def burst():
+        return await asyncio.gather(*(c.achat([]) for _ in range(3)))
+
+    t0 = time.perf_counter()
+    assert asyncio.run(burst()) == ["ok"] * 3
+    assert time.perf_counter() - t0 >= 0.4  # два ожидания токена по 0.25 с
+    assert inner.breakers["chat"].state == CLOSED
@@ -0,0 +1,27 @@
+import numpy as np
+from backend.app.calibration import B_PRECISION, LOG_A_PRECISION, fit
+
+
+def test_fit_recovers_synthetic_2pl_parameters():
+    rng = np.random.default_rng(0)
+    n_items, n_persons, per_person = 60, 3000, 20
+    a = np.exp(rng.normal(0, 0.3, n_items))
+    b = rng.normal(0, 1, n_items)
+    theta = rng.normal(0, 1, n_persons)
+    person = np.repeat(np.arange(n_persons), per_person)
+    item = np.concatenate([rng.choice(n_items, per_person, replace=False) for _ in range(n_persons)])
+    p = 1 / (1 + np.exp(-a[item] * (theta[person] - b[item])))
+    y = (rng.random(len(p)) < p).astype(float)
+
+    res = fit(
+        person, item, y, n_persons,
+        np.zeros(n_items), np.full(n_items, LOG_A_PRECISION),
+        np.zeros(n_items), np.full(n_items, B_PRECISION),
+        max_iter=50,
+    )
+
+    assert res["iterations"] < 50
+    assert np.corrcoef(res["b"], b)[0, 1] > 0.95
+    assert np.sqrt(np.mean((res["b"] - b) ** 2)) < 0.25
+    assert np.corrcoef(np.exp(res["log_a"]), a)[0, 1] > 0.8
+    assert np.corrcoef(res["theta"], theta)[0, 1] > 0.85
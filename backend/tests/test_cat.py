@@ -0,0 +1,49 @@
+import random
+from backend.app.cat import ItemIndex, info_2pl, info_bound
+
+
+def _index(rng: random.Random, n: int) -> ItemIndex:
+    rows = sorted((rng.uniform(-3, 3), i, rng.uniform(0.3, 3.0), f"q{i}") for i in range(n))
+    return ItemIndex(
+        b=[r[0] for r in rows],
+        a=[r[2] for r in rows],
+        keys=[r[3] for r in rows],
+        pos=[r[1] for r in rows],
+        a_max=max(r[2] for r in rows),
+        version=None,
+    )
+
+
+def _brute(index: ItemIndex, theta: float, seen) -> int | None:
+    best, best_info = None, -1.0
+    for j in range(len(index.b)):
+        if index.keys[j] in seen:
+            continue
+        info = info_2pl(theta, index.a[j], index.b[j])
+        if info > best_info:
+            best, best_info = j, info
+    return best
+
+
+def test_select_matches_brute_force_argmax():
+    rng = random.Random(0)
+    for _ in range(300):
+        index = _index(rng, rng.randint(1, 60))
+        theta = rng.uniform(-4, 4)
+        seen = {k for k in index.keys if rng.random() < 0.4}
+        got = index.select(theta, seen)
+        j = _brute(index, theta, seen)
+        if j is None:
+            assert got is None
+        else:
+            # при равной информации допустим любой из равных пунктов
+            jj = index.pos.index(got)
+            assert info_2pl(theta, index.a[jj], index.b[jj]) == info_2pl(theta, index.a[j], index.b[j])
+
+
+def test_info_bound_is_upper_bound():
+    rng = random.Random(1)
+    for _ in range(2000):
+        a_max, dist = rng.uniform(0.2, 4.0), rng.uniform(0, 6)
+        a, extra = rng.uniform(0.01, a_max), rng.uniform(0, 3)
+        assert info_2pl(dist + extra, a, 0.0) <= info_bound(a_max, dist) + 1e-12
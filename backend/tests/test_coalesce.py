@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from backend.app.llm.coalesce import SingleFlightClient
+
+
+class Slow:
+    """Считает вызовы провайдера; ответ приходит через delay_s."""
+
+    provider = "fake"
+    chat_model = "fake-chat"
+    embed_model = "fake-embed"
+
+    def __init__(self, delay_s: float = 0.05, error: Exception | None = None):
+        self.delay_s = delay_s
+        self.error = error
+        self.calls = 0
+
+    def _reply(self, messages):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return f"reply:{messages[-1]['content']}"
+
+    def chat(self, messages, temperature=0.2, tools=None, response_format=None):
+        time.sleep(self.delay_s)
+        return self._reply(messages)
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        await asyncio.sleep(self.delay_s)
+        return self._reply(messages)
+
+    async def aembed(self, texts):
+        self.calls += 1
+        await asyncio.sleep(self.delay_s)
+        return [[float(len(t))] for t in texts]
+
+
+def _msgs(text: str = "q"):
+    return [{"role": "user", "content": text}]
+
+
+def test_concurrent_identical_calls_share_one_request():
+    inner = Slow()
+    c = SingleFlightClient(inner)
+
+    async def run():
+        return await asyncio.gather(*(c.achat(_msgs()) for _ in range(5)), c.achat(_msgs("other")))
+
+    out = asyncio.run(run())
+    assert out == ["reply:q"] * 5 + ["reply:other"] and inner.calls == 2
+    st = c.stats()["single_flight"]
+    assert (st["leaders"], st["coalesced"], st["in_flight"]) == (2, 4, 0)
+
+
+def test_different_parameters_are_not_coalesced():
+    inner = Slow()
+    c = SingleFlightClient(inner)
+
+    async def run():
+        await asyncio.gather(c.achat(_msgs(), temperature=0.2), c.achat(_msgs(), temperature=0.9))
+
+    asyncio.run(run())
+    assert inner.calls == 2
+
+
+def test_error_reaches_every_waiter_and_is_not_kept():
+    inner = Slow(error=RuntimeError("boom"))
+    c = SingleFlightClient(inner)
+
+    async def run():
+        return await asyncio.gather(*(c.achat(_msgs()) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(e, RuntimeError) for e in asyncio.run(run())) and inner.calls == 1
+    inner.error = None
+    assert asyncio.run(c.achat(_msgs())) == "reply:q" and inner.calls == 2
+
+
+def test_waiter_timeout_does_not_cancel_the_shared_call():
+    inner = Slow(delay_s=0.1)
+    c = SingleFlightClient(inner)
+
+    async def run():
+        impatient = asyncio.wait_for(c.achat(_msgs()), timeout=0.02)
+        patient = c.achat(_msgs())
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, asyncio.TimeoutError) and second == "reply:q" and inner.calls == 1
+
+
+def test_threads_share_one_request():
+    inner = Slow()
+    c = SingleFlightClient(inner)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(c.chat(_msgs()))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert out == ["reply:q"] * 4 and inner.calls == 1
+
+
+def test_shared_embeddings_are_copied():
+    c = SingleFlightClient(Slow())
+
+    async def run():
+        return await asyncio.gather(c.aembed(["ab"]), c.aembed(["ab"]))
+
+    a, b = asyncio.run(run())
+    a[0].append(9.0)
+    assert b == [[2.0]]
+
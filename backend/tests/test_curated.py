@@ -0,0 +1,70 @@
+from backend.app.config import settings
+from backend.app.curated import CuratedIndex, bump_bank_version, curated_index
+from backend.app.models import QuestionDB, TopicDB, uuid_str
+
+
+def _topic(db, *texts: str) -> TopicDB:
+    t = TopicDB(name=f"topic-{uuid_str()[:8]}", created_by="admin")
+    db.add(t)
+    db.commit()
+    for text in texts:
+        _add(db, t, text)
+    return t
+
+
+def _add(db, t: TopicDB, text: str, bump: bool = True) -> None:
+    db.add(QuestionDB(topic_id=t.id, text=text))
+    if bump:
+        bump_bank_version(t)
+        db.add(t)
+    db.commit()
+
+
+def test_bank_is_cached_until_invalidated(db, monkeypatch):
+    monkeypatch.setattr(settings, "curated_version_check", False)
+    idx = CuratedIndex()
+    t = _topic(db, "q1", "q2")
+    bank = idx.bank(db, t.name)
+    assert bank.texts == ["q1", "q2"] and bank.question(1) == "q2" and bank.question(2) is None
+    _add(db, t, "q3")
+    assert idx.bank(db, t.name) is bank
+    idx.invalidate(t.name)
+    assert idx.bank(db, t.name).texts == ["q1", "q2", "q3"]
+
+
+def test_version_bump_from_another_worker_reloads(db, monkeypatch):
+    monkeypatch.setattr(settings, "curated_version_check", True)
+    idx = CuratedIndex()
+    t = _topic(db, "q1")
+    bank = idx.bank(db, t.name)
+    assert idx.bank(db, t.name) is bank
+    _add(db, t, "q2")  # другой воркер: версия в БД выросла, локальный invalidate не вызывался
+    fresh = idx.bank(db, t.name)
+    assert fresh is not bank and fresh.texts == ["q1", "q2"] and fresh.version == t.bank_version
+
+
+def test_topic_created_after_empty_lookup(db, monkeypatch):
+    monkeypatch.setattr(settings, "curated_version_check", True)
+    idx = CuratedIndex()
+    name = f"topic-{uuid_str()[:8]}"
+    assert idx.bank(db, name).topic_id is None
+    t = TopicDB(name=name, created_by="admin")
+    db.add(t)
+    db.commit()
+    _add(db, t, "q1")
+    assert idx.bank(db, name).texts == ["q1"]
+
+
+def test_admin_endpoints_invalidate_the_shared_index(api, db, monkeypatch):
+    c, _ = api
+    monkeypatch.setattr(settings, "curated_version_check", False)
+    name = uuid_str()[:8]
+    r = c.post(
+        "/api/auth/register",
+        json={"email": f"{name}@example.com", "username": name, "password": "pw", "role": "admin"},
+    )
+    h = {"Authorization": f"Bearer {r.json()['token']}"}
+    t = _topic(db, "q1")
+    assert curated_index.bank(db, t.name).texts == ["q1"]
+    assert c.post(f"/api/admin/topics/{t.id}/questions", json={"text": "q2"}, headers=h).status_code == 200
+    assert curated_index.bank(db, t.name).texts == ["q1", "q2"]
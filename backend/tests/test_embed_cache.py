@@ -0,0 +1,49 @@
+import asyncio
+from backend.app.llm.embed_cache import CachedEmbedClient, EmbeddingCache
+
+
+class Embedder:
+    provider = "fake"
+    embed_model = "fake-embed"
+
+    def __init__(self, dim: int = 4, broken: dict[str, list] | None = None):
+        self.dim = dim
+        self.broken = broken or {}
+        self.batches: list[list[str]] = []
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        return [self.broken.get(t, [float(len(t))] * self.dim) for t in texts]
+
+    async def aembed(self, texts):
+        return self.embed(texts)
+
+
+def _client(tmp_path, inner) -> CachedEmbedClient:
+    return CachedEmbedClient(inner, EmbeddingCache(str(tmp_path / "emb.sqlite3"), max_entries=100, mem_entries=10))
+
+
+def test_only_missing_texts_reach_provider(tmp_path):
+    inner = Embedder()
+    c = _client(tmp_path, inner)
+    c.embed(["a", "bb"])
+    out = asyncio.run(c.aembed(["bb", "ccc", "ccc", "a"]))
+    assert inner.batches == [["a", "bb"], ["ccc"]]
+    assert out == [[2.0] * 4, [3.0] * 4, [3.0] * 4, [1.0] * 4]
+
+
+def test_disk_hits_survive_restart(tmp_path):
+    c = _client(tmp_path, Embedder())
+    c.embed(["a"])
+    inner = Embedder()
+    assert asyncio.run(_client(tmp_path, inner).aembed(["a"])) == [[1.0] * 4]
+    assert inner.batches == []
+
+
+def test_empty_and_wrong_dimension_vectors_are_not_stored(tmp_path):
+    inner = Embedder(broken={"empty": [], "short": [1.0, 2.0]})
+    c = _client(tmp_path, inner)
+    out = asyncio.run(c.aembed(["ok", "empty", "short"]))
+    assert out == [[2.0] * 4, [], [1.0, 2.0]]
+    asyncio.run(c.aembed(["ok", "empty", "short"]))
+    assert inner.batches == [["ok", "empty", "short"], ["empty", "short"]]
@@ -0,0 +1,51 @@
+import pytest
+from backend.app.assessment import answer_info, assessment_engine
+from backend.app.config import settings
+from backend.app.orchestrator import TurnUnitOfWork, _exam_stop
+from backend.app.session_state import SessionState
+
+# Навыки, которые Judge отметил в ответах; «geometry» — один раз за экзамен (такой навык держал бы max(SE) около 0.9)
+SKILLS = [["algebra"], ["algebra", "logic"], ["geometry"], ["logic"], ["algebra"]] + [["algebra", "logic"], ["logic"]] * 3
+
+
+def _run_exam(max_answers: int) -> tuple[str | None, int]:
+    st = SessionState(session_id="s", topic="t", mode="exam")
+    reason = None
+    for n in range(1, max_answers + 1):
+        st.asked = n  # ответ на n-й вопрос
+        uow = TurnUnitOfWork(st)
+        uow.skills = assessment_engine.update(st.skills, SKILLS[n - 1], float(n % 2))
+        uow.theta_info = answer_info(st.skills, uow.skills)
+        reason = _exam_stop("exam", uow, prev_question="q")
+        if reason:
+            return reason, n
+        # write-through, как после коммита хода
+        st.skills.update(uow.skills)
+        st.theta_info += uow.theta_info
+    return reason, max_answers
+
+
+def test_precision_rule_stops_early_under_default_settings(monkeypatch):
+    monkeypatch.setattr(settings, "exam_stop_rule", "precision")
+    reason, n = _run_exam(settings.exam_max_questions)
+    assert reason == "target_se"
+    assert settings.exam_min_questions <= n < settings.exam_max_questions
+
+
+def test_fixed_rule_runs_to_max_questions(monkeypatch):
+    monkeypatch.setattr(settings, "exam_stop_rule", "fixed")
+    assert _run_exam(settings.exam_max_questions) == ("max_questions", settings.exam_max_questions)
+
+
+def test_no_stop_before_min_questions(monkeypatch):
+    monkeypatch.setattr(settings, "exam_stop_rule", "precision")
+    monkeypatch.setattr(settings, "exam_target_se", 1.0)
+    reason, n = _run_exam(settings.exam_max_questions)
+    assert (reason, n) == ("target_se", settings.exam_min_questions)
+
+
+def test_answer_info_counts_answer_once():
+    one = assessment_engine.update({}, ["algebra"], 1.0)
+    three = assessment_engine.update({}, ["algebra", "logic", "geometry"], 1.0)
+    assert answer_info({}, three) == pytest.approx(answer_info({}, one)) == pytest.approx(one["algebra"]["info"])
+    assert answer_info({}, {}) == 0.0
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import pytest
+from backend.app.agents import bloom_tagger, judge
+from backend.app.config import settings
+from backend.app.llm.errors import ProviderHTTPError, RateLimitError
+from backend.app.llm.mock_client import BLOOM, MockClient
+from backend.app.llm.ratelimit import RateLimitedClient
+
+
+def _judge_messages():
+    return judge._messages("Что такое производная?", "Скорость изменения функции")
+
+
+def test_replies_are_deterministic_and_agent_shaped():
+    a, b = MockClient(seed=1), MockClient(seed=2)
+    msgs = _judge_messages()
+    assert a.chat(msgs) == b.chat(msgs) == asyncio.run(a.achat(msgs))
+    js = json.loads(a.chat(msgs))
+    assert js["bloom_level"] in BLOOM and 0.0 <= js["score"] <= 1.0
+    assert a.chat(bloom_tagger._messages("Я применил формулу")) in BLOOM
+    assert a.embed(["x"]) == asyncio.run(b.aembed(["x"])) and len(a.embed(["x"])[0]) == settings.mock_embed_dim
+
+
+def test_stream_yields_the_same_text():
+    c = MockClient()
+    msgs = [{"role": "user", "content": "Следующий вопрос"}]
+
+    async def collect():
+        return "".join([chunk async for chunk in c.astream_chat(msgs)])
+
+    assert asyncio.run(collect()) == c.chat(msgs)
+
+
+def test_injected_errors(monkeypatch):
+    c = MockClient()
+    monkeypatch.setattr(settings, "mock_error_rate", 1.0)
+    with pytest.raises(ProviderHTTPError) as e:
+        c.chat(_judge_messages())
+    assert e.value.status_code == 503
+    monkeypatch.setattr(settings, "mock_error_rate", 0.0)
+    monkeypatch.setattr(settings, "mock_rate_limit_rate", 1.0)
+    monkeypatch.setattr(settings, "mock_retry_after_s", 0.25)
+    with pytest.raises(RateLimitError) as e:
+        asyncio.run(c.achat(_judge_messages()))
+    assert e.value.retry_after == 0.25
+
+
+def test_rate_limited_client_rides_out_injected_failures(monkeypatch):
+    monkeypatch.setattr(settings, "mock_error_rate", 0.2)
+    monkeypatch.setattr(settings, "mock_rate_limit_rate", 0.2)
+    monkeypatch.setattr(settings, "mock_retry_after_s", 0.0)
+    monkeypatch.setattr(settings, "llm_backoff_base_s", 0.001)
+    monkeypatch.setattr(settings, "llm_max_retries", 8)
+    inner = MockClient(seed=7)
+    inner.chat_model = "mock-chat-retries"
+    c = RateLimitedClient(inner)
+
+    async def run():
+        return await asyncio.gather(*(c.achat([{"role": "user", "content": f"q{i}"}]) for i in range(20)))
+
+    replies = asyncio.run(run())
+    assert replies == [MockClient().complete([{"role": "user", "content": f"q{i}"}]) for i in range(20)]
+    st = c.stats()["rate_limits"]["mock:mock-chat-retries"]
+    assert st["retries"] > 0 and st["rate_limited"] > 0
@@ -0,0 +1,93 @@
+import asyncio
+from fastapi import BackgroundTasks
+from backend.app import main, prefetch
+from backend.app.prefetch import PrefetchStore
+
+EASY, HARD = ("apply", "easy"), ("analyze", "hard")
+
+
+async def _ready(store: PrefetchStore, session_id: str, **branches: str) -> None:
+    async def q(text):
+        return text
+
+    tasks = {b: asyncio.ensure_future(q(text)) for b, text in zip((EASY, HARD), branches.values())}
+    store.put(session_id, tasks)
+    for b, t in tasks.items():
+        await t
+        store.resolve(session_id, b, t)
+
+
+def test_take_returns_branch_and_discards_the_rest():
+    store = PrefetchStore(ttl_s=60, max_sessions=10)
+
+    async def run():
+        await _ready(store, "s", easy="q-easy", hard="q-hard")
+        return await store.take("s", HARD), await store.take("s", HARD)
+
+    assert asyncio.run(run()) == ("q-hard", None)
+    assert (store.hits, store.wasted, store.no_prefetch) == (1, 1, 1)
+
+
+def test_expired_branch_is_not_served(monkeypatch):
+    store = PrefetchStore(ttl_s=10, max_sessions=10)
+    now = [1000.0]
+    monkeypatch.setattr(prefetch.time, "time", lambda: now[0])
+
+    async def run():
+        await _ready(store, "s", easy="q")
+        now[0] += 11
+        return await store.take("s", EASY)
+
+    assert asyncio.run(run()) is None
+    assert store.expired == 1
+
+
+def test_lru_evicts_oldest_session_and_cancels_its_tasks():
+    store = PrefetchStore(ttl_s=60, max_sessions=2)
+
+    async def run():
+        slow = {EASY: asyncio.ensure_future(asyncio.sleep(10))}
+        store.put("a", slow)
+        await _ready(store, "b", easy="qb")
+        await _ready(store, "c", easy="qc")
+        await asyncio.sleep(0)
+        return slow[EASY], await store.take("a", EASY), await store.take("c", EASY)
+
+    task, a, c = asyncio.run(run())
+    assert task.cancelled() and a is None and c == "qc"
+
+
+def test_in_flight_branch_is_awaited():
+    store = PrefetchStore(ttl_s=60, max_sessions=10)
+
+    async def run():
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "late"
+
+        task = asyncio.ensure_future(slow())
+        store.put("s", {EASY: task})
+        task.add_done_callback(lambda t: store.resolve("s", EASY, t))
+        return await store.take("s", EASY)
+
+    assert asyncio.run(run()) == "late"
+    assert store.hits_waited == 1
+
+
+def test_prefetch_does_not_wait_for_recommendations(monkeypatch):
+    events = []
+
+    async def slow_recs(session_id):
+        await asyncio.sleep(0.2)
+        events.append("recommendations")
+
+    async def fast_prefetch(session_id, topic, mode, question, meta):
+        events.append("prefetch")
+
+    monkeypatch.setattr(main, "refresh_recommendations", slow_recs)
+    monkeypatch.setattr(main, "prefetch_questions", fast_prefetch)
+    background = BackgroundTasks()
+    se = main.SessionDB(id="s", mode="diagnostic", topic="t")
+    main._after_turn(background, se, "q", {"recommendations_pending": True, "prefetch_next": True})
+    asyncio.run(background())
+    assert events == ["prefetch", "recommendations"]
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from email.utils import formatdate
+import pytest
+from backend.app.config import settings
+from backend.app.llm.errors import ProviderHTTPError, RateLimitError, parse_retry_after
+from backend.app.llm.ratelimit import AIMDLimiter, ProviderLimiter, TokenBucket, acall_with_retries, backoff_delay
+
+
+def test_token_bucket_reserves_ahead():
+    b = TokenBucket(rate=10.0, burst=2.0)
+    waits = [b.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01) and waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_aimd_halves_on_429_at_most_once_per_second():
+    lim = AIMDLimiter(initial=8, lo=2, hi=16)
+    for _ in range(2):
+        lim.acquire()
+    lim.release(rate_limited=True)
+    lim.release(rate_limited=True)
+    assert lim.limit == 4.0 and lim.in_flight == 0
+    lim._last_decrease -= 2
+    for _ in range(3):
+        lim.acquire()
+        lim.release(rate_limited=True)
+        lim._last_decrease -= 2
+    assert lim.limit == 2.0  # не ниже lo
+    lim.acquire()
+    lim.release(rate_limited=False)
+    assert lim.limit == pytest.approx(2.5)
+
+
+def test_async_waiter_gets_released_slot_in_order():
+    lim = AIMDLimiter(initial=1, lo=1, hi=1)
+    order = []
+
+    async def worker(name):
+        await lim.aacquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        lim.release(rate_limited=False)
+
+    async def run():
+        await asyncio.gather(*(worker(i) for i in range(4)))
+
+    asyncio.run(run())
+    assert order == [0, 1, 2, 3] and lim.in_flight == 0
+
+
+def test_retry_after_takes_priority_over_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "llm_backoff_base_s", 0.1)
+    monkeypatch.setattr(settings, "llm_backoff_max_s", 5.0)
+    assert 2.0 <= backoff_delay(0, RateLimitError(retry_after=2.0)) <= 2.1
+    assert backoff_delay(0, RateLimitError(retry_after=60.0)) <= 5.1
+    assert 0.0 <= backoff_delay(3, ProviderHTTPError(503)) <= 0.8
+    assert parse_retry_after("3") == 3.0
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+
+def test_retries_429_after_retry_after_and_not_4xx(monkeypatch):
+    monkeypatch.setattr(settings, "llm_backoff_base_s", 0.001)
+    lim = ProviderLimiter(rate=0, burst=1)
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise RateLimitError(retry_after=0.05)
+        return "ok"
+
+    assert asyncio.run(acall_with_retries(lim, flaky, cost=1.0, retries=2)) == "ok"
+    assert attempts[1] - attempts[0] >= 0.05
+    assert (lim.calls, lim.retries, lim.rate_limited) == (2, 1, 1)
+
+    async def bad_request():
+        attempts.append(None)
+        raise ProviderHTTPError(400, "bad")
+
+    attempts.clear()
+    with pytest.raises(ProviderHTTPError):
+        asyncio.run(acall_with_retries(lim, bad_request, cost=1.0, retries=2))
+    assert len(attempts) == 1 and lim.aimd.in_flight == 0
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime, timedelta
+from backend.app import recommendations
+from backend.app.agents.summarizer import HISTORY_WINDOW
+from backend.app.models import MessageDB, SessionDB, SkillScoreDB
+
+
+def _session(db, n_messages: int) -> SessionDB:
+    se = SessionDB(mode="exam", topic="t", recs_requested=3, recommendations="old")
+    db.add(se)
+    t0 = datetime(2026, 1, 1)
+    for i in range(n_messages):
+        db.add(MessageDB(session_id=se.id, role="user" if i % 2 else "assistant", content=f"m{i}", ts=t0 + timedelta(seconds=i)))
+    db.add(SkillScoreDB(session_id=se.id, skill="algebra", ema_score=0.4, irt_theta=0.0))
+    db.commit()
+    return se
+
+
+def test_refresh_reads_only_recent_history(db, monkeypatch):
+    se = _session(db, 40)
+    seen = {}
+
+    async def fake_recs(topic, history, skills):
+        seen.update(topic=topic, history=[m["content"] for m in history], skills=skills)
+        return "new"
+
+    monkeypatch.setattr(recommendations, "arecommendations", fake_recs)
+    state = asyncio.run(recommendations.refresh_recommendations(se.id))
+    assert seen["history"] == [f"m{i}" for i in range(40 - HISTORY_WINDOW, 40)]
+    assert seen["skills"] == {"algebra": 0.4}
+    assert state["recommendations"] == "new" and not state["pending"] and state["turn"] == 3
+    # второй вызов: пересчитывать нечего
+    assert asyncio.run(recommendations.refresh_recommendations(se.id)) is None
+
+
+def test_provider_failure_keeps_previous_recommendations(db, monkeypatch):
+    se = _session(db, 4)
+
+    async def down(topic, history, skills):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(recommendations, "arecommendations", down)
+    assert asyncio.run(recommendations.refresh_recommendations(se.id)) is None
+    db.refresh(se)
+    assert se.recommendations == "old" and recommendations.recommendations_state(se)["pending"]
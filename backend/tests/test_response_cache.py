@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from backend.app.agents import bloom_tagger, judge
+from backend.app.llm import cache as cache_mod
+from backend.app.llm.cache import CachedClient, ResponseCache
+
+
+class Scripted:
+    """Провайдер, отвечающий заранее заданными строками по очереди."""
+
+    provider = "fake"
+    chat_model = "fake-chat"
+
+    def __init__(self, *replies: str):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls += 1
+        return self.replies.pop(0)
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        return self.chat(messages, temperature, tools, response_format)
+
+
+def _cache(tmp_path, **kw) -> ResponseCache:
+    opts = {"ttl_s": 60.0, "max_entries": 100, "mem_entries": 10} | kw
+    return ResponseCache(str(tmp_path / "llm.sqlite3"), **opts)
+
+
+MSGS = [{"role": "user", "content": "q"}]
+
+
+def test_deterministic_reply_is_served_from_cache(tmp_path):
+    inner = Scripted("a", "b")
+    c = CachedClient(inner, _cache(tmp_path))
+    assert c.chat(MSGS, temperature=0.0) == "a"
+    assert asyncio.run(c.achat(MSGS, temperature=0.0)) == "a"
+    assert inner.calls == 1
+
+
+def test_sampled_reply_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod.settings, "llm_cache_max_temperature", 0.0)
+    inner = Scripted("a", "b")
+    c = CachedClient(inner, _cache(tmp_path))
+    assert [c.chat(MSGS, temperature=0.7) for _ in range(2)] == ["a", "b"]
+
+
+def test_expired_entry_is_refetched(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, ttl_s=10.0)
+    now = [1000.0]
+    monkeypatch.setattr(cache_mod.time, "time", lambda: now[0])
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    now[0] += 11
+    assert cache.get("k") is None
+    # и с диска тоже: новый экземпляр без памяти
+    assert _cache(tmp_path, ttl_s=10.0).get("k") is None
+
+
+def test_disk_hits_do_not_commit_per_hit(tmp_path):
+    cache = _cache(tmp_path, mem_entries=0)
+    keys = [f"k{i}" for i in range(cache_mod.TOUCH_BATCH)]
+    for k in keys:
+        cache.set(k, "v")
+    for k in keys[:-1]:
+        assert cache.get(k) == "v"
+    assert len(cache._touched) == len(keys) - 1
+    cache.get(keys[-1])
+    assert not cache._touched
+
+
+def test_garbage_judge_reply_is_not_stored(tmp_path, monkeypatch):
+    good = '{"bloom_level": "apply", "score": 0.8, "confidence": 0.9, "errors": [], "skills": ["algebra"]}'
+    inner = Scripted("Извините, не могу оценить.", good)
+    monkeypatch.setattr(judge, "client", CachedClient(inner, _cache(tmp_path)))
+    first = asyncio.run(judge.ascore_answer("q", "a"))
+    assert first["errors"] == ["parse_error"]
+    second = asyncio.run(judge.ascore_answer("q", "a"))
+    assert second["score"] == pytest.approx(0.8)
+    assert inner.calls == 2
+    # валидный ответ уже закэширован
+    assert asyncio.run(judge.ascore_answer("q", "a")) == second
+    assert inner.calls == 2
+
+
+def test_tagger_reply_without_level_is_not_stored(tmp_path, monkeypatch):
+    inner = Scripted("не знаю", "Apply.")
+    monkeypatch.setattr(bloom_tagger, "client", CachedClient(inner, _cache(tmp_path)))
+    assert bloom_tagger.tag_bloom("x") == "understand"
+    assert bloom_tagger.tag_bloom("x") == "apply"
+    assert bloom_tagger.tag_bloom("x") == "apply"
+    assert inner.calls == 2
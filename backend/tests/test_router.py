@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from backend.app.llm.errors import ProviderHTTPError
+from backend.app.llm.router import LLMRouter, settings
+
+
+class Provider:
+    def __init__(self, name: str, delay_s: float = 0.0, fail: bool = False):
+        self.provider = name
+        self.delay_s = delay_s
+        self.fail = fail
+        self.calls = 0
+
+    def chat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls += 1
+        if self.fail:
+            raise ProviderHTTPError(503, f"{self.provider} down")
+        return self.provider
+
+    async def achat(self, messages, temperature=0.2, tools=None, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay_s)
+        if self.fail:
+            raise ProviderHTTPError(503, f"{self.provider} down")
+        return self.provider
+
+
+def _router(*providers: Provider) -> LLMRouter:
+    return LLMRouter({p.provider: p for p in providers}, primary=providers[0].provider)
+
+
+def _warm(router: LLMRouter, name: str, latency_s: float, n: int) -> None:
+    for _ in range(n):
+        router.health[(name, "chat")].record(latency_s, True)
+
+
+def test_untested_provider_does_not_outrank_primary(monkeypatch):
+    monkeypatch.setattr(settings, "llm_router_min_samples", 5)
+    r = _router(Provider("a"), Provider("b"))
+    _warm(r, "a", 2.0, 10)
+    assert r._ranked("chat") == ["a", "b"]
+    _warm(r, "b", 0.1, 4)
+    assert r._ranked("chat") == ["a", "b"]
+    _warm(r, "b", 0.1, 1)
+    assert r._ranked("chat") == ["b", "a"]
+
+
+def test_configured_order_until_primary_has_samples(monkeypatch):
+    monkeypatch.setattr(settings, "llm_router_min_samples", 5)
+    r = _router(Provider("a"), Provider("b"))
+    _warm(r, "b", 0.1, 10)
+    assert r._ranked("chat") == ["a", "b"]
+
+
+def test_failover_to_next_provider(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_after_ms", 0.0)
+    a, b = Provider("a", fail=True), Provider("b")
+    r = _router(a, b)
+    assert r.chat([]) == "b"
+    assert asyncio.run(r.achat([])) == "b"
+    assert r.failovers == 2
+    assert r.health[("a", "chat")].stats()["error_rate"] == 1.0
+
+
+def test_hedge_wins_and_cancelled_loser_is_not_recorded(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_after_ms", 20.0)
+    r = _router(Provider("a", delay_s=0.5), Provider("b", delay_s=0.01))
+    assert asyncio.run(r.achat([])) == "b"
+    assert (r.hedged, r.hedge_wins) == (1, 1)
+    assert r.health[("a", "chat")].stats()["samples"] == 0
+    assert r.health[("b", "chat")].stats()["samples"] == 1
+
+
+def test_agent_timeout_records_lower_bound_latency(monkeypatch):
+    monkeypatch.setattr(settings, "llm_hedge_after_ms", 0.0)
+    r = _router(Provider("a", delay_s=0.5))
+
+    async def call():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(r.achat([]), 0.05)
+
+    asyncio.run(call())
+    stats = r.health[("a", "chat")].stats()
+    assert stats["samples"] == 1 and stats["p50_ms"] >= 50
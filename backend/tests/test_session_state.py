@@ -0,0 +1,85 @@
+from sqlmodel import select
+from backend.app.models import SessionDB, SkillScoreDB, UserSkillDB, uuid_str
+from backend.app.session_state import SessionStateCache, bump_version, session_states
+
+
+def _user(db, ema: float) -> str:
+    user_id = uuid_str()
+    db.add(UserSkillDB(user_id=user_id, skill="algebra", ema_score=ema, irt_theta=1.0))
+    db.commit()
+    return user_id
+
+
+def _set_profile(db, user_id: str, ema: float) -> None:
+    r = db.exec(select(UserSkillDB).where(UserSkillDB.user_id == user_id)).one()
+    r.ema_score = ema
+    db.add(r)
+    db.commit()
+
+
+def test_reload_keeps_profile_from_session_start(db):
+    user_id = _user(db, 0.8)
+    se = SessionDB(mode="exam", topic="t", user_id=user_id)
+    db.add(se)
+    db.commit()
+    assert session_states.get(db, se).skills["algebra"]["ema"] == 0.8
+    # профиль изменила другая сессия; кэш этой сбросился
+    _set_profile(db, user_id, 0.1)
+    session_states.invalidate(se.id)
+    db.refresh(se)
+    st = session_states.get(db, se)
+    assert st.skills["algebra"] == {"ema": 0.8, "theta": 1.0, "info": 0.0}
+
+
+def test_legacy_session_with_answers_is_not_warm_started(db):
+    user_id = _user(db, 0.8)
+    se = SessionDB(mode="exam", topic="t", user_id=user_id)
+    db.add(se)
+    db.add(SkillScoreDB(session_id=se.id, skill="logic", ema_score=0.3, irt_theta=-0.5, irt_info=0.4))
+    db.commit()
+    st = session_states.get(db, se)
+    assert st.skills == {"logic": {"ema": 0.3, "theta": -0.5, "info": 0.4}}
+    assert se.start_skills is None
+
+
+def _session(db) -> SessionDB:
+    se = SessionDB(mode="diagnostic", topic="t")
+    db.add(se)
+    db.commit()
+    return se
+
+
+def test_cached_state_is_reused_while_version_matches(db):
+    se = _session(db)
+    st = session_states.get(db, se)
+    db.add(SkillScoreDB(session_id=se.id, skill="logic", ema_score=0.3, irt_theta=0.0, irt_info=0.1))
+    db.commit()
+    assert session_states.get(db, se) is st and st.skills == {}
+    # свой ход: версия растёт в БД и в кэше одновременно — перечитывать нечего
+    bump_version(se, st)
+    db.add(se)
+    db.commit()
+    assert session_states.get(db, se) is st
+
+
+def test_external_version_change_reloads(db):
+    se = _session(db)
+    st = session_states.get(db, se)
+    db.add(SkillScoreDB(session_id=se.id, skill="logic", ema_score=0.3, irt_theta=0.0, irt_info=0.1))
+    se.state_version = (se.state_version or 0) + 1  # ход записал другой процесс
+    db.add(se)
+    db.commit()
+    fresh = session_states.get(db, se)
+    assert fresh is not st and fresh.version == se.state_version
+    assert fresh.skills == {"logic": {"ema": 0.3, "theta": 0.0, "info": 0.1}}
+
+
+def test_cache_is_bounded_lru(db):
+    cache = SessionStateCache(max_entries=2)
+    a, b, c = _session(db), _session(db), _session(db)
+    st_a = cache.get(db, a)
+    cache.get(db, b)
+    cache.get(db, a)
+    cache.get(db, c)
+    assert cache.get(db, a) is st_a
+    assert set(cache._items) == {a.id, c.id}
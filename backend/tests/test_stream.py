@@ -0,0 +1,56 @@
+import json
+from sqlmodel import Session, func, select
+from backend.app import orchestrator
+from backend.app.db import engine
+from backend.app.models import MessageDB
+
+
+def _events(resp) -> list[tuple[str, dict]]:
+    out = []
+    for block in resp.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def _start(c, h) -> str:
+    return c.post("/api/session/start", json={"mode": "diagnostic", "topic": "stream"}, headers=h).json()["session_id"]
+
+
+def _messages(session_id: str) -> int:
+    with Session(engine) as s:
+        return s.exec(select(func.count(MessageDB.id)).where(MessageDB.session_id == session_id)).one()
+
+
+def test_stream_emits_meta_tokens_done(api):
+    c, h = api
+    sid = _start(c, h)
+    r = c.post(f"/api/session/{sid}/message/stream", json={"message": "ответ"}, headers=h)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/event-stream")
+    events = _events(r)
+    names = [e for e, _ in events]
+    assert names[0] == "meta" and "token" in names and "done" in names
+    tokens = "".join(d["text"] for e, d in events if e == "token")
+    done = next(d for e, d in events if e == "done")
+    assert done["reply"] == tokens and done["meta"]["completed"] is False
+    assert _messages(sid) == 4  # старт (2) + ответ и следующий вопрос
+
+
+def test_failure_mid_stream_sends_error_and_saves_nothing(api, monkeypatch):
+    c, h = api
+    sid = _start(c, h)
+
+    async def broken(**kw):
+        yield "Начало вопроса "
+        raise RuntimeError("provider dropped the stream")
+
+    monkeypatch.setattr(orchestrator, "astream_question", broken)
+    r = c.post(f"/api/session/{sid}/message/stream", json={"message": "ответ"}, headers=h)
+    events = _events(r)
+    assert [e for e, _ in events][-1] == "error"
+    assert events[-1][1] == {"detail": "turn failed", "type": "RuntimeError", "committed": False}
+    assert _messages(sid) == 2
+    monkeypatch.undo()
+    # ход можно повторить
+    assert c.post(f"/api/session/{sid}/message", json={"message": "ответ"}, headers=h).status_code == 200
+    assert _messages(sid) == 4
@@ -0,0 +1,65 @@
+import asyncio
+from backend.app.config import settings
+from backend.app.tracing import Trace, TimingStats, current_trace, span, trace_scope
+
+
+def _parse(header: str) -> dict[str, float]:
+    out = {}
+    for part in header.split(", "):
+        name, dur = part.split(";dur=")
+        out[name] = float(dur)
+    return out
+
+
+def test_spans_add_up_across_tasks_and_nested_scopes():
+    async def work():
+        with span("judge"):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        with trace_scope(sample=False) as tr:
+            await asyncio.gather(work(), work())
+            with trace_scope() as inner:
+                assert inner is tr
+                with span("commit"):
+                    await asyncio.to_thread(lambda: None)
+            return tr
+
+    tr = asyncio.run(run())
+    t = tr.timings()
+    assert set(t) == {"judge", "commit", "total"} and t["judge"] >= 20
+    assert current_trace() is None
+    with span("no_trace"):
+        pass  # вне хода span ничего не делает
+
+
+def test_timing_stats_respect_sample_rate(monkeypatch):
+    stats = TimingStats(window=3)
+    tr = Trace()
+    tr.add("tutor", 10.0)
+    monkeypatch.setattr(settings, "trace_sample_rate", 0.0)
+    stats.maybe_add(tr)
+    assert stats.stats()["traces"] == 0
+    monkeypatch.setattr(settings, "trace_sample_rate", 1.0)
+    for ms in (10.0, 20.0, 30.0, 40.0):
+        t = Trace()
+        t.add("tutor", ms)
+        stats.maybe_add(t)
+    tutor = stats.stats()["stages"]["tutor"]
+    assert tutor["count"] == 4 and tutor["max_ms"] == 40.0 and tutor["mean_ms"] == 30.0  # окно — 3 последних
+
+
+def test_turn_reports_server_timing_and_meta(api, monkeypatch):
+    c, h = api
+    monkeypatch.setattr(settings, "trace_meta", True)
+    r = c.post("/api/session/start", json={"mode": "diagnostic", "topic": "tracing"}, headers=h)
+    sid = r.json()["session_id"]
+    r = c.post(f"/api/session/{sid}/message", json={"message": "ответ"}, headers=h)
+    header = _parse(r.headers["Server-Timing"])
+    meta = r.json()["meta"]["timings"]
+    assert {"db_read", "tutor", "commit", "total"} <= set(header)
+    assert set(meta) <= set(header) and header["total"] >= meta["total"]
+
+    monkeypatch.setattr(settings, "trace_meta", False)
+    r = c.post(f"/api/session/{sid}/message", json={"message": "ещё ответ"}, headers=h)
+    assert "timings" not in r.json()["meta"] and "total" in _parse(r.headers["Server-Timing"])
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from sqlmodel import select
+from backend.app.llm.usage import aflush_usage, record_usage, session_scope, usage
+from backend.app.models import LLMUsageDB, MessageDB, SessionDB
+from backend.app.orchestrator import TurnUnitOfWork
+from backend.app.session_state import session_states
+
+
+def _session(db) -> SessionDB:
+    se = SessionDB(mode="diagnostic", topic="t")
+    db.add(se)
+    db.commit()
+    return se
+
+
+def _usage_rows(db, session_id: str):
+    return db.exec(select(LLMUsageDB).where(LLMUsageDB.session_id == session_id)).all()
+
+
+def test_failed_commit_rolls_back_and_keeps_state(db, monkeypatch):
+    se = _session(db)
+    st = session_states.get(db, se)
+    with session_scope(se.id):
+        record_usage("mock", "m", "chat", 10, 5, 0.1)
+    uow = TurnUnitOfWork(st)
+    uow.user_msg = MessageDB(session_id=se.id, role="user", content="answer", score=1.0)
+    uow.skills = {"algebra": {"ema": 0.9, "theta": 0.5, "info": 0.2}}
+    uow.theta_info = 0.2
+
+    def boom():
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(db, "commit", boom)
+    with pytest.raises(RuntimeError):
+        asyncio.run(uow.commit(db))
+    monkeypatch.undo()
+    db.rollback()
+    assert db.exec(select(MessageDB).where(MessageDB.session_id == se.id)).all() == []
+    assert st.skills == {} and st.theta_info == 0.0 and not st.history
+    # usage хода не потерян: вернулся в очередь и уйдёт со следующим коммитом
+    assert usage.has_pending(se.id)
+
+    asyncio.run(uow.commit(db))
+    assert [m.content for m in db.exec(select(MessageDB).where(MessageDB.session_id == se.id))] == ["answer"]
+    assert st.skills["algebra"]["ema"] == 0.9 and st.theta_info == 0.2
+    assert not usage.has_pending(se.id)
+    assert [(r.calls, r.prompt_tokens) for r in _usage_rows(db, se.id)] == [(1, 10)]
+
+
+def test_leftover_flush_touches_only_its_session(db):
+    a, b = _session(db), _session(db)
+    for sid in (a.id, b.id):
+        with session_scope(sid):
+            record_usage("mock", "m", "chat", 3, 1, 0.01)
+    assert asyncio.run(aflush_usage(a.id)) == 1
+    assert len(_usage_rows(db, a.id)) == 1
+    assert _usage_rows(db, b.id) == []
+    assert usage.has_pending(b.id)
+    usage.take(b.id)
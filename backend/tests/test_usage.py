@@ -0,0 +1,65 @@
+import pytest
+from sqlmodel import select
+from backend.app.llm.usage import UsageAccumulator, agent_scope, session_scope
+from backend.app.models import LLMUsageDB, uuid_str
+
+
+def _rows(db, **where):
+    q = select(LLMUsageDB)
+    for k, v in where.items():
+        q = q.where(getattr(LLMUsageDB, k) == v)
+    db.expire_all()
+    return db.exec(q).all()
+
+
+def test_record_aggregates_in_memory():
+    acc = UsageAccumulator()
+    with session_scope("s1"), agent_scope("judge"):
+        acc.record("mock", "m", "chat", 10, 2, 0.1)
+        acc.record("mock", "m", "chat", 5, 1, 0.3)
+    with agent_scope("tutor"):
+        acc.record("mock", "m", "chat", 1, 1, 0.2)
+    pending = acc.drain()
+    judge = pending[("s1", "judge", "mock", "m", "chat")]
+    assert (judge["calls"], judge["prompt_tokens"], judge["completion_tokens"]) == (2, 15, 3)
+    assert judge["latency_ms_max"] == pytest.approx(300.0)
+    assert (None, "tutor", "mock", "m", "chat") in pending and not acc.has_pending()
+
+
+def test_flush_upserts_one_row_per_key(db):
+    acc = UsageAccumulator()
+    sid = uuid_str()
+    model = f"m-{sid[:8]}"
+    for elapsed in (0.5, 0.1):
+        with session_scope(sid), agent_scope("judge"):
+            acc.record("mock", model, "chat", 10, 5, elapsed)
+            acc.record("mock", model, "chat", 10, 5, 0.2)
+        assert acc.flush(sid) == 1
+    (row,) = _rows(db, session_id=sid)
+    assert (row.calls, row.prompt_tokens, row.completion_tokens) == (4, 40, 20)
+    assert row.latency_ms_total == pytest.approx(1000.0) and row.latency_ms_max == pytest.approx(500.0)
+
+
+def test_rows_without_session_share_one_key(db):
+    acc = UsageAccumulator()
+    model = f"m-{uuid_str()[:8]}"
+    for _ in range(3):
+        with agent_scope("summarizer"):
+            acc.record("mock", model, "chat", 1, 1, 0.01)
+        acc.flush()
+    (row,) = _rows(db, model=model)
+    assert row.session_id is None and row.calls == 3
+
+
+def test_failed_flush_requeues(monkeypatch):
+    acc = UsageAccumulator()
+    with session_scope("s-fail"):
+        acc.record("mock", "m", "chat", 3, 3, 0.1)
+
+    def boom(s, pending):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(acc, "write", boom)
+    with pytest.raises(RuntimeError):
+        acc.flush("s-fail")
+    assert acc.has_pending("s-fail") and acc.drain()[("s-fail", "other", "mock", "m", "chat")]["calls"] == 1
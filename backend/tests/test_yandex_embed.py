@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from backend.app.config import settings
+from backend.app.llm.errors import ProviderHTTPError
+from backend.app.llm.ratelimit import RateLimitedClient
+from backend.app.llm.yandex_client import YandexGPTClient
+
+
+class Probe:
+    """Подмена запроса одного текста: считает параллельность и роняет заданные тексты один раз."""
+
+    def __init__(self, fail_once=()):
+        self.fail_once = set(fail_once)
+        self.calls: dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, text: str) -> None:
+        with self._lock:
+            self.calls[text] = self.calls.get(text, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self, text: str) -> list[float]:
+        with self._lock:
+            self.in_flight -= 1
+            if text in self.fail_once:
+                self.fail_once.discard(text)
+                raise ProviderHTTPError(503, "flaky")
+        return [float(len(text))]
+
+    def one(self, text: str) -> list[float]:
+        self._enter(text)
+        time.sleep(0.01)
+        return self._exit(text)
+
+    async def aone(self, text: str) -> list[float]:
+        self._enter(text)
+        await asyncio.sleep(0.01)
+        return self._exit(text)
+
+
+def _client(monkeypatch, probe: Probe, concurrency: int = 3) -> YandexGPTClient:
+    monkeypatch.setattr(settings, "yandex_embed_concurrency", concurrency)
+    monkeypatch.setattr(settings, "llm_backoff_base_s", 0.001)
+    c = YandexGPTClient(api_key="k", folder_id="f")
+    monkeypatch.setattr(c, "_embed_one", probe.one)
+    monkeypatch.setattr(c, "_aembed_one", probe.aone)
+    return c
+
+
+TEXTS = ["a" * n for n in range(1, 13)]
+
+
+def test_parallel_embeddings_keep_order_and_bound(monkeypatch):
+    probe = Probe()
+    c = _client(monkeypatch, probe)
+    assert c.embed(TEXTS) == [[float(len(t))] for t in TEXTS]
+    assert asyncio.run(c.aembed(TEXTS)) == [[float(len(t))] for t in TEXTS]
+    assert 1 < probe.max_in_flight <= 3
+
+
+def test_failed_item_is_retried_alone(monkeypatch):
+    probe = Probe(fail_once={"aaa", "aaaaaaa"})
+    c = RateLimitedClient(_client(monkeypatch, probe))
+    assert c.embed(TEXTS) == [[float(len(t))] for t in TEXTS]
+    assert probe.calls == {t: 2 if t in ("aaa", "aaaaaaa") else 1 for t in TEXTS}
+
+    probe = Probe(fail_once={"a"})
+    c = RateLimitedClient(_client(monkeypatch, probe))
+    assert asyncio.run(c.aembed(TEXTS)) == [[float(len(t))] for t in TEXTS]
+    assert sum(probe.calls.values()) == len(TEXTS) + 1
@@ -110,7 +110,7 @@ topic_names = [t["name"] for t in topics] or ["linear_algebra", "probability"]
 mode = st.sidebar.selectbox(
     "Режим",
     ["exam", "diagnostic"],
-    help="В 'exam' — ровно 10 вопросов. В 'diagnostic' — без лимита.",
+    help="В 'exam' — до 10 вопросов (EXAM_STOP_RULE=precision — раньше, как только оценка точна). В 'diagnostic' — без лимита.",
 )
 topic = st.sidebar.selectbox("Тема", topic_names)
 student_id = st.sidebar.text_input("Student ID (опц.)", "user-1")
@@ -172,6 +172,17 @@ with col2:
     st.json(meta if meta else {"info": "Начните сессию"})
 
     if st.session_state.get("session_id"):
+        # Рекомендации считаются в фоне после хода — забираем последние сохранённые
+        try:
+            rj = api_get(f"/api/session/{st.session_state.session_id}/recommendations").json()
+        except Exception:
+            rj = {}
+        if rj.get("recommendations") or rj.get("pending"):
+            st.subheader("Рекомендации")
+            st.markdown(rj.get("recommendations") or "…")
+            if rj.get("pending"):
+                st.caption("Обновляются — появятся при следующем обновлении страницы.")
+
         if st.button("Сгенерировать отчёт"):
             r = api_get(f"/api/session/{st.session_state.session_id}/report")
             if r.ok:
@@ -186,6 +197,21 @@ with col2:
             st.json(mr.get("bloom_counts", {}))
             st.write("SOLO counts:")
             st.json(mr.get("solo_counts", {}))
+            timings = {k: v for k, v in (meta.get("timings") or {}).items() if k != "total"}
+            if timings:
+                st.write(f"Этапы последнего хода, мс (всего {meta['timings'].get('total')}):")
+                st.bar_chart(timings)
+
+        if (st.session_state.get("me") or {}).get("role") == "admin" and st.button("Задержки по этапам (все ходы)"):
+            tj = api_get("/api/admin/timings").json()
+            stages = tj.get("stages", {})
+            if stages:
+                st.caption(f"Сэмплировано ходов: {tj.get('traces')} (доля {tj.get('sample_rate')})")
+                st.table(
+                    [{"этап": k, **v} for k, v in sorted(stages.items(), key=lambda kv: -kv[1]["mean_ms"])]
+                )
+            else:
+                st.info("Пока нет данных")
 
         if st.button("Завершить сессию"):
             api_post(f"/api/session/{st.session_state.session_id}/complete", {})